@@ -0,0 +1,103 @@
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+
+# Dossiers d'images parcourus par défaut (mêmes que `ocr.py --all`)
+DEFAULT_IMAGE_DIRS = ("images", "images_client", "images_V2")
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".tiff", ".bmp", ".gif", ".webp")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Percentile par rang le plus proche (q entre 0 et 100) ; 0.0 si aucune valeur."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: Iterable[float]) -> Dict[str, float]:
+    """count / mean / p50 / p95 / p99 / max, en secondes arrondies à la µs."""
+    values = list(values)
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 6) if values else 0.0,
+        "p50": round(percentile(values, 50), 6),
+        "p95": round(percentile(values, 95), 6),
+        "p99": round(percentile(values, 99), 6),
+        "max": round(max(values), 6) if values else 0.0,
+    }
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """Pic de mémoire résidente du process et du plus gros process enfant (pool Tesseract)."""
+    # ru_maxrss : kilo-octets sous Linux, octets sous macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1),
+    }
+
+
+def collect_image_files(dirs: Iterable[str], base: Optional[str] = None) -> List[str]:
+    base = base or os.path.dirname(os.path.abspath(__file__))
+    files = []
+    for d in dirs:
+        dpath = d if os.path.isabs(d) else os.path.join(base, d)
+        if os.path.isfile(dpath):
+            files.append(dpath)
+            continue
+        if not os.path.isdir(dpath):
+            continue
+        for entry in sorted(os.listdir(dpath)):
+            if entry.lower().endswith(IMAGE_EXTS):
+                files.append(os.path.join(dpath, entry))
+    return files
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def environment() -> Dict[str, Any]:
+    """Contexte d'exécution enregistré avec les résultats (comparaisons entre machines / commits)."""
+    return {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_json(path: str, payload: Dict[str, Any]):
+    with open(path, "w", encoding="utf8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def read_json(path: str) -> Any:
+    with open(path, encoding="utf8") as f:
+        return json.load(f)
+
+
+def delta(current: float, baseline: float) -> str:
+    """"+12.3%" / "-4.0%" par rapport à la référence ("n/a" si pas de référence)."""
+    if not baseline:
+        return "n/a"
+    return f"{(current - baseline) / baseline * 100:+.1f}%"
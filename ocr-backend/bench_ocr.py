@@ -0,0 +1,344 @@
+"""Benchmark OCR hors ligne : chaque combinaison moteur x parser sur un corpus d'images annotées.
+
+    python bench_ocr.py --engines tesseract,paddle --parsers regex,llm --truth ground_truth.json
+    python bench_ocr.py --compare bench_ocr_results.json --out after.json
+    python bench_ocr.py --preprocess auto,2   # prétraitement Tesseract : échelle auto vs x2 fixe
+    python bench_ocr.py --engines tesseract,paddle --regions   # avec / sans détection des zones de texte
+
+Vérité terrain (JSON) : nom de fichier image -> champs attendus, avec le texte transcrit en
+option pour mesurer l'OCR seul :
+
+    {"kiwi_01.jpg": {"product": "Kiwifruit", "origin": "Nouvelle-zélande", "calibre": "30",
+                     "text": "KIWIFRUIT SUNGOLD ... Lot:265475"}}
+
+Sans `--truth`, les `ground_truth.json` présents dans les dossiers d'images sont fusionnés.
+Chaque moteur tourne dans un process séparé (pic de mémoire propre au moteur, modèles chargés
+à froid) ; le premier appel sert de warm-up et n'entre pas dans les latences.
+Résultats : JSON (latences p50/p95, images/s, pic RSS, précision par champ) comparable avec
+`--compare` entre deux commits ou deux réglages. `--preprocess` fait tourner Tesseract une fois
+par réglage d'échelle (`OCR_SCALE` : "auto" ou un facteur fixe) pour comparer latence et précision ;
+`--regions` ajoute pour Tesseract et Paddle un run avec OCR des seules zones de texte (text_regions).
+"""
+import argparse
+import contextlib
+import difflib
+import importlib.util
+import multiprocessing
+import os
+import sys
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from bench_common import (
+    DEFAULT_IMAGE_DIRS, collect_image_files, delta, environment, peak_rss_mb, read_json, summarize, write_json,
+)
+
+
+ENGINES = ("tesseract", "paddle", "doctr", "mistral")
+PARSERS = ("regex", "llm", "ollama")
+# Moteurs concernés par la détection des zones de texte (text_regions)
+REGION_ENGINES = ("tesseract", "paddle")
+# Les parsers LLM renvoient le schéma de verif : ramené aux noms du parser regex
+FIELD_ALIASES = {"product_name": "product", "lots": "lot", "piece_count": "count"}
+# Clé réservée de la vérité terrain : transcription attendue (similarité du texte OCR)
+TEXT_KEY = "text"
+
+
+def unavailable_reason(engine: Optional[str] = None, parser: Optional[str] = None) -> Optional[str]:
+    """Raison pour laquelle un moteur / parser ne peut pas tourner ici (None si disponible)."""
+    if engine == "paddle" and importlib.util.find_spec("paddleocr") is None:
+        return "paddleocr non installé"
+    if engine == "doctr" and importlib.util.find_spec("doctr_ocr") is None:
+        return "doctr_ocr non installé"
+    if engine == "mistral" and not os.getenv("MISTRAL_API_KEY"):
+        return "MISTRAL_API_KEY non défini"
+    if parser == "llm" and (importlib.util.find_spec("openai") is None or not os.getenv("OPENAI_API_KEY")):
+        return "openai non installé ou OPENAI_API_KEY non défini"
+    if parser == "ollama" and importlib.util.find_spec("ollama_parser") is None:
+        return "ollama_parser non disponible"
+    return None
+
+
+def normaliser(valeur) -> str:
+    """Comparaison tolérante : casse, accents, espaces et ponctuation de bord ignorés."""
+    if valeur is None:
+        return ""
+    texte = unicodedata.normalize("NFKD", str(valeur))
+    texte = "".join(c for c in texte if not unicodedata.combining(c))
+    return " ".join(texte.casefold().split()).strip(" .,;:-")
+
+
+def canonical_fields(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    out = {}
+    for key, value in (parsed or {}).items():
+        out.setdefault(FIELD_ALIASES.get(key, key), value)
+    return out
+
+
+def load_truth(path: Optional[str], image_dirs: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Vérité terrain indexée par nom de fichier (basename)."""
+    if path:
+        return read_json(path)
+    base = os.path.dirname(os.path.abspath(__file__))
+    truth: Dict[str, Dict[str, Any]] = {}
+    for d in image_dirs:
+        candidate = os.path.join(d if os.path.isabs(d) else os.path.join(base, d), "ground_truth.json")
+        if os.path.isfile(candidate):
+            truth.update(read_json(candidate))
+    return truth
+
+
+def score_fields(expected: Dict[str, Any], parsed: Dict[str, Any]) -> Dict[str, Any]:
+    got = canonical_fields(parsed)
+    mismatches = {}
+    fields = [k for k in expected if k != TEXT_KEY]
+    for field in fields:
+        if normaliser(expected[field]) != normaliser(got.get(field)):
+            mismatches[field] = [expected[field], got.get(field)]
+    return {"fields": fields, "correct": len(fields) - len(mismatches), "mismatches": mismatches}
+
+
+def _parse_function(parser: str):
+    if parser == "llm":
+        from llm_parser import parse_with_llm
+
+        return parse_with_llm
+    if parser == "ollama":
+        from ollama_parser import parse_with_ollama
+
+        return parse_with_ollama
+    from parser import parse_ocr_text
+
+    return parse_ocr_text
+
+
+def run_engine(engine: str, parsers: List[str], images: List[str], truth: Dict[str, Dict[str, Any]], verbose: bool = False, scale: Optional[str] = None, regions: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """OCR de tout le corpus avec `engine` puis chaque parser sur les mêmes textes (process enfant).
+
+    `scale` : réglage `OCR_SCALE` du prétraitement Tesseract pour ce run (None = configuration).
+    `regions` : détection des zones de texte activée ou non (None = configuration).
+    """
+    sortie = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with sortie:
+        import ocr
+        import preprocess
+
+        import text_regions
+
+        if scale is not None:
+            preprocess.configure(scale=scale)
+        if regions is not None:
+            text_regions.configure(regions)
+
+        flags = {"use_mistral": engine == "mistral", "use_doctr": engine == "doctr", "use_paddle": engine == "paddle"}
+
+        # Warm-up : chargement du modèle / premier appel, hors statistiques
+        start = time.perf_counter()
+        try:
+            ocr.extract_text(images[0], **flags)
+        except Exception:
+            pass
+        warmup_seconds = time.perf_counter() - start
+
+        texts: Dict[str, str] = {}
+        ocr_seconds: Dict[str, float] = {}
+        errors: Dict[str, str] = {}
+        for path in images:
+            start = time.perf_counter()
+            try:
+                texts[path] = ocr.extract_text(path, **flags)
+            except Exception as e:
+                errors[path] = f"ocr: {e}"
+                continue
+            ocr_seconds[path] = time.perf_counter() - start
+
+        similarites = [
+            difflib.SequenceMatcher(
+                None, normaliser(truth[os.path.basename(p)][TEXT_KEY]), normaliser(txt)
+            ).ratio()
+            for p, txt in texts.items()
+            if TEXT_KEY in truth.get(os.path.basename(p), {})
+        ]
+
+        runs = []
+        for parser in parsers:
+            parse = _parse_function(parser)
+            parse_seconds: Dict[str, float] = {}
+            parse_errors = dict(errors)
+            per_image = []
+            for path, txt in texts.items():
+                start = time.perf_counter()
+                try:
+                    parsed = parse(txt)
+                except Exception as e:
+                    parse_errors[path] = f"parse: {e}"
+                    continue
+                parse_seconds[path] = time.perf_counter() - start
+                expected = truth.get(os.path.basename(path))
+                if expected:
+                    per_image.append({"image": os.path.basename(path), **score_fields(expected, parsed)})
+
+            totals = [ocr_seconds[p] + parse_seconds[p] for p in parse_seconds]
+            runs.append({
+                "engine": engine,
+                "parser": parser,
+                "preprocess": (scale or preprocess.OCR_SCALE) if engine == "tesseract" else None,
+                "regions": text_regions.enabled() if engine in REGION_ENGINES else None,
+                "images": len(images),
+                "errors": len(parse_errors),
+                "error_details": {os.path.basename(p): e for p, e in parse_errors.items()},
+                "warmup_seconds": round(warmup_seconds, 4),
+                "latency": {
+                    "ocr": summarize(ocr_seconds.values()),
+                    "parse": summarize(parse_seconds.values()),
+                    "total": summarize(totals),
+                },
+                "images_per_sec": round(len(totals) / sum(totals), 3) if totals else 0.0,
+                "accuracy": accuracy(per_image),
+                "text_similarity": round(sum(similarites) / len(similarites), 4) if similarites else None,
+                "per_image": per_image,
+            })
+
+    rss = peak_rss_mb()
+    for run in runs:
+        run["peak_rss_mb"] = rss
+    return runs
+
+
+def accuracy(per_image: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Précision globale et par champ (champs annotés correctement extraits / champs annotés)."""
+    # champ -> [annotés, corrects]
+    fields: Dict[str, List[int]] = {}
+    for r in per_image:
+        for field in r["fields"]:
+            counts = fields.setdefault(field, [0, 0])
+            counts[0] += 1
+            counts[1] += field not in r["mismatches"]
+    annotated = sum(a for a, _ in fields.values())
+    correct = sum(c for _, c in fields.values())
+    return {
+        "annotated_images": len(per_image),
+        "overall": round(correct / annotated, 4) if annotated else None,
+        "fields": {field: round(c / a, 4) for field, (a, c) in sorted(fields.items())},
+    }
+
+
+def engine_label(run: Dict[str, Any]) -> str:
+    """"tesseract@auto", "tesseract@2+regions" : le réglage de prétraitement ne concerne que
+    Tesseract, la détection de zones Tesseract et Paddle."""
+    label = run["engine"]
+    if run["engine"] == "tesseract" and run.get("preprocess"):
+        label += f"@{run['preprocess']}"
+    if run.get("regions"):
+        label += "+regions"
+    return label
+
+
+def run_key(run: Dict[str, Any]):
+    return engine_label(run), run["parser"]
+
+
+def print_table(runs: List[Dict[str, Any]], baseline: Optional[Dict[str, Any]] = None):
+    reference = {run_key(r): r for r in (baseline or {}).get("runs", [])}
+    header = f"{'moteur':<24} {'parser':<7} {'img':>4} {'err':>4} {'p50':>8} {'p95':>8} {'img/s':>7} {'RSS Mo':>7} {'précision':>9}"
+    print(header)
+    print("-" * len(header))
+    for run in runs:
+        total = run["latency"]["total"]
+        overall = run["accuracy"]["overall"]
+        print(
+            f"{engine_label(run):<24} {run['parser']:<7} {run['images']:>4} {run['errors']:>4} "
+            f"{total['p50']:>7.3f}s {total['p95']:>7.3f}s {run['images_per_sec']:>7.2f} "
+            f"{run['peak_rss_mb']['self'] + run['peak_rss_mb']['children']:>7.0f} "
+            f"{'-' if overall is None else f'{overall:.1%}':>9}"
+        )
+        base = reference.get(run_key(run))
+        if base:
+            base_overall = base["accuracy"]["overall"]
+            acc = (
+                f"{(overall - base_overall) * 100:+.1f} pts"
+                if overall is not None and base_overall is not None else "n/a"
+            )
+            print(
+                f"{'  vs réf.':<32} {'':>4} {'':>4} {delta(total['p50'], base['latency']['total']['p50']):>8} "
+                f"{delta(total['p95'], base['latency']['total']['p95']):>8} "
+                f"{delta(run['images_per_sec'], base['images_per_sec']):>7} {'':>7} {acc:>9}"
+            )
+
+
+def _liste(valeur: str, autorises) -> List[str]:
+    items = [v.strip() for v in valeur.split(",") if v.strip()]
+    inconnus = [v for v in items if v not in autorises]
+    if inconnus:
+        raise argparse.ArgumentTypeError(f"inconnu(s) : {', '.join(inconnus)} (choix : {', '.join(autorises)})")
+    return items
+
+
+def _echelles(valeur: str) -> List[str]:
+    items = [v.strip().lower() for v in valeur.split(",") if v.strip()]
+    for v in items:
+        if v != "auto":
+            try:
+                float(v)
+            except ValueError:
+                raise argparse.ArgumentTypeError(f"échelle invalide : {v} (auto ou un facteur, ex : 2)")
+    return items
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark OCR : latence, débit, mémoire et précision par moteur x parser")
+    p.add_argument("--images", nargs="+", default=list(DEFAULT_IMAGE_DIRS), help="Dossiers ou fichiers images")
+    p.add_argument("--truth", help="Vérité terrain JSON (défaut : ground_truth.json des dossiers d'images)")
+    p.add_argument("--engines", type=lambda v: _liste(v, ENGINES), default=["tesseract"], help="Ex : tesseract,paddle")
+    p.add_argument("--parsers", type=lambda v: _liste(v, PARSERS), default=["regex"], help="Ex : regex,llm")
+    p.add_argument("--preprocess", type=_echelles, default=[None], help="Réglages OCR_SCALE comparés pour Tesseract, ex : auto,2,1")
+    p.add_argument("--regions", action="store_true", help="Tesseract / Paddle : run supplémentaire avec OCR des seules zones de texte")
+    p.add_argument("--limit", type=int, default=0, help="Nombre max d'images (0 = toutes)")
+    p.add_argument("--out", default="bench_ocr_results.json", help="Fichier de résultats JSON")
+    p.add_argument("--compare", help="Résultats de référence (JSON d'un run précédent)")
+    p.add_argument("--verbose", action="store_true", help="Garde les sorties du pipeline OCR")
+    args = p.parse_args(argv)
+
+    images = collect_image_files(args.images)
+    if args.limit:
+        images = images[:args.limit]
+    if not images:
+        p.error("aucune image trouvée")
+    truth = load_truth(args.truth, args.images)
+
+    parsers = []
+    skipped = []
+    for parser in args.parsers:
+        reason = unavailable_reason(parser=parser)
+        (skipped.append({"parser": parser, "reason": reason}) if reason else parsers.append(parser))
+
+    runs = []
+    # spawn : chaque moteur part d'un process neuf (pic RSS et chargement à froid mesurés)
+    contexte = multiprocessing.get_context("spawn")
+    for engine in args.engines:
+        reason = unavailable_reason(engine=engine)
+        if reason or not parsers:
+            skipped.append({"engine": engine, "reason": reason or "aucun parser disponible"})
+            continue
+        variantes = [False, True] if args.regions and engine in REGION_ENGINES else [None]
+        for scale in args.preprocess if engine == "tesseract" else [None]:
+            for regions in variantes:
+                reglage = f" (OCR_SCALE={scale})" if scale else ""
+                reglage += " (zones de texte)" if regions else ""
+                print(f"[{engine}{reglage}] {len(images)} images, parsers : {', '.join(parsers)}", file=sys.stderr)
+                with ProcessPoolExecutor(max_workers=1, mp_context=contexte) as pool:
+                    runs.extend(pool.submit(run_engine, engine, parsers, images, truth, args.verbose, scale, regions).result())
+
+    results = {"environment": environment(), "corpus": {"images": len(images), "annotated": len(truth)}, "runs": runs, "skipped": skipped}
+    write_json(args.out, results)
+
+    print_table(runs, read_json(args.compare) if args.compare else None)
+    for s in skipped:
+        print(f"ignoré : {s.get('engine') or s.get('parser')} ({s['reason']})")
+    print(f"\nRésultats : {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Microbenchmarks et tests golden du parser regex et des vérifications réglementaires.
+
+    python bench_rules.py                  # chronométrage + comparaison aux sorties golden
+    python bench_rules.py --repeat 20 --out rules.json --compare rules_avant.json
+    python bench_rules.py --update-golden  # après un changement de résultat VOULU
+    python bench_rules.py --record         # ré-enregistre les réponses LLM (OPENAI_API_KEY)
+
+Corpus (benchmarks/fixtures) : `ocr_texts.json` (textes OCR pour `parser.parse_ocr_text`) et
+`labels.json` (étiquettes parsées pour `verif.verif`). Les appels LLM de verif (famille hors
+match local, verdicts traitement) sont rejoués par llm_replay depuis `llm_cassette.jsonl` :
+aucune requête réseau, temps de réponse nul, résultats déterministes. Une requête sans réponse
+enregistrée fait échouer le run (verif la compterait sinon comme NON REGLEMENTAIRE sans rien dire).
+
+La cassette livrée est SYNTHÉTIQUE (stub local déterministe, voir son en-tête), pas un
+enregistrement de l'API : les IDs famille / sous-famille et verdicts rejoués ne sont pas ceux
+du vrai modèle. Le golden de verif prouve donc que le code (parser, index de référence, règles,
+assemblage des erreurs) rend les mêmes sorties pour les mêmes réponses LLM ; il ne dit rien
+de la justesse des réponses du modèle ni des prompts. Pour un golden sur réponses réelles :
+vider la cassette, `--record`, puis `--update-golden`.
+
+Code de sortie 1 si une sortie diffère du golden (benchmarks/golden) : une optimisation du
+parser ou des règles ne doit pas changer les résultats.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Verdicts recalculés à chaque appel : on mesure les règles, pas le cache des verdicts
+os.environ["VERDICT_CACHE_SIZE"] = "0"
+os.environ["VERDICT_CACHE_DB"] = ""
+
+import llm_replay
+from bench_common import delta, environment, read_json, summarize, write_json
+
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+GOLDEN_DIR = os.path.join(BENCH_DIR, "golden")
+LLM_CASSETTE = os.path.join(FIXTURES_DIR, "llm_cassette.jsonl")
+
+
+def run(func: Callable, inputs: List[Any], repeat: int) -> Tuple[List[Any], List[float]]:
+    """Sorties du premier passage + durée de chaque appel sur `repeat` passages."""
+    outputs = None
+    seconds = []
+    for _ in range(repeat):
+        passage = []
+        for value in inputs:
+            start = time.perf_counter()
+            passage.append(func(value))
+            seconds.append(time.perf_counter() - start)
+        if outputs is None:
+            outputs = passage
+    return outputs, seconds
+
+
+def compare_golden(name: str, outputs: List[Any], inputs: List[Any], update: bool, show: int = 5) -> int:
+    """Nombre de sorties différentes du golden (0 si `update` : le golden est réécrit)."""
+    path = os.path.join(GOLDEN_DIR, f"{name}.json")
+    # Aller-retour JSON : tuples et listes comparés comme dans le fichier
+    outputs = json.loads(json.dumps(outputs, ensure_ascii=False))
+    if update or not os.path.exists(path):
+        write_json(path, outputs)
+        print(f"golden {name} : {len(outputs)} sorties écrites dans {os.path.relpath(path)}")
+        return 0
+    golden = read_json(path)
+    if len(golden) != len(outputs):
+        print(f"golden {name} : {len(golden)} sorties attendues, {len(outputs)} obtenues (corpus modifié ? --update-golden)")
+        return max(len(golden), len(outputs))
+    differences = [i for i, (g, o) in enumerate(zip(golden, outputs)) if g != o]
+    for i in differences[:show]:
+        print(f"  [{name} #{i}] entrée : {json.dumps(inputs[i], ensure_ascii=False)[:160]}")
+        print(f"    attendu : {json.dumps(golden[i], ensure_ascii=False)}")
+        print(f"    obtenu  : {json.dumps(outputs[i], ensure_ascii=False)}")
+    return len(differences)
+
+
+def report(name: str, inputs: List[Any], seconds: List[float], repeat: int, differences: int, extra=None) -> Dict[str, Any]:
+    return {
+        "inputs": len(inputs),
+        "repeat": repeat,
+        "per_call": summarize(seconds),
+        "calls_per_sec": round(len(seconds) / sum(seconds), 1) if seconds else 0.0,
+        "golden_differences": differences,
+        **(extra or {}),
+    }
+
+
+def print_results(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    for name in ("parse_ocr_text", "verif"):
+        r = results.get(name)
+        if r is None:
+            continue
+        p = r["per_call"]
+        ligne = (
+            f"{name:<15} {r['inputs']:>4} entrées x{r['repeat']:<3} p50 {p['p50'] * 1e6:>8.1f}µs "
+            f"p95 {p['p95'] * 1e6:>8.1f}µs  {r['calls_per_sec']:>9.1f} appels/s  golden : "
+            f"{'OK' if not r['golden_differences'] else str(r['golden_differences']) + ' diff.'}"
+        )
+        base = (baseline or {}).get(name)
+        if base:
+            ligne += (
+                f"  | vs réf. p50 {delta(p['p50'], base['per_call']['p50'])}"
+                f" p95 {delta(p['p95'], base['per_call']['p95'])}"
+            )
+        print(ligne)
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description="Microbenchmarks + golden de parse_ocr_text et verif")
+    p.add_argument("--only", choices=("parser", "verif"), help="Un seul des deux benchmarks")
+    p.add_argument("--repeat", type=int, default=5, help="Passages sur le corpus (le premier fournit les sorties)")
+    p.add_argument("--update-golden", action="store_true", help="Réécrit les sorties golden")
+    p.add_argument("--record", action="store_true", help="Appelle le vrai LLM pour les requêtes sans réponse enregistrée")
+    p.add_argument("--out", help="Résultats JSON")
+    p.add_argument("--compare", help="Résultats de référence (JSON d'un run précédent)")
+    p.add_argument("--verbose", action="store_true", help="Garde les sorties de verif (prints)")
+    args = p.parse_args(argv)
+
+    results: Dict[str, Any] = {"environment": environment()}
+    echec = False
+    sortie = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+
+    if args.only in (None, "parser"):
+        from parser import parse_ocr_text
+
+        texts = read_json(os.path.join(FIXTURES_DIR, "ocr_texts.json"))
+        outputs, seconds = run(parse_ocr_text, texts, args.repeat)
+        differences = compare_golden("parse_ocr_text", outputs, texts, args.update_golden)
+        results["parse_ocr_text"] = report("parse_ocr_text", texts, seconds, args.repeat, differences)
+        echec |= bool(differences)
+
+    if args.only in (None, "verif"):
+        import verif
+
+        llm = llm_replay.configure(
+            mode="record" if args.record else "replay", cassette=LLM_CASSETTE, miss="error", latency="0", error_rate=0.0,
+        )
+        # Index de référence chargé hors mesure (le serveur le charge au démarrage)
+        verif.get_reference()
+        labels = read_json(os.path.join(FIXTURES_DIR, "labels.json"))
+        with sortie:
+            outputs, seconds = run(verif.verif, labels, args.repeat)
+        differences = compare_golden("verif", outputs, labels, args.update_golden)
+        results["verif"] = report(
+            "verif", labels, seconds, args.repeat, differences,
+            {"llm_responses": len(llm.cassette), "llm_replay_misses": llm.stats["misses"]},
+        )
+        if llm.stats["misses"]:
+            print(f"verif : {llm.stats['misses']} appels LLM sans réponse enregistrée (relancer avec --record)")
+        echec |= bool(differences) or bool(llm.stats["misses"])
+
+    print_results(results, read_json(args.compare) if args.compare else None)
+    if args.out:
+        write_json(args.out, results)
+    return 1 if echec else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,27 +2,12 @@ import json
 import os
 from typing import Dict, Any
 
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    OpenAI = None
+import llm_client
+from llm_client import OPENAI_AVAILABLE
 
 
-def parse_delivery_note_with_llm(text: str, model: str | None = None) -> Dict[str, Any]:
-    """
-    Parse un bon de livraison (BL) à partir du texte OCR.
-
-    Retourne un dict avec :
-      - shipper_name_address
-      - shipper_siret
-      - delivery_note_number
-      - delivery_date
-      - recipient_name_address
-      - recipient_siret
-      - items: liste d’objets { product_name, variety, quantity, unit, lot, origin }
-    """
+def _build_request(text: str, model: str | None = None) -> Dict[str, Any]:
+    """Arguments de l'appel chat.completions pour le parsing d'un BL."""
     if not OPENAI_AVAILABLE:
         raise RuntimeError("openai package not installed; install with `pip install openai`")
 
@@ -73,18 +58,48 @@ JSON :
         }
     ]
 
+    return {
+        "model": model,
+        "messages": messages,
+        "temperature": 0.0,
+        "max_tokens": 800,
+    }
+
+
+def parse_delivery_note_with_llm(text: str, model: str | None = None) -> Dict[str, Any]:
+    """
+    Parse un bon de livraison (BL) à partir du texte OCR.
+
+    Retourne un dict avec :
+      - shipper_name_address
+      - shipper_siret
+      - delivery_note_number
+      - delivery_date
+      - recipient_name_address
+      - recipient_siret
+      - items: liste d’objets { product_name, variety, quantity, unit, lot, origin }
+    """
+    request = _build_request(text, model)
+    try:
+        response = llm_client.chat_completion("parse_delivery_note", **request)
+        content = response.choices[0].message.content or ""
+    except Exception as e:
+        raise RuntimeError(f"LLM call failed: {e}")
+    return _parse_response(content)
+
+
+async def parse_delivery_note_with_llm_async(text: str, model: str | None = None) -> Dict[str, Any]:
+    """Variante asynchrone de `parse_delivery_note_with_llm` (client OpenAI async partagé)."""
+    request = _build_request(text, model)
     try:
-        client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0.0,
-            max_tokens=800,
-        )
+        response = await llm_client.chat_completion_async("parse_delivery_note", **request)
         content = response.choices[0].message.content or ""
     except Exception as e:
         raise RuntimeError(f"LLM call failed: {e}")
+    return _parse_response(content)
+
 
+def _parse_response(content: str) -> Dict[str, Any]:
     # Parsing JSON
     try:
         content = content.strip()
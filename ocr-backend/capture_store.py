@@ -0,0 +1,267 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger("ocr-backend")
+
+# --- Configuration ---
+# Dossier des captures (vide = captures non sauvegardées)
+CAPTURES_DIR = os.getenv("CAPTURES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "captures"))
+# Captures en attente d'écriture ; file pleine = capture ignorée (la requête n'attend jamais le disque)
+CAPTURE_QUEUE_SIZE = int(os.getenv("CAPTURE_QUEUE_SIZE", "256"))
+# Format d'archive : "" = octets reçus tels quels, "webp" ou "jpeg" = ré-encodage (OpenCV)
+CAPTURE_FORMAT = os.getenv("CAPTURE_FORMAT", "").lower()
+CAPTURE_QUALITY = int(os.getenv("CAPTURE_QUALITY", "80"))
+# Plus grand côté en pixels après ré-encodage (0 = taille d'origine)
+CAPTURE_MAX_SIDE = int(os.getenv("CAPTURE_MAX_SIDE", "0"))
+# Rétention : taille totale du dossier (Mo) et âge maximum (jours) ; 0 = sans limite.
+# Les captures les plus anciennes (dernière réception) sont supprimées en premier.
+CAPTURE_MAX_MB = float(os.getenv("CAPTURE_MAX_MB", "0"))
+CAPTURE_MAX_AGE_DAYS = float(os.getenv("CAPTURE_MAX_AGE_DAYS", "0"))
+# Intervalle entre deux passes de rétention (secondes)
+CAPTURE_RETENTION_INTERVAL = float(os.getenv("CAPTURE_RETENTION_INTERVAL", "600"))
+
+_EXTENSIONS = {"webp": ".webp", "jpeg": ".jpg", "jpg": ".jpg"}
+_SIGNATURES = ((b"\xff\xd8\xff", ".jpg"), (b"\x89PNG", ".png"), (b"GIF8", ".gif"), (b"BM", ".bmp"))
+_STOP = object()
+
+
+def extension(img_bytes: bytes, fmt: str = "") -> str:
+    """Extension du fichier archivé : celle du format de ré-encodage, sinon d'après les octets."""
+    if fmt:
+        return _EXTENSIONS[fmt]
+    if img_bytes[:4] == b"RIFF" and img_bytes[8:12] == b"WEBP":
+        return ".webp"
+    for signature, ext in _SIGNATURES:
+        if img_bytes.startswith(signature):
+            return ext
+    if img_bytes[:4] in (b"II*\x00", b"MM\x00*"):
+        return ".tiff"
+    return ".bin"
+
+
+def reencode(img_bytes: bytes, fmt: str, quality: int, max_side: int) -> bytes:
+    """Ré-encode l'image pour l'archive (plus petite) ; les octets reçus si le décodage échoue."""
+    import cv2
+    import numpy as np
+
+    img = cv2.imdecode(np.frombuffer(img_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return img_bytes
+    h, w = img.shape[:2]
+    if max_side and max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        img = cv2.resize(img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    params = [cv2.IMWRITE_WEBP_QUALITY if fmt == "webp" else cv2.IMWRITE_JPEG_QUALITY, quality]
+    ok, encoded = cv2.imencode(_EXTENSIONS[fmt], img, params)
+    return encoded.tobytes() if ok else img_bytes
+
+
+class CaptureStore:
+    """Archive des images reçues, nommées par le hash de leur contenu.
+
+    Une re-photo identique (mêmes octets, ex : renvoi en arrière-plan de l'app) ne crée pas de
+    second fichier, et deux clients ne peuvent plus écraser la capture de l'autre en envoyant le
+    même nom. L'écriture (et le ré-encodage éventuel) se fait dans un thread dédié, alimenté par
+    une file bornée : `put` rend immédiatement le chemin final.
+    """
+
+    def __init__(
+        self,
+        directory: str = CAPTURES_DIR,
+        queue_size: int = CAPTURE_QUEUE_SIZE,
+        fmt: str = CAPTURE_FORMAT,
+        quality: int = CAPTURE_QUALITY,
+        max_side: int = CAPTURE_MAX_SIDE,
+        max_mb: float = CAPTURE_MAX_MB,
+        max_age_days: float = CAPTURE_MAX_AGE_DAYS,
+        retention_interval: float = CAPTURE_RETENTION_INTERVAL,
+    ):
+        if fmt not in ("", *_EXTENSIONS):
+            raise ValueError(f"CAPTURE_FORMAT inconnu : {fmt!r} (webp | jpeg)")
+        self.directory = directory
+        self.fmt = fmt
+        self.quality = quality
+        self.max_side = max_side
+        self.max_mb = max_mb
+        self.max_age_days = max_age_days
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age = max_age_days * 24 * 3600
+        self.retention_interval = retention_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._total_bytes: Optional[int] = None
+        self._last_sweep = 0.0
+        self.counts = {"queued": 0, "written": 0, "duplicates": 0, "dropped": 0, "errors": 0, "evicted": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _compter(self, nom: str, n: int = 1):
+        with self._lock:
+            self.counts[nom] += n
+
+    def _ensure_writer(self):
+        # Thread démarré au premier `put`, dans chaque worker (jamais avant le fork de gunicorn)
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def path_for(self, img_bytes: bytes, digest: Optional[str] = None) -> str:
+        """`digest` : sha256 hexadécimal du contenu s'il est déjà calculé (clé de cache)."""
+        name = (digest or hashlib.sha256(img_bytes).hexdigest()) + extension(img_bytes, self.fmt)
+        return os.path.join(self.directory, name)
+
+    def put(self, img_bytes: bytes, filename: str = "", digest: Optional[str] = None) -> Optional[str]:
+        """Met la capture en file d'écriture ; chemin final, ou None (désactivé / file pleine)."""
+        if not self.enabled or not img_bytes:
+            return None
+        self._ensure_writer()
+        path = self.path_for(img_bytes, digest)
+        try:
+            self._queue.put_nowait((path, img_bytes, filename))
+        except queue.Full:
+            self._compter("dropped")
+            logger.warning("File des captures pleine : %s non sauvegardée", filename or os.path.basename(path))
+            return None
+        self._compter("queued")
+        return path
+
+    def _run(self):
+        while True:
+            timeout = self.retention_interval if self.retention_interval > 0 else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._retention()
+                continue
+            try:
+                if item is _STOP:
+                    return
+                self._write(*item)
+            except Exception as e:
+                self._compter("errors")
+                logger.warning("Impossible de sauvegarder la capture %s: %s", item[2] or item[0], e)
+            finally:
+                self._queue.task_done()
+            if self._retention_due():
+                self._retention()
+
+    def _write(self, path: str, img_bytes: bytes, filename: str):
+        if os.path.exists(path):
+            # Même contenu déjà archivé : on le marque comme reçu maintenant (rétention)
+            os.utime(path)
+            self._compter("duplicates")
+            return
+        data = reencode(img_bytes, self.fmt, self.quality, self.max_side) if self.fmt else img_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        # Écriture atomique : un autre worker peut recevoir la même image au même moment
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.counts["written"] += 1
+            if self._total_bytes is not None:
+                self._total_bytes += len(data)
+        logger.info("Capture sauvegardée: %s (%s)", path, filename or "sans nom")
+
+    def _retention_due(self) -> bool:
+        if not (self.max_bytes or self.max_age):
+            return False
+        if self._total_bytes is None or (self.max_bytes and self._total_bytes > self.max_bytes):
+            return True
+        return self.retention_interval > 0 and time.monotonic() - self._last_sweep >= self.retention_interval
+
+    def _files(self) -> List[Tuple[float, int, str]]:
+        files = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return files
+        for entry in entries:
+            try:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path))
+            except FileNotFoundError:
+                continue
+        return files
+
+    def _retention(self) -> int:
+        """Supprime les captures trop anciennes, puis les plus anciennes au-delà de la taille max."""
+        if not (self.max_bytes or self.max_age):
+            return 0
+        self._last_sweep = time.monotonic()
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        limite_age = time.time() - self.max_age if self.max_age else None
+        evicted = 0
+        for mtime, size, path in files:
+            if not ((limite_age is not None and mtime < limite_age) or (self.max_bytes and total > self.max_bytes)):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Déjà supprimée par la passe d'un autre worker
+                pass
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._total_bytes = total
+            self.counts["evicted"] += evicted
+        if evicted:
+            logger.info("Rétention des captures : %s fichiers supprimés (%.1f Mo restants)", evicted, total / 1e6)
+        return evicted
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Attend l'écriture des captures en file (arrêt du worker, tests) ; False si délai dépassé."""
+        if self._thread is None or self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Écrit ce qui reste en file puis arrête le thread d'écriture."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self.flush(timeout)
+        try:
+            self._queue.put(_STOP, timeout=1)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "directory": self.directory,
+                "format": self.fmt or "original",
+                "pending": self._queue.qsize(),
+                "queue_size": self._queue.maxsize,
+                "max_mb": self.max_mb,
+                "max_age_days": self.max_age_days,
+                "size_mb": round(self._total_bytes / (1024 * 1024), 1) if self._total_bytes is not None else None,
+                **self.counts,
+            }
+
+
+capture_store = CaptureStore()
@@ -0,0 +1,184 @@
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+
+logger = logging.getLogger("ocr-backend")
+
+# --- Configuration ---
+# Moteurs chargés au démarrage (liste séparée par des virgules : paddle, doctr, tesseract)
+OCR_PRELOAD_ENGINES = os.getenv("OCR_PRELOAD_ENGINES", "tesseract")
+# Nombre d'instances par moteur (une instance n'est utilisée que par une requête à la fois)
+OCR_ENGINE_POOL_SIZE = int(os.getenv("OCR_ENGINE_POOL_SIZE", "2"))
+# Temps max d'attente d'une instance libre avant erreur (secondes)
+OCR_ENGINE_CHECKOUT_TIMEOUT = float(os.getenv("OCR_ENGINE_CHECKOUT_TIMEOUT", "60"))
+
+# Moteurs chargeables dans le master gunicorn avant le fork (ni threads ni état d'allocateur
+# natif). PaddleOCR / docTR démarrent des threads d'inférence qui ne survivent pas au fork :
+# ils sont chargés dans chaque worker, après le fork.
+FORK_SAFE_ENGINES = {"tesseract"}
+
+
+class EngineUnavailable(RuntimeError):
+    pass
+
+
+class EnginePool:
+    """Pool de N instances d'un moteur OCR, empruntées le temps d'une requête.
+
+    Les instances PaddleOCR ne sont pas thread-safe : chaque requête travaille sur sa
+    propre instance, et le modèle n'est chargé qu'une fois par instance.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], object], size: int):
+        self.name = name
+        self.factory = factory
+        self.size = size
+        self.load_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self._instances: "queue.Queue" = queue.Queue()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self):
+        with self._load_lock:
+            if self._loaded:
+                return
+            start = time.perf_counter()
+            try:
+                for _ in range(self.size):
+                    self._instances.put(self.factory())
+            except Exception as e:
+                self.error = str(e)
+                raise EngineUnavailable(f"{self.name}: {e}") from e
+            self.load_seconds = time.perf_counter() - start
+            self.error = None
+            self._loaded = True
+            logger.info("Moteur %s chargé (%s instance(s), %.1fs)", self.name, self.size, self.load_seconds)
+
+    @contextmanager
+    def checkout(self, timeout: float = OCR_ENGINE_CHECKOUT_TIMEOUT):
+        if not self._loaded:
+            # Moteur non préchargé : chargement à la première utilisation
+            self.load()
+        try:
+            instance = self._instances.get(timeout=timeout)
+        except queue.Empty:
+            raise EngineUnavailable(f"{self.name}: aucune instance libre après {timeout}s")
+        try:
+            yield instance
+        finally:
+            self._instances.put(instance)
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "loaded": self._loaded,
+            "size": self.size,
+            "available": self._instances.qsize(),
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
+
+
+# --- Fabriques des moteurs (imports lourds faits ici, pas à l'import du module) ---
+def _create_paddle():
+    from paddleocr import PaddleOCR
+
+    # lang='fr' is preferable for French labels; fallback to default if not available
+    try:
+        return PaddleOCR(use_angle_cls=True, lang='fr')
+    except Exception:
+        return PaddleOCR(use_angle_cls=True)
+
+
+def _create_doctr():
+    # Le module doctr_ocr charge son modèle à l'import et l'utilise via ses fonctions
+    import doctr_ocr
+
+    return doctr_ocr
+
+
+def _create_tesseract():
+    # Tesseract tourne en sous-processus (pas d'instance à emprunter) : le "chargement"
+    # vérifie seulement le binaire et les données 'fra', pour la readiness
+    import pytesseract
+
+    langs = pytesseract.get_languages(config="")
+    if "fra" not in langs:
+        raise RuntimeError(f"traineddata 'fra' absent (langues disponibles : {langs})")
+    return pytesseract
+
+
+_FACTORIES: Dict[str, Callable[[], object]] = {
+    "paddle": _create_paddle,
+    "doctr": _create_doctr,
+    "tesseract": _create_tesseract,
+}
+# docTR : un seul modèle (celui du module), emprunté par une requête à la fois
+_SINGLE_INSTANCE = {"doctr", "tesseract"}
+
+_pools: Dict[str, EnginePool] = {}
+_pools_lock = threading.Lock()
+_preload_done = False
+
+
+def get_pool(name: str) -> EnginePool:
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            if name not in _FACTORIES:
+                raise EngineUnavailable(f"Moteur inconnu : {name}")
+            size = 1 if name in _SINGLE_INSTANCE else OCR_ENGINE_POOL_SIZE
+            pool = _pools[name] = EnginePool(name, _FACTORIES[name], size)
+        return pool
+
+
+def checkout(name: str, timeout: float = OCR_ENGINE_CHECKOUT_TIMEOUT):
+    """`with engines.checkout("paddle") as ocr: ...`"""
+    return get_pool(name).checkout(timeout)
+
+
+def configured_engines() -> List[str]:
+    return [n.strip() for n in OCR_PRELOAD_ENGINES.split(",") if n.strip()]
+
+
+def preload(names: Optional[List[str]] = None, before_fork: bool = False):
+    """Charge les moteurs configurés.
+
+    `before_fork` (master gunicorn --preload) : seulement les moteurs de FORK_SAFE_ENGINES ;
+    le préchargement n'est alors pas terminé et chaque worker charge les autres au démarrage.
+    """
+    global _preload_done
+    for name in names if names is not None else configured_engines():
+        if before_fork and name not in FORK_SAFE_ENGINES:
+            logger.info("Moteur %s chargé dans les workers (pas avant le fork)", name)
+            continue
+        try:
+            get_pool(name).load()
+        except EngineUnavailable as e:
+            logger.error("Préchargement impossible : %s", e)
+    if not before_fork:
+        _preload_done = True
+
+
+def preload_done() -> bool:
+    return _preload_done
+
+
+def is_ready() -> bool:
+    return _preload_done and all(get_pool(n).loaded for n in configured_engines())
+
+
+def status() -> Dict[str, object]:
+    return {
+        "ready": is_ready(),
+        "engines": {name: get_pool(name).status() for name in configured_engines()},
+    }
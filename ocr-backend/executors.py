@@ -0,0 +1,69 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+# --- Configuration des pools ---
+# OCR : CPU-bound (Tesseract, PaddleOCR, docTR) -> dimensionné sur le nombre de cœurs
+# LLM : network-bound (OpenAI, Mistral) -> beaucoup d'attente réseau, pool plus large
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", str(os.cpu_count() or 2)))
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "16"))
+# Appels Mistral OCR faits avec le client asynchrone (aucun thread occupé)
+MISTRAL_MAX_CONCURRENCY = int(os.getenv("MISTRAL_MAX_CONCURRENCY", "8"))
+# Contrôles réglementaires d'une étiquette qui attendent un appel LLM (verif.executer_controles) :
+# pool séparé, les appels viennent eux-mêmes d'un thread du pool LLM
+VERIF_CHECKS_MAX_WORKERS = int(os.getenv("VERIF_CHECKS_MAX_WORKERS", "32"))
+# OCR des zones de texte d'une image (text_regions) : pool séparé, les appels viennent
+# eux-mêmes d'un thread du pool OCR
+OCR_REGION_MAX_WORKERS = int(os.getenv("OCR_REGION_MAX_WORKERS", str(os.cpu_count() or 2)))
+
+_ocr_executor = ThreadPoolExecutor(max_workers=OCR_MAX_WORKERS, thread_name_prefix="ocr")
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="llm")
+_checks_executor = ThreadPoolExecutor(max_workers=VERIF_CHECKS_MAX_WORKERS, thread_name_prefix="verif")
+_regions_executor = ThreadPoolExecutor(max_workers=OCR_REGION_MAX_WORKERS, thread_name_prefix="ocr-region")
+_mistral_semaphore = asyncio.Semaphore(MISTRAL_MAX_CONCURRENCY)
+
+
+async def _run_in(executor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Contexte de la requête (mesures par étape, span) transmis au thread du pool
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(ctx.run, func, *args, **kwargs))
+
+
+async def run_ocr(func, *args, **kwargs):
+    """Exécute un appel CPU-bound (moteur OCR local) dans le pool OCR."""
+    return await _run_in(_ocr_executor, func, *args, **kwargs)
+
+
+async def run_llm(func, *args, **kwargs):
+    """Exécute un appel network-bound (OpenAI, Mistral) dans le pool LLM.
+
+    Les deux pools sont indépendants : un LLM lent sature au pire le pool LLM,
+    jamais la capacité OCR (ni la boucle asyncio qui sert /health).
+    """
+    return await _run_in(_llm_executor, func, *args, **kwargs)
+
+
+def submit_check(func, *args, **kwargs) -> Future:
+    """Soumet un contrôle de vérification (code synchrone) au pool dédié."""
+    return _checks_executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+def submit_region(func, *args, **kwargs) -> Future:
+    """Soumet l'OCR d'une zone de texte au pool dédié."""
+    return _regions_executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+def mistral_slot():
+    """Limite le nombre d'appels Mistral asynchrones simultanés (`async with mistral_slot(): ...`)."""
+    return _mistral_semaphore
+
+
+def shutdown():
+    _ocr_executor.shutdown(wait=False, cancel_futures=True)
+    _llm_executor.shutdown(wait=False, cancel_futures=True)
+    _checks_executor.shutdown(wait=False, cancel_futures=True)
+    _regions_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,166 @@
+import math
+import os
+import re
+import threading
+import unicodedata
+import weakref
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+# --- Configuration ---
+# Score (0-1) à partir duquel la famille est résolue localement, sans appel LLM
+FAMILLE_MATCH_THRESHOLD = float(os.getenv("FAMILLE_MATCH_THRESHOLD", "0.9"))
+# Écart minimal avec le meilleur candidat concurrent pour considérer le match sûr
+FAMILLE_MATCH_MARGIN = float(os.getenv("FAMILLE_MATCH_MARGIN", "0.05"))
+# Nombre de combinaisons proposées au LLM quand le match local n'est pas sûr
+FAMILLE_SHORTLIST_SIZE = int(os.getenv("FAMILLE_SHORTLIST_SIZE", "30"))
+
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def _singulier(token: str) -> str:
+    # Pluriels français courants : pommes -> pomme, choux -> chou, pruneaux -> pruneau
+    if len(token) > 3 and token[-1] in "sx" and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def normaliser(texte) -> str:
+    """Minuscules, sans accents ni ponctuation, mots au singulier."""
+    if texte is None:
+        return ""
+    texte = unicodedata.normalize("NFKD", str(texte))
+    texte = "".join(c for c in texte if not unicodedata.combining(c)).lower()
+    return " ".join(_singulier(t) for t in _NON_ALNUM_RE.sub(" ", texte).split())
+
+
+def _trigrammes(texte: str) -> Counter:
+    grams = Counter()
+    for token in texte.split():
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            grams[padded[i:i + 3]] += 1
+    return grams
+
+
+class _TfidfIndex:
+    """Vecteurs TF-IDF de trigrammes de caractères + index inversé (cosinus)."""
+
+    def __init__(self, documents: List[str]):
+        comptes = [_trigrammes(doc) for doc in documents]
+        df = Counter(g for c in comptes for g in c)
+        n = len(documents)
+        self.idf = {g: math.log((1 + n) / (1 + d)) + 1 for g, d in df.items()}
+        self.postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for i, c in enumerate(comptes):
+            for g, w in self._vecteur(c).items():
+                self.postings[g].append((i, w))
+
+    def _vecteur(self, comptes: Counter) -> Dict[str, float]:
+        vec = {g: tf * self.idf.get(g, 0.0) for g, tf in comptes.items()}
+        norme = math.sqrt(sum(w * w for w in vec.values()))
+        return {g: w / norme for g, w in vec.items() if w} if norme else {}
+
+    def scores(self, texte: str) -> Dict[int, float]:
+        scores: Dict[int, float] = defaultdict(float)
+        for g, wq in self._vecteur(_trigrammes(texte)).items():
+            for i, wd in self.postings.get(g, ()):
+                scores[i] += wq * wd
+        return scores
+
+
+@dataclass(frozen=True)
+class MatchFamille:
+    famille: Optional[str]
+    sous_famille: Optional[str]
+    score: float
+    # True : résolu localement ; sinon `shortlist` (ID : "FAMILLE | SOUS-FAMILLE") pour le LLM
+    confiant: bool
+    shortlist: Dict[int, str]
+
+
+class FamilleMatcher:
+    """Résout FAMILLE / SOUS-FAMILLE d'un produit sans LLM quand le match lexical est net.
+
+    Score d'un candidat = max(moyenne des cosinus nom/famille et variété/sous-famille,
+    cosinus du libellé complet), ce qui couvre aussi les étiquettes où la variété est
+    répétée dans le nom du produit ("Pomme Gala" / "Gala").
+    """
+
+    def __init__(self, familles: Dict[int, str]):
+        self.familles = familles
+        self._ids: List[int] = []
+        self._cles: List[Tuple[str, str]] = []
+        for id_, libelle in familles.items():
+            famille, _, sous_famille = libelle.partition("|")
+            self._ids.append(id_)
+            self._cles.append((normaliser(famille), normaliser(sous_famille)))
+
+        # Peu de familles distinctes : index dédié, puis report sur les combinaisons
+        noms_famille = sorted({f for f, _ in self._cles})
+        position = {f: i for i, f in enumerate(noms_famille)}
+        self._famille_de = [position[f] for f, _ in self._cles]
+        self._index_famille = _TfidfIndex(noms_famille)
+        self._index_sous_famille = _TfidfIndex([sf for _, sf in self._cles])
+        self._index_libelle = _TfidfIndex([f"{f} {sf}" for f, sf in self._cles])
+        self._exact: Dict[Tuple[str, str], int] = {}
+        for i, cle in enumerate(self._cles):
+            self._exact.setdefault(cle, i)
+
+    def _scores(self, nom: str, variete: str) -> Dict[int, float]:
+        par_famille = self._index_famille.scores(nom)
+        par_libelle = self._index_libelle.scores(f"{nom} {variete}")
+        scores = dict(par_libelle)
+        for i, s in self._index_sous_famille.scores(variete).items():
+            champ_a_champ = (par_famille.get(self._famille_de[i], 0.0) + s) / 2
+            if champ_a_champ > scores.get(i, 0.0):
+                scores[i] = champ_a_champ
+        return scores
+
+    def resoudre(self, product_name, variety) -> MatchFamille:
+        nom, variete = normaliser(product_name), normaliser(variety)
+
+        exact = self._exact.get((nom, variete))
+        if exact is not None:
+            return self._resultat(exact, 1.0, True, {})
+
+        classement = sorted(self._scores(nom, variete).items(), key=lambda kv: kv[1], reverse=True)
+        if not classement:
+            return MatchFamille(None, None, 0.0, False, {})
+
+        meilleur, score = classement[0]
+        # Concurrent = meilleur candidat d'une autre combinaison (les doublons d'espaces
+        # du classeur donnent plusieurs IDs pour la même combinaison)
+        concurrent = next((s for i, s in classement[1:] if self._cles[i] != self._cles[meilleur]), 0.0)
+        if score >= FAMILLE_MATCH_THRESHOLD and score - concurrent >= FAMILLE_MATCH_MARGIN:
+            return self._resultat(meilleur, score, True, {})
+
+        shortlist = {
+            self._ids[i]: self.familles[self._ids[i]]
+            for i, _ in classement[:FAMILLE_SHORTLIST_SIZE]
+        }
+        return MatchFamille(None, None, score, False, shortlist)
+
+    def _resultat(self, i, score, confiant, shortlist) -> MatchFamille:
+        famille, _, sous_famille = self.familles[self._ids[i]].partition("|")
+        return MatchFamille(famille.strip(), sous_famille.strip(), score, confiant, shortlist)
+
+
+# Un matcher par version de l'index de référence : pendant un rechargement, les vérifications
+# en cours (ancienne version) et les nouvelles ont chacune le leur ; libéré avec l'index
+_lock = threading.Lock()
+_matchers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def matcher_for(reference) -> FamilleMatcher:
+    with _lock:
+        matcher = _matchers.get(reference)
+    if matcher is None:
+        # Construit hors du verrou : les lookups sur l'autre version ne sont pas bloqués
+        matcher = FamilleMatcher(reference.familles)
+        with _lock:
+            matcher = _matchers.setdefault(reference, matcher)
+    return matcher
@@ -0,0 +1,28 @@
+import glob
+import os
+
+import engines
+import metrics
+
+
+# Workers uvicorn gérés par gunicorn : l'app (et les moteurs OCR fork-safe, voir
+# engines.FORK_SAFE_ENGINES) sont chargés une seule fois dans le master puis partagés en
+# copy-on-write par les workers après le fork ; PaddleOCR / docTR sont chargés par chaque worker.
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+
+def on_starting(server):
+    # Métriques multi-process : on repart de zéro à chaque démarrage du master
+    if metrics.PROMETHEUS_MULTIPROC_DIR:
+        os.makedirs(metrics.PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics.PROMETHEUS_MULTIPROC_DIR, "*.db")):
+            os.remove(path)
+    engines.preload(before_fork=True)
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid)
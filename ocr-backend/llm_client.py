@@ -0,0 +1,211 @@
+import contextvars
+import importlib.util
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import llm_replay
+import metrics
+
+# Le SDK openai (~1s d'import) n'est importé qu'à la création du premier client
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
+
+
+logger = logging.getLogger("ocr-backend")
+
+# --- Configuration ---
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))  # secondes, par tentative
+# Le SDK OpenAI réessaie les 408/409/429/5xx avec backoff exponentiel (+ Retry-After)
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+
+
+_lock = threading.Lock()
+# Appels LLM en échec (ou réponses inexploitables) du traitement en cours : la liste est
+# partagée par les contextes copiés vers les pools (contrôles de vérification)
+_degraded: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar("llm_degraded", default=None)
+_client = None
+_async_client = None
+_mistral_client = None
+
+
+def _limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+    )
+
+
+def _api_key() -> str:
+    if not OPENAI_AVAILABLE:
+        raise RuntimeError('openai package not installed; install with `pip install openai`')
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        raise RuntimeError('OPENAI_API_KEY not set in environment')
+    return api_key
+
+
+def get_client() -> "OpenAI":
+    """Client OpenAI partagé par le process : connexions HTTP gardées ouvertes (keep-alive),
+    donc un seul handshake TLS au lieu d'un par appel."""
+    global _client
+    with _lock:
+        if _client is None:
+            import httpx
+            from openai import OpenAI
+
+            _client = OpenAI(
+                api_key=_api_key(),
+                timeout=OPENAI_TIMEOUT,
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=httpx.Client(limits=_limits(), timeout=OPENAI_TIMEOUT),
+            )
+        return _client
+
+
+def get_async_client() -> "AsyncOpenAI":
+    """Variante asynchrone (à utiliser depuis la boucle asyncio du serveur)."""
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            _async_client = AsyncOpenAI(
+                api_key=_api_key(),
+                timeout=OPENAI_TIMEOUT,
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=httpx.AsyncClient(limits=_limits(), timeout=OPENAI_TIMEOUT),
+            )
+        return _async_client
+
+
+def get_mistral_client():
+    """Client Mistral partagé (même principe : une session HTTP réutilisée)."""
+    global _mistral_client
+    with _lock:
+        if _mistral_client is None:
+            from mistralai import Mistral
+
+            _mistral_client = Mistral(
+                api_key=os.environ["MISTRAL_API_KEY"],
+                timeout_ms=int(OPENAI_TIMEOUT * 1000),
+            )
+        return _mistral_client
+
+
+# --- Mesures par appel ---
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def _record(operation: str, model: str, seconds: float, response=None, error: bool = False):
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    with _stats_lock:
+        s = _stats.setdefault(operation, {
+            "calls": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0,
+        })
+        s["calls"] += 1
+        s["errors"] += int(error)
+        s["total_seconds"] += seconds
+        s["max_seconds"] = max(s["max_seconds"], seconds)
+        s["prompt_tokens"] += prompt_tokens
+        s["completion_tokens"] += completion_tokens
+    metrics.observe_llm(operation, model, seconds, prompt_tokens, completion_tokens, error)
+    logger.info(
+        "LLM %s (%s): %.2fs tokens=%s/%s%s",
+        operation, model, seconds, prompt_tokens, completion_tokens, " ERREUR" if error else "",
+    )
+
+
+@contextmanager
+def track_degradation():
+    """`with track_degradation() as failures:` : opérations LLM en échec pendant le bloc.
+
+    Un résultat obtenu avec un repli (parser regex, verdict par défaut) ne doit pas être mis
+    en cache comme la réponse de l'étiquette.
+    """
+    failures: List[str] = []
+    token = _degraded.set(failures)
+    try:
+        yield failures
+    finally:
+        _degraded.reset(token)
+
+
+def note_degraded(operation: str):
+    """Signale un appel LLM en échec ou une réponse inexploitable (sans effet hors suivi)."""
+    failures = _degraded.get()
+    if failures is not None:
+        failures.append(operation)
+
+
+def chat_completion(operation: str, **kwargs):
+    """`client.chat.completions.create(**kwargs)` sur le client partagé, chronométré.
+
+    `operation` identifie l'appelant (ex : "verif_famille") dans les statistiques.
+    Avec LLM_REPLAY_MODE, l'appel passe par la cassette (enregistrement ou rejeu).
+    """
+    replayer = llm_replay.active()
+    start = time.perf_counter()
+    try:
+        if replayer is not None:
+            response = replayer.call(operation, kwargs, lambda: get_client().chat.completions.create(**kwargs))
+        else:
+            response = get_client().chat.completions.create(**kwargs)
+    except Exception:
+        _record(operation, kwargs.get("model"), time.perf_counter() - start, error=True)
+        note_degraded(operation)
+        raise
+    _record(operation, kwargs.get("model"), time.perf_counter() - start, response)
+    return response
+
+
+async def chat_completion_async(operation: str, **kwargs):
+    replayer = llm_replay.active()
+    start = time.perf_counter()
+    try:
+        if replayer is not None:
+            response = await replayer.call_async(
+                operation, kwargs, lambda: get_async_client().chat.completions.create(**kwargs)
+            )
+        else:
+            response = await get_async_client().chat.completions.create(**kwargs)
+    except Exception:
+        _record(operation, kwargs.get("model"), time.perf_counter() - start, error=True)
+        note_degraded(operation)
+        raise
+    _record(operation, kwargs.get("model"), time.perf_counter() - start, response)
+    return response
+
+
+def mistral_ocr(**kwargs):
+    """`client.ocr.process(**kwargs)` sur le client Mistral partagé (rejouable comme les appels LLM)."""
+    replayer = llm_replay.active()
+    if replayer is not None:
+        return replayer.call("mistral_ocr", kwargs, lambda: get_mistral_client().ocr.process(**kwargs))
+    return get_mistral_client().ocr.process(**kwargs)
+
+
+async def mistral_ocr_async(**kwargs):
+    replayer = llm_replay.active()
+    if replayer is not None:
+        return await replayer.call_async("mistral_ocr", kwargs, lambda: get_mistral_client().ocr.process_async(**kwargs))
+    return await get_mistral_client().ocr.process_async(**kwargs)
+
+
+def stats() -> Dict[str, Any]:
+    """Latence et tokens cumulés par opération (depuis le démarrage du process)."""
+    with _stats_lock:
+        out = {}
+        for operation, s in _stats.items():
+            out[operation] = dict(s, avg_seconds=s["total_seconds"] / s["calls"] if s["calls"] else 0.0)
+        return out
@@ -2,12 +2,8 @@ import os
 import json
 from typing import Dict, Optional
 
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    OpenAI = None
+import llm_client
+from llm_client import OPENAI_AVAILABLE
 
 
 def parse_with_llm(text: str, model: str = None) -> Dict[str, Optional[str]]:
@@ -64,8 +60,8 @@ def parse_with_llm(text: str, model: str = None) -> Dict[str, Optional[str]]:
     prompt = [{"type": "text", "text": prompt_text}]
 
     try:
-        client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
+        response = llm_client.chat_completion(
+            "parse_label",
             model=model,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.0,
@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger("ocr-backend")
+
+# --- Configuration ---
+# "" = appels réels ; "record" = réponses déjà dans la cassette rejouées, les autres appelées
+# réellement puis enregistrées ; "replay" = réponses de la cassette, aucun appel réseau
+LLM_REPLAY_MODE = os.getenv("LLM_REPLAY_MODE", "")
+# Cassette : une réponse JSON par ligne (ajouts concurrents sûrs entre workers gunicorn)
+LLM_CASSETTE = os.getenv("LLM_CASSETTE", "Data/llm_cassette.jsonl")
+# Requête absente de la cassette en replay : "error" (exception) ou "fallback" (une réponse
+# enregistrée de la même opération, choisie de façon stable : tests de charge sur d'autres images)
+LLM_REPLAY_MISS = os.getenv("LLM_REPLAY_MISS", "error")
+# Latence simulée en replay (secondes) : "0.8", plage "0.5:2" (uniforme), par opération
+# "parse_label=1:3,mistral_ocr=2,*=0.5"
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "0")
+# Proportion d'appels rejoués en erreur (0-1), après la latence simulée
+LLM_REPLAY_ERROR_RATE = float(os.getenv("LLM_REPLAY_ERROR_RATE", "0"))
+# Graine du tirage latence / erreurs (vide = non déterministe)
+LLM_REPLAY_SEED = os.getenv("LLM_REPLAY_SEED", "")
+
+
+class ReplayMiss(RuntimeError):
+    """Requête sans réponse enregistrée (mode replay, LLM_REPLAY_MISS=error)."""
+
+
+class InjectedError(RuntimeError):
+    """Erreur simulée (LLM_REPLAY_ERROR_RATE)."""
+
+
+def parse_latency(spec: str) -> Dict[str, Tuple[float, float]]:
+    """"parse_label=1:3,*=0.5" -> {"parse_label": (1.0, 3.0), "*": (0.5, 0.5)}."""
+    plages = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        operation, _, valeur = part.rpartition("=")
+        bas, _, haut = valeur.partition(":")
+        plages[operation or "*"] = (float(bas), float(haut or bas))
+    return plages
+
+
+def request_key(operation: str, kwargs: Dict[str, Any]) -> str:
+    """Hash de l'opération et de tous les paramètres de l'appel (modèle, messages, image...)."""
+    payload = json.dumps({"operation": operation, **kwargs}, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _serialize(response) -> Dict[str, Any]:
+    """Ce que les appelants lisent d'une réponse : texte (chat) ou pages markdown (OCR)."""
+    pages = getattr(response, "pages", None)
+    if pages is not None:
+        return {"pages": [page.markdown for page in pages]}
+    usage = getattr(response, "usage", None)
+    return {
+        "content": response.choices[0].message.content,
+        "usage": {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        },
+    }
+
+
+def _deserialize(data: Dict[str, Any]):
+    if "pages" in data:
+        return SimpleNamespace(pages=[SimpleNamespace(markdown=markdown) for markdown in data["pages"]])
+    message = SimpleNamespace(role="assistant", content=data["content"])
+    return SimpleNamespace(
+        choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")],
+        usage=SimpleNamespace(**data.get("usage", {})),
+    )
+
+
+class Cassette:
+    """Réponses enregistrées, indexées par `request_key` (fichier JSONL en ajout seul)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._par_operation: Dict[str, List[str]] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf8") as f:
+                for line in f:
+                    # Lignes "#" : commentaires (provenance de la cassette)
+                    if line.strip() and not line.startswith("#"):
+                        self._add(json.loads(line))
+
+    def _add(self, entry: Dict[str, Any]):
+        if entry["key"] not in self._entries:
+            self._par_operation.setdefault(entry["operation"], []).append(entry["key"])
+        self._entries[entry["key"]] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry["response"] if entry else None
+
+    def fallback(self, operation: str, key: str) -> Optional[Dict[str, Any]]:
+        """Réponse enregistrée de la même opération, toujours la même pour une clé donnée."""
+        with self._lock:
+            keys = self._par_operation.get(operation)
+            if not keys:
+                return None
+            return self._entries[keys[int(key, 16) % len(keys)]]["response"]
+
+    def put(self, key: str, operation: str, response: Dict[str, Any]):
+        entry = {"key": key, "operation": operation, "recorded_at": time.time(), "response": response}
+        with self._lock:
+            self._add(entry)
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class Replayer:
+    def __init__(self, mode: str = LLM_REPLAY_MODE, cassette: str = LLM_CASSETTE, miss: str = LLM_REPLAY_MISS,
+                 latency: str = LLM_REPLAY_LATENCY, error_rate: float = LLM_REPLAY_ERROR_RATE,
+                 seed: str = LLM_REPLAY_SEED):
+        if mode not in ("", "record", "replay"):
+            raise ValueError(f"LLM_REPLAY_MODE inconnu : {mode!r} (record | replay)")
+        self.mode = mode
+        self.cassette = Cassette(cassette) if mode else None
+        self.miss = miss
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self._random = random.Random(seed or None)
+        self._random_lock = threading.Lock()
+        self.stats = {"replayed": 0, "recorded": 0, "fallbacks": 0, "misses": 0, "injected_errors": 0}
+        self._stats_lock = threading.Lock()
+        if mode:
+            logger.info("LLM %s : cassette %s (%s réponses)", mode, cassette, len(self.cassette))
+
+    def _compter(self, nom: str):
+        with self._stats_lock:
+            self.stats[nom] += 1
+
+    def _tirage(self, operation: str) -> Tuple[float, bool]:
+        bas, haut = self.latency.get(operation) or self.latency.get("*") or (0.0, 0.0)
+        with self._random_lock:
+            return self._random.uniform(bas, haut), self._random.random() < self.error_rate
+
+    def _lookup(self, operation: str, key: str) -> Dict[str, Any]:
+        data = self.cassette.get(key)
+        if data is None and self.miss == "fallback":
+            data = self.cassette.fallback(operation, key)
+            if data is not None:
+                self._compter("fallbacks")
+        if data is None:
+            self._compter("misses")
+            raise ReplayMiss(f"{operation} : aucune réponse enregistrée ({key[:12]}) dans {self.cassette.path}")
+        self._compter("replayed")
+        return data
+
+    def _injecter(self, operation: str, erreur: bool):
+        if erreur:
+            self._compter("injected_errors")
+            raise InjectedError(f"{operation} : erreur simulée (LLM_REPLAY_ERROR_RATE)")
+
+    def call(self, operation: str, kwargs: Dict[str, Any], real: Callable[[], Any]):
+        """Appel synchrone : `real()` fait le vrai appel (mode record)."""
+        key = request_key(operation, kwargs)
+        if self.mode == "record" and self.cassette.get(key) is None:
+            response = real()
+            self.cassette.put(key, operation, _serialize(response))
+            self._compter("recorded")
+            return response
+        attente, erreur = self._tirage(operation)
+        if attente:
+            time.sleep(attente)
+        self._injecter(operation, erreur)
+        return _deserialize(self._lookup(operation, key))
+
+    async def call_async(self, operation: str, kwargs: Dict[str, Any], real: Callable[[], Any]):
+        """Variante asynchrone : `real()` renvoie la coroutine du vrai appel."""
+        key = request_key(operation, kwargs)
+        if self.mode == "record" and self.cassette.get(key) is None:
+            response = await real()
+            self.cassette.put(key, operation, _serialize(response))
+            self._compter("recorded")
+            return response
+        attente, erreur = self._tirage(operation)
+        if attente:
+            await asyncio.sleep(attente)
+        self._injecter(operation, erreur)
+        return _deserialize(self._lookup(operation, key))
+
+
+_replayer: Optional[Replayer] = Replayer() if LLM_REPLAY_MODE else None
+
+
+def active() -> Optional[Replayer]:
+    """Replayer en service (None : appels réels, chemin habituel)."""
+    return _replayer
+
+
+def configure(**options) -> Optional[Replayer]:
+    """Remplace le replayer (benchmarks, tests de charge) ; `mode=""` revient aux appels réels."""
+    global _replayer
+    replayer = Replayer(**options)
+    _replayer = replayer if replayer.mode else None
+    return _replayer
@@ -0,0 +1,327 @@
+"""Test de charge local : sessions de scan réalistes rejouées par des appareils simulés.
+
+    python loadtest.py --stub --ramp 1,4,8,16,32 --stage-seconds 30
+    python loadtest.py --url http://localhost:8000 --ramp 2,4,8 --engine tesseract --images images
+
+Un appareil enchaîne des sessions : connexion (/auth/login), un bon de livraison (/scan-bl),
+puis des rafales d'étiquettes (/scan) envoyées en parallèle comme le fait l'app (uploads en
+fond), séparées d'un temps de réflexion. La charge monte par paliers (`--ramp` : nombre
+d'appareils) ; pour chaque palier : débit, latences p50/p95/p99 et taux d'erreur par route.
+
+`--stub` démarre l'API localement avec OCR Mistral et LLM rejoués par llm_replay (latence
+`--ocr-latency` / `--llm-latency`, erreurs `--error-rate`) : aucun réseau, seul le serveur
+(boucle asyncio, pools OCR / LLM / vérifications, workers gunicorn) est mesuré. Avec
+`--engine tesseract`, l'OCR est réel (CPU) et seuls les appels LLM sont simulés.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from bench_common import collect_image_files, delta, environment, read_json, summarize, write_json
+
+
+# Réponses types servies en mode --stub (LLM_REPLAY_MISS=fallback : une par opération suffit)
+STUB_LABEL_TEXT = (
+    "KIWIFRUIT SUNGOLD EMB:84035 Variété: Zesy002 Calibre: 30 CAT I Nombre: 4 Pcs "
+    "Origine: Nouvelle-Zélande Lot:265475"
+)
+STUB_RESPONSES = {
+    "mistral_ocr": {"pages": [STUB_LABEL_TEXT]},
+    "parse_label": {"content": json.dumps({
+        "product_name": "Kiwi", "variety": "Zesy002", "origin": "Nouvelle-Zélande", "category": "I",
+        "calibre": "30", "packer_iso_code": "FR", "lots": "265475",
+    }, ensure_ascii=False)},
+    "parse_delivery_note": {"content": json.dumps({
+        "delivery_note_number": "BL-0001",
+        "items": [{"product_name": "Kiwi", "variety": "Zesy002", "quantity": 40, "unit": "colis"}],
+    }, ensure_ascii=False)},
+    "verif_famille": {"content": "1"},
+    "verif_calibre": {"content": "REGLEMENTAIRE"},
+    "verif_traitement": {"content": "REGLEMENTAIRE"},
+    "verif_mentions": {"content": "REGLEMENTAIRE"},
+}
+
+
+def write_stub_cassette(path: str):
+    with open(path, "w", encoding="utf8") as f:
+        for operation, response in STUB_RESPONSES.items():
+            f.write(json.dumps({"key": f"stub-{operation}", "operation": operation, "response": response}, ensure_ascii=False) + "\n")
+
+
+def synthetic_image(lines: List[str]) -> bytes:
+    import cv2
+    import numpy as np
+
+    img = np.full((600, 900, 3), 255, np.uint8)
+    for i, line in enumerate(lines):
+        cv2.putText(img, line, (20, 60 + i * 60), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buf.tobytes()
+
+
+def load_images(paths: List[str], fallback: List[str]) -> List[bytes]:
+    files = collect_image_files(paths) if paths else []
+    if not files:
+        return [synthetic_image(fallback)]
+    images = []
+    for path in files:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    return images
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub_server(args, workdir: str) -> subprocess.Popen:
+    """Lance l'API avec les appels externes rejoués (latence et erreurs simulées)."""
+    cassette = os.path.join(workdir, "stub_cassette.jsonl")
+    write_stub_cassette(cassette)
+    env = dict(
+        os.environ,
+        LLM_REPLAY_MODE="replay",
+        LLM_CASSETTE=cassette,
+        LLM_REPLAY_MISS="fallback",
+        LLM_REPLAY_LATENCY=f"mistral_ocr={args.ocr_latency},*={args.llm_latency}",
+        LLM_REPLAY_ERROR_RATE=str(args.error_rate),
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY") or "sk-loadtest",
+        MISTRAL_API_KEY=os.getenv("MISTRAL_API_KEY") or "loadtest",
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        # Chaque scan doit traverser le pipeline : pas de cache de résultats
+        SCAN_CACHE_SIZE="0",
+        VERDICT_CACHE_DB="",
+        STARTUP_PROFILE="0",
+        REFERENCE_WATCH_INTERVAL="0",
+    )
+    base = os.path.dirname(os.path.abspath(__file__))
+    # Tables utilisateurs de la base SQLite jetable (la base de prod est créée à part)
+    subprocess.run(
+        [sys.executable, "-c", "from database import Base, engine; Base.metadata.create_all(engine)"],
+        cwd=base, env=env, check=True,
+    )
+    if args.workers > 1:
+        env.update(BIND=f"127.0.0.1:{args.port}", WEB_CONCURRENCY=str(args.workers))
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"]
+    log = open(os.path.join(workdir, "server.log"), "w")
+    return subprocess.Popen(cmd, cwd=base, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float) -> bool:
+    """Attend /health puis /ready (moteurs et warm-up) ; False si /ready n'arrive pas à temps."""
+    deadline = time.monotonic() + timeout
+    healthy = False
+    while time.monotonic() < deadline:
+        try:
+            if not healthy:
+                healthy = (await client.get("/health")).status_code == 200
+            if healthy and (await client.get("/ready")).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    if not healthy:
+        raise RuntimeError("le serveur ne répond pas sur /health")
+    return False
+
+
+class Recorder:
+    """Durées et statuts par route pour le palier en cours."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def add(self, route: str, seconds: float, error: Optional[str]):
+        if error is None:
+            self.latencies[route].append(seconds)
+        else:
+            self.errors[route][error] += 1
+
+    def report(self, duration: float) -> Dict[str, Any]:
+        routes = {}
+        for route in sorted(set(self.latencies) | set(self.errors)):
+            ok = len(self.latencies[route])
+            errors = sum(self.errors[route].values())
+            routes[route] = {
+                "requests": ok + errors,
+                "throughput": round(ok / duration, 3),
+                "error_rate": round(errors / (ok + errors), 4) if ok + errors else 0.0,
+                "errors": dict(self.errors[route]),
+                "latency": summarize(self.latencies[route]),
+            }
+        return routes
+
+
+async def request(client, recorder: Recorder, route: str, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.TimeoutException:
+        recorder.add(route, time.perf_counter() - start, "timeout")
+        return None
+    except httpx.HTTPError as e:
+        recorder.add(route, time.perf_counter() - start, type(e).__name__)
+        return None
+    recorder.add(route, time.perf_counter() - start, None if response.is_success else str(response.status_code))
+    return response
+
+
+def _plage(spec: str) -> tuple:
+    bas, _, haut = spec.partition(":")
+    return float(bas), float(haut or bas)
+
+
+async def device(index: int, client, recorder: Recorder, args, labels: List[bytes], notes: List[bytes], stop_at: float):
+    """Un appareil : sessions login -> BL -> rafales d'étiquettes jusqu'à la fin du palier."""
+    rng = random.Random(args.seed * 1000 + index)
+    flags = {"use_mistral": args.engine == "mistral", "use_llm": args.parser == "llm"}
+
+    def label_payload():
+        image = rng.choice(labels)
+        return {"image_base64": base64.b64encode(image).decode(), "filename": f"lt_{index}_{rng.randrange(10**9)}.jpg", **flags}
+
+    while time.monotonic() < stop_at:
+        await request(client, recorder, "/auth/login", "POST", "/auth/login", json={"email": f"device{index}@loadtest.local"})
+        note = rng.choice(notes)
+        await request(client, recorder, "/scan-bl", "POST", "/scan-bl", json={
+            "image_base64": base64.b64encode(note).decode(), "filename": f"lt_bl_{index}.jpg",
+        })
+        for _ in range(rng.randint(*args.bursts)):
+            if time.monotonic() >= stop_at:
+                return
+            rafale = rng.randint(*args.burst_size)
+            await asyncio.gather(*(
+                request(client, recorder, "/scan", "POST", "/scan", json=label_payload()) for _ in range(rafale)
+            ))
+            await asyncio.sleep(rng.uniform(*args.think))
+
+
+async def run_stage(client, devices: int, args, labels, notes) -> Dict[str, Any]:
+    recorder = Recorder()
+    start = time.monotonic()
+    stop_at = start + args.stage_seconds
+    await asyncio.gather(*(device(i, client, recorder, args, labels, notes, stop_at) for i in range(devices)))
+    # Les requêtes lancées avant la fin du palier sont attendues : durée réelle du palier
+    duration = time.monotonic() - start
+    return {"devices": devices, "duration": round(duration, 2), "routes": recorder.report(duration)}
+
+
+def saturation(stages: List[Dict[str, Any]], route: str = "/scan") -> Optional[int]:
+    """Premier palier où doubler la charge ne donne plus +10% de débit /scan (p95 en hausse)."""
+    for prev, cur in zip(stages, stages[1:]):
+        a, b = prev["routes"].get(route), cur["routes"].get(route)
+        if not a or not b or not a["throughput"]:
+            continue
+        if b["throughput"] < a["throughput"] * 1.1 and b["latency"]["p95"] > a["latency"]["p95"]:
+            return prev["devices"]
+    return None
+
+
+def print_stage(stage: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    print(f"\n{stage['devices']} appareils ({stage['duration']}s)")
+    for route, r in stage["routes"].items():
+        lat = r["latency"]
+        ligne = (
+            f"  {route:<12} {r['requests']:>6} req {r['throughput']:>8.2f} req/s  p50 {lat['p50']:>6.2f}s "
+            f"p95 {lat['p95']:>6.2f}s p99 {lat['p99']:>6.2f}s  erreurs {r['error_rate']:>6.1%}"
+        )
+        base = (baseline or {}).get(route)
+        if base:
+            ligne += f"  | vs réf. débit {delta(r['throughput'], base['throughput'])} p95 {delta(lat['p95'], base['latency']['p95'])}"
+        print(ligne)
+
+
+async def main_async(args) -> Dict[str, Any]:
+    labels = load_images(args.images, ["KIWIFRUIT SUNGOLD", "Variete: Zesy002", "Calibre: 30 CAT I", "Origine: Nouvelle-Zelande", "Lot: 265475"])
+    notes = load_images(args.bl_images, ["BON DE LIVRAISON BL-0001", "Kiwi Zesy002 40 colis"])
+    baseline = {s["devices"]: s["routes"] for s in read_json(args.compare)["stages"]} if args.compare else {}
+
+    server = None
+    workdir = tempfile.mkdtemp(prefix="loadtest_")
+    if args.stub:
+        args.port = args.port or _free_port()
+        args.url = f"http://127.0.0.1:{args.port}"
+        server = start_stub_server(args, workdir)
+        print(f"API de test : {args.url} (logs : {workdir}/server.log)", file=sys.stderr)
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    try:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+            if not await wait_ready(client, args.ready_timeout):
+                print("/ready toujours en 503 : moteurs non chargés, test lancé quand même", file=sys.stderr)
+            stages = []
+            for devices in args.ramp:
+                stage = await run_stage(client, devices, args, labels, notes)
+                print_stage(stage, baseline.get(devices))
+                stages.append(stage)
+    finally:
+        if server is not None:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait(timeout=30)
+
+    point = saturation(stages)
+    print(f"\nSaturation /scan : {f'vers {point} appareils' if point else 'non atteinte sur cette rampe'}")
+    return {
+        "environment": environment(),
+        "config": {
+            k: getattr(args, k) for k in (
+                "stub", "workers", "engine", "parser", "ramp", "stage_seconds", "bursts", "burst_size", "think",
+                "ocr_latency", "llm_latency", "error_rate", "seed",
+            )
+        },
+        "stages": stages,
+        "saturation_devices": point,
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Test de charge : sessions login / BL / rafales d'étiquettes")
+    p.add_argument("--url", default="http://localhost:8000", help="API testée (ignoré avec --stub)")
+    p.add_argument("--stub", action="store_true", help="Démarre l'API locale avec OCR Mistral et LLM simulés")
+    p.add_argument("--port", type=int, default=0, help="Port de l'API --stub (défaut : port libre)")
+    p.add_argument("--workers", type=int, default=1, help="--stub : workers gunicorn (1 = uvicorn seul)")
+    p.add_argument("--ocr-latency", default="1.5:3", help="--stub : latence OCR Mistral simulée (s, min:max)")
+    p.add_argument("--llm-latency", default="0.5:2", help="--stub : latence des appels LLM simulée (s, min:max)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="--stub : proportion d'appels externes en erreur")
+    p.add_argument("--engine", choices=("mistral", "tesseract"), default="mistral", help="Moteur OCR des /scan")
+    p.add_argument("--parser", choices=("llm", "regex"), default="llm", help="Parser des /scan")
+    p.add_argument("--images", nargs="*", default=[], help="Images d'étiquettes (défaut : image synthétique)")
+    p.add_argument("--bl-images", nargs="*", default=[], help="Images de BL (défaut : image synthétique)")
+    p.add_argument("--ramp", type=lambda v: [int(x) for x in v.split(",")], default=[1, 2, 4, 8, 16], help="Appareils par palier")
+    p.add_argument("--stage-seconds", type=float, default=30, help="Durée d'un palier")
+    p.add_argument("--bursts", type=_plage, default=(2, 5), help="Rafales par session (min:max)")
+    p.add_argument("--burst-size", type=lambda v: tuple(int(x) for x in _plage(v)), default=(3, 8), help="Étiquettes par rafale (min:max)")
+    p.add_argument("--think", type=_plage, default=(2.0, 6.0), help="Pause entre rafales (s, min:max)")
+    p.add_argument("--timeout", type=float, default=120, help="Timeout client par requête (s)")
+    p.add_argument("--ready-timeout", type=float, default=120, help="Attente max de /ready (s)")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", default="loadtest_results.json", help="Résultats JSON")
+    p.add_argument("--compare", help="Résultats de référence (JSON d'un run précédent, mêmes paliers)")
+    args = p.parse_args(argv)
+    args.bursts = tuple(int(x) for x in args.bursts)
+
+    results = asyncio.run(main_async(args))
+    write_json(args.out, results)
+    print(f"Résultats : {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,49 @@
+# Chronométrage des imports avant tout le reste (rapport sur /startup)
+import startup_profile
+startup_profile.install()
+
+import asyncio
 import base64
+import hmac
 import logging
 import os
-import tempfile
-from typing import Optional
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from python_multipart.multipart import MultipartParser, parse_options_header
 from sqlalchemy.orm import Session
 
-from ocr import process_single_image
-from bl_parser import parse_delivery_note_with_llm
+import engines
+import executors
+import llm_client
+import metrics
+import reference_reload
+import tesseract_pool
+from capture_store import capture_store
+from verif import LookupMemo
+from result_cache import scan_cache, cache_key, content_digest
+from verdict_cache import verdict_cache
+from bl_parser import parse_delivery_note_with_llm_async
 from database import get_db, get_or_create_user, User
 
 
 load_dotenv()
 
+# Nombre maximum d'images acceptées par appel à /scan/batch
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "50"))
+# Jeton des endpoints /admin (en-tête X-Admin-Token) ; non défini = endpoints désactivés
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Routes suivies sur /metrics (chemins fixes, pas de label par URL arbitraire)
+METRICS_ROUTES = {"/scan", "/scan/upload", "/scan/batch", "/scan-bl", "/scan-bl/upload"}
+# Taille max d'un champ texte d'un formulaire multipart (options de scan)
+_MAX_FORM_FIELD = 64 * 1024
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -24,14 +51,30 @@ logging.basicConfig(
 logger = logging.getLogger("ocr-backend")
 
 
-class ScanRequest(BaseModel):
-    image_base64: str
+class ScanOptions(BaseModel):
     filename: Optional[str] = None
     use_llm: bool = False
     use_ollama: bool = False
     use_doctr: bool = False
     use_mistral : bool = False
     use_paddle: bool = False
+    # Ajoute à la réponse le bloc `timings` (durée par étape de cette requête)
+    timings: bool = False
+    # Envoie la photo à l'OCR même si le contrôle qualité la rejette (photo déjà reprise)
+    skip_quality: bool = False
+
+
+class ScanRequest(ScanOptions):
+    image_base64: str
+
+
+class BatchImage(BaseModel):
+    image_base64: str
+    filename: Optional[str] = None
+
+
+class BatchScanRequest(ScanOptions):
+    images: List[BatchImage]
 
 
 class LoginRequest(BaseModel):
@@ -57,11 +100,315 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def track_scan_requests(request: Request, call_next):
+    """Requêtes en cours, durée totale et collecte des étapes pour les routes de scan."""
+    if request.url.path not in METRICS_ROUTES:
+        return await call_next(request)
+    with metrics.request(request.url.path):
+        return await call_next(request)
+
+
+def scan_labels(opts: ScanOptions) -> Tuple[str, str]:
+    """(moteur, parser) effectifs selon les priorités du pipeline, labels des métriques."""
+    if opts.use_mistral:
+        engine = "mistral"
+    elif opts.use_doctr:
+        engine = "doctr"
+    elif opts.use_paddle:
+        engine = "paddle"
+    else:
+        engine = "tesseract"
+    parser = "ollama" if opts.use_ollama else "llm" if opts.use_llm else "regex"
+    return engine, parser
+
+
+def with_timings(response: dict, opts: ScanOptions) -> dict:
+    if opts.timings:
+        response["timings"] = metrics.current_timings()
+    return response
+
+
+# Pipeline OCR (OpenCV, parsers, vérifications) : importé par le warm-up après le démarrage,
+# pas à l'import de main. Un worker qui ne sert que /auth/login ne le charge jamais en attente.
+_ocr_module = None
+_warm_up_done = threading.Event()
+
+
+def _import_pipeline():
+    global _ocr_module
+    if _ocr_module is None:
+        import ocr
+
+        _ocr_module = ocr
+    return _ocr_module
+
+
+async def pipeline():
+    """Module `ocr` ; un scan arrivé avant la fin du warm-up attend l'import hors de la boucle."""
+    if _ocr_module is not None:
+        return _ocr_module
+    return await asyncio.to_thread(_import_pipeline)
+
+
+def warm_up():
+    """Charge en arrière-plan ce que le premier scan paierait sinon : pipeline OCR + référence."""
+    try:
+        with startup_profile.phase("import ocr"):
+            _import_pipeline()
+        with startup_profile.phase("reference"):
+            import verif
+
+            verif.get_reference()
+    except Exception:
+        logger.exception("Warm-up incomplet (chargement au premier scan)")
+    finally:
+        _warm_up_done.set()
+        startup_profile.finish()
+
+
+@app.on_event("startup")
+def preload_engines():
+    # Sous gunicorn --preload, les moteurs fork-safe sont déjà chargés dans le master ; les
+    # autres (PaddleOCR, docTR) et tout en uvicorn seul : chargement en arrière-plan dans ce
+    # worker (déjà chargés = ignorés), /health répond, /ready attend.
+    if not engines.preload_done():
+        threading.Thread(target=engines.preload, name="engines-preload", daemon=True).start()
+    # Le pool de processus Tesseract est propre à chaque worker (jamais créé avant le fork)
+    threading.Thread(target=tesseract_pool.warm_up, name="tesseract-warm-up", daemon=True).start()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    reference_reload.start_watcher()
+
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    executors.shutdown()
+    tesseract_pool.shutdown()
+    capture_store.close()
+
+
+async def quality_gate(image, opts: ScanOptions, saved_path: Optional[str]):
+    """Photo floue, mal exposée ou sans texte : 422 "retake" avant l'OCR et les appels LLM."""
+    if opts.skip_quality:
+        return
+    ocr = await pipeline()
+    report = await executors.run_ocr(ocr.check_quality, image)
+    if report is None or report["ok"]:
+        return
+    metrics.count_quality_rejection(report["reason"])
+    logger.info("Photo à reprendre: file=%s raison=%s mesures=%s", image.name, report["reason"], report["metrics"])
+    raise HTTPException(status_code=422, detail={
+        "retake": True,
+        "reason": report["reason"],
+        "message": report["message"],
+        "quality": report["metrics"],
+        "saved_path": saved_path,
+    })
+
+
+async def run_ocr_stage(img_bytes, name: str, use_mistral: bool = False, use_doctr: bool = False, use_paddle: bool = False) -> str:
+    """Étape OCR non bloquante : Mistral via le client async, moteurs locaux dans le pool OCR.
+
+    `img_bytes` : octets reçus ou `ocr.InputImage` (image déjà décodée par le contrôle qualité).
+    """
+    ocr = await pipeline()
+    if use_mistral:
+        async with executors.mistral_slot():
+            return await ocr.mistral_ocr_async(img_bytes, name)
+    return await executors.run_ocr(
+        ocr.extract_text, img_bytes, use_doctr=use_doctr, use_paddle=use_paddle, name=name
+    )
+
+
+def decode_base64_image(image_base64: str) -> bytes:
+    if not image_base64:
+        raise HTTPException(status_code=400, detail="image_base64 manquant")
+    try:
+        with metrics.stage("decode_base64"):
+            return base64.b64decode(image_base64)
+    except Exception:
+        raise HTTPException(status_code=400, detail="image_base64 invalide")
+
+
+async def read_multipart(request: Request, content_type: str) -> Tuple[Optional[bytes], Optional[str], Dict[str, str]]:
+    """(octets du champ `file`, nom du fichier, autres champs) d'un corps `multipart/form-data`.
+
+    Analyse en flux depuis `request.stream()`, tout en mémoire : `request.form()` écrit
+    chaque fichier de plus de 1 Mo (toutes les captures) dans un fichier temporaire.
+    """
+    _, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="multipart sans boundary")
+
+    parts: List[dict] = []
+    header = {"field": b"", "value": b""}
+
+    def on_part_begin():
+        parts.append({"headers": {}, "data": bytearray()})
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        parts[-1]["headers"][header["field"].lower()] = header["value"]
+        header["field"], header["value"] = b"", b""
+
+    def on_part_data(data, start, end):
+        part = parts[-1]
+        part["data"] += data[start:end]
+        if "filename" not in part and len(part["data"]) > _MAX_FORM_FIELD:
+            raise HTTPException(status_code=400, detail="champ de formulaire trop long")
+
+    def on_headers_finished():
+        part = parts[-1]
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = options.get(b"name", b"").decode("latin-1")
+        if b"filename" in options:
+            part["filename"] = options[b"filename"].decode("utf-8", "replace")
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"multipart invalide : {e}")
+
+    img_bytes, filename, fields = None, None, {}
+    for part in parts:
+        if "filename" in part:
+            if part["name"] == "file" and img_bytes is None:
+                img_bytes, filename = bytes(part["data"]), part["filename"]
+        else:
+            fields[part["name"]] = part["data"].decode("utf-8", "replace")
+    return img_bytes, filename, fields
+
+
+async def read_upload(request: Request) -> Tuple[bytes, ScanOptions]:
+    """Lit une image envoyée en `multipart/form-data` (champ `file`) ou en corps brut `image/*`.
+
+    En multipart, les options sont des champs du formulaire ; en corps brut, des paramètres de requête.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        img_bytes, upload_name, form = await read_multipart(request, content_type)
+        if img_bytes is None:
+            raise HTTPException(status_code=400, detail="champ 'file' manquant")
+        fields = {k: v for k, v in form.items() if k in ScanOptions.model_fields}
+        fields.setdefault("filename", upload_name)
+    elif content_type.startswith("image/") or content_type.startswith("application/octet-stream"):
+        img_bytes = await request.body()
+        fields = {k: v for k, v in request.query_params.items() if k in ScanOptions.model_fields}
+    else:
+        raise HTTPException(status_code=415, detail="Content-Type attendu : multipart/form-data ou image/*")
+
+    if not img_bytes:
+        raise HTTPException(status_code=400, detail="image vide")
+    try:
+        opts = ScanOptions(**fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return img_bytes, opts
+
+
+def unreadable_image(error: Exception) -> bool:
+    """Image reçue non décodable (levée par `ocr.InputImage`, donc pipeline déjà chargé)."""
+    return _ocr_module is not None and isinstance(error, _ocr_module.ImageDecodeError)
+
+
+def save_capture(img_bytes: bytes, filename: str, digest: Optional[str] = None) -> Optional[str]:
+    """Archive la capture (nom = hash du contenu) ; l'écriture se fait hors de la requête."""
+    with metrics.stage("save_capture"):
+        return capture_store.put(img_bytes, filename, digest)
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready():
+    """Readiness : 200 uniquement quand les moteurs OCR configurés et le pipeline sont chargés."""
+    status = engines.status()
+    status["warm_up_done"] = _warm_up_done.is_set()
+    status["ready"] = status["ready"] and status["warm_up_done"]
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+@app.get("/startup")
+def startup_report():
+    """Temps de démarrage : étapes (import du pipeline, référence) et coût d'import par module."""
+    return startup_profile.report()
+
+
+@app.get("/llm/stats")
+def llm_stats():
+    """Latence et tokens cumulés par type d'appel LLM (parsing, vérifications)."""
+    return llm_client.stats()
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Histogrammes par étape / appel LLM et requêtes en cours, format Prometheus."""
+    rendered = metrics.render()
+    if rendered is None:
+        raise HTTPException(status_code=503, detail="prometheus_client non installé ou METRICS_ENABLED=0")
+    body, content_type = rendered
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Compteurs hit / miss du cache de résultats de scan."""
+    return scan_cache.stats()
+
+
+@app.get("/cache/verdicts/stats")
+def verdict_cache_stats():
+    """Compteurs hit / miss du cache des verdicts LLM (calibre, traitement, mentions)."""
+    return verdict_cache.stats()
+
+
+@app.get("/captures/stats")
+def captures_stats():
+    """Archive des captures : file d'écriture, doublons, rétention (worker qui répond)."""
+    return capture_store.stats()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="ADMIN_TOKEN non configuré")
+    if not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="X-Admin-Token invalide")
+
+
+@app.get("/admin/reference", dependencies=[Depends(require_admin)])
+async def reference_status():
+    """Version du classeur de référence en service dans ce worker."""
+    return await asyncio.to_thread(reference_reload.status)
+
+
+@app.post("/admin/reference/reload", dependencies=[Depends(require_admin)])
+async def reload_reference(force: bool = False):
+    """Recharge le classeur de référence sans redémarrer (dans le worker qui reçoit l'appel ;
+    les autres workers suivent via la surveillance du fichier, REFERENCE_WATCH_INTERVAL)."""
+    return await asyncio.to_thread(reference_reload.reload, force)
+
+
 @app.post("/auth/login", response_model=AuthResponse)
 def login(req: LoginRequest, db: Session = Depends(get_db)):
     """
@@ -89,151 +436,199 @@ def login(req: LoginRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/scan")
-def scan_label(req: ScanRequest):
-    """
-    Reçoit une image encodée en base64, lance l'OCR + parsing, et renvoie les champs extraits.
-    """
-    if not req.image_base64:
-        raise HTTPException(status_code=400, detail="image_base64 manquant")
-
-    try:
-        img_bytes = base64.b64decode(req.image_base64)
-    except Exception:
-        raise HTTPException(status_code=400, detail="image_base64 invalide")
-
-    suffix = os.path.splitext(req.filename or "capture.jpg")[1] or ".jpg"
-    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    saved_path = None
+async def scan_label_bytes(img_bytes: bytes, opts: ScanOptions, verif_memo: Optional[LookupMemo] = None):
+    """OCR + parsing + vérifications d'une étiquette, directement depuis les octets reçus."""
+    filename = opts.filename or f"capture_{uuid.uuid4().hex[:8]}.jpg"
     try:
-        tmp_file.write(img_bytes)
-        tmp_file.flush()
-        tmp_file.close()
-
-        # Sauvegarde locale de la capture (dossier captures/)
-        captures_dir = os.path.join(os.path.dirname(__file__), "captures")
-        os.makedirs(captures_dir, exist_ok=True)
-        saved_path = os.path.join(
-            captures_dir,
-            os.path.basename(req.filename or f"capture_{os.path.basename(tmp_file.name)}"),
-        )
-        try:
-            with open(saved_path, "wb") as f:
-                f.write(img_bytes)
-            logger.info("Capture sauvegardée: %s", saved_path)
-        except Exception as e:
-            logger.warning("Impossible de sauvegarder la capture: %s", e)
+        # Hash du contenu calculé une fois (nom de la capture + clé de cache), hors de la boucle
+        digest = await asyncio.to_thread(content_digest, img_bytes)
+        saved_path = save_capture(img_bytes, filename, digest)
 
         logger.info(
-            "Reçu image pour OCR: file=%s bytes=%s use_llm=%s use_ollama=%s use_doctr=%s use_paddle=%s",
-            req.filename or tmp_file.name,
+            "Reçu image pour OCR: file=%s bytes=%s use_llm=%s use_ollama=%s use_doctr=%s use_paddle=%s use_mistral=%s",
+            filename,
             len(img_bytes),
-            req.use_llm,
-            req.use_ollama,
-            req.use_doctr,
-            req.use_paddle,
-            req.use_mistral
+            opts.use_llm,
+            opts.use_ollama,
+            opts.use_doctr,
+            opts.use_paddle,
+            opts.use_mistral
         )
 
-        result = process_single_image(
-            tmp_file.name,
-            use_mistral=req.use_mistral,
-            use_ollama=req.use_ollama,
-            use_llm=req.use_llm,
-            use_doctr=req.use_doctr,
-            use_paddle=req.use_paddle,
+        key = cache_key(img_bytes, digest=digest, **opts.model_dump())
+        # Tier SQLite (SCAN_CACHE_DB) : lecture / écriture hors de la boucle asyncio, un verrou
+        # sur la base ne doit pas bloquer les autres requêtes ni /health
+        with metrics.stage("cache_lookup"):
+            cached = await asyncio.to_thread(scan_cache.get, key)
+        if cached is not None:
+            logger.info("Résultat servi depuis le cache: file=%s", filename)
+            return with_timings(
+                {"success": True, "saved_path": saved_path, "image": filename, "cached": True, **cached}, opts
+            )
+
+        # Décodée une fois : contrôle qualité puis OCR sur le même ndarray
+        image = (await pipeline()).InputImage(img_bytes, filename)
+        await quality_gate(image, opts, saved_path)
+
+        txt = await run_ocr_stage(
+            image,
+            filename,
+            use_mistral=opts.use_mistral,
+            use_doctr=opts.use_doctr,
+            use_paddle=opts.use_paddle,
+        )
+        # Parsing LLM + vérifications (appels OpenAI) dans le pool LLM
+        result = await executors.run_llm(
+            (await pipeline()).analyse_text,
+            filename,
+            txt,
+            use_ollama=opts.use_ollama,
+            use_llm=opts.use_llm,
+            verif_memo=verif_memo,
         )
         logger.info(
             "OCR terminé: image=%s fields_found=%s",
             result.get("image"),
-            result,
             sum(1 for v in result.get("parsed", {}).values() if v),
         )
-        return {"success": True, "saved_path": saved_path, **result}
+        if result.get("degraded"):
+            # Appel LLM en échec, réponse de repli : pas mise en cache (comme les verdicts)
+            logger.warning("Résultat dégradé non mis en cache: file=%s", filename)
+        else:
+            await asyncio.to_thread(scan_cache.put, key, {k: result[k] for k in ("raw", "parsed", "errors")})
+        return with_timings({"success": True, "saved_path": saved_path, "cached": False, **result}, opts)
     except HTTPException:
         raise
     except Exception as e:
+        if unreadable_image(e):
+            logger.info("Image illisible: file=%s (%s)", filename, e)
+            raise HTTPException(status_code=400, detail="image illisible")
         logger.exception("Erreur OCR/parsing")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        try:
-            os.remove(tmp_file.name)
-        except OSError:
-            pass
 
 
-@app.post("/scan-bl")
-def scan_delivery_note(req: ScanRequest):
-    """
-    OCR + parsing LLM spécifique pour les bons de livraison.
-    Retourne les infos expéditeur/destinataire + la liste des lignes produits.
-    """
-    if not req.image_base64:
-        raise HTTPException(status_code=400, detail="image_base64 manquant")
-
+async def scan_delivery_note_bytes(img_bytes: bytes, opts: ScanOptions):
+    """OCR + parsing LLM d'un bon de livraison, directement depuis les octets reçus."""
+    filename = opts.filename or f"bl_{uuid.uuid4().hex[:8]}.jpg"
     try:
-        img_bytes = base64.b64decode(req.image_base64)
-    except Exception:
-        raise HTTPException(status_code=400, detail="image_base64 invalide")
+        saved_path = save_capture(img_bytes, filename)
 
-    suffix = os.path.splitext(req.filename or "bl.jpg")[1] or ".jpg"
-    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    saved_path = None
-    try:
-        tmp_file.write(img_bytes)
-        tmp_file.flush()
-        tmp_file.close()
-
-        # Sauvegarde locale de la capture (dossier captures/)
-        captures_dir = os.path.join(os.path.dirname(__file__), "captures")
-        os.makedirs(captures_dir, exist_ok=True)
-        saved_path = os.path.join(
-            captures_dir,
-            os.path.basename(req.filename or f"bl_{os.path.basename(tmp_file.name)}"),
-        )
-        try:
-            with open(saved_path, "wb") as f:
-                f.write(img_bytes)
-            logger.info("BL sauvegardé: %s", saved_path)
-        except Exception as e:
-            logger.warning("Impossible de sauvegarder le BL: %s", e)
+        logger.info("Reçu BL pour OCR: file=%s bytes=%s", filename, len(img_bytes))
 
-        logger.info("Reçu BL pour OCR: file=%s bytes=%s", req.filename or tmp_file.name, len(img_bytes))
+        image = (await pipeline()).InputImage(img_bytes, filename)
+        await quality_gate(image, opts, saved_path)
 
         # On réutilise le pipeline OCR pour obtenir le texte brut, sans parsing étiquette
-        # Par défaut, utilise PaddleOCR pour les BL (meilleure reconnaissance)
-        result = process_single_image(
-            tmp_file.name,
-            use_ollama=False,
-            use_llm=False,
-            use_doctr=req.use_doctr,
-            use_paddle=req.use_paddle,
-            use_mistral=req.use_mistral or True
+        # Par défaut, utilise Mistral OCR pour les BL (meilleure reconnaissance)
+        raw_text = await run_ocr_stage(
+            image,
+            filename,
+            use_doctr=opts.use_doctr,
+            use_paddle=opts.use_paddle,
+            use_mistral=opts.use_mistral or True
         )
-        raw_text = result.get("raw", "")
         try:
-            parsed_bl = parse_delivery_note_with_llm(raw_text)
+            with metrics.stage("parse"):
+                parsed_bl = await parse_delivery_note_with_llm_async(raw_text)
             logger.info("BL parsé avec LLM, items=%s", len(parsed_bl.get("items", [])))
         except Exception as e:
             logger.exception("Erreur LLM BL")
             raise HTTPException(status_code=500, detail=str(e))
 
-        return {
+        return with_timings({
             "success": True,
             "saved_path": saved_path,
             "raw": raw_text,
             "parsed": parsed_bl,
-        }
+        }, opts)
     except HTTPException:
         raise
     except Exception as e:
+        if unreadable_image(e):
+            logger.info("Image illisible: file=%s (%s)", filename, e)
+            raise HTTPException(status_code=400, detail="image illisible")
         logger.exception("Erreur OCR/parsing BL")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
+
+
+@app.post("/scan")
+async def scan_label(req: ScanRequest):
+    """
+    Reçoit une image encodée en base64, lance l'OCR + parsing, et renvoie les champs extraits.
+    """
+    metrics.set_labels(*scan_labels(req))
+    img_bytes = decode_base64_image(req.image_base64)
+    return await scan_label_bytes(img_bytes, req)
+
+
+@app.post("/scan/upload")
+async def scan_label_upload(request: Request):
+    """
+    Variante binaire de /scan : image en multipart (`file`) ou en corps brut `image/jpeg`.
+    Évite le surcoût base64 (+33%) et le passage par un fichier temporaire.
+    """
+    img_bytes, opts = await read_upload(request)
+    metrics.set_labels(*scan_labels(opts))
+    return await scan_label_bytes(img_bytes, opts)
+
+
+@app.post("/scan/batch")
+async def scan_label_batch(req: BatchScanRequest):
+    """
+    Scan d'un lot d'étiquettes (ex : toutes les étiquettes d'une palette) en un seul appel.
+    Les images sont traitées en parallèle (dans les limites des pools OCR / LLM) et la
+    résolution famille / sous-famille est partagée entre les images du lot.
+    Une image en erreur n'échoue pas le lot : chaque résultat porte son propre `success`.
+    """
+    if not req.images:
+        raise HTTPException(status_code=400, detail="images manquantes")
+    if len(req.images) > BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Trop d'images (max {BATCH_MAX_IMAGES})")
+
+    metrics.set_labels(*scan_labels(req))
+    memo = LookupMemo()
+    # Les étapes des images du lot sont cumulées : un seul bloc `timings`, pour le lot
+    options = req.model_dump(exclude={"images", "filename", "timings"})
+
+    async def scan_item(index: int, item: BatchImage):
         try:
-            os.remove(tmp_file.name)
-        except OSError:
-            pass
+            img_bytes = decode_base64_image(item.image_base64)
+            opts = ScanOptions(filename=item.filename, **options)
+            result = await scan_label_bytes(img_bytes, opts, verif_memo=memo)
+        except HTTPException as e:
+            # Dont image illisible (400) : seule cette image est en erreur
+            return {"index": index, "success": False, "filename": item.filename, "error": e.detail}
+        except Exception as e:
+            if not unreadable_image(e):
+                raise
+            return {"index": index, "success": False, "filename": item.filename, "error": "image illisible"}
+        return {"index": index, **result}
+
+    results = await asyncio.gather(*(scan_item(i, item) for i, item in enumerate(req.images)))
+    failed = sum(1 for r in results if not r["success"])
+    logger.info("Lot terminé: images=%s erreurs=%s", len(results), failed)
+    return with_timings({"success": True, "count": len(results), "failed": failed, "results": results}, req)
+
+
+@app.post("/scan-bl")
+async def scan_delivery_note(req: ScanRequest):
+    """
+    OCR + parsing LLM spécifique pour les bons de livraison.
+    Retourne les infos expéditeur/destinataire + la liste des lignes produits.
+    """
+    metrics.set_labels("mistral", "llm")
+    img_bytes = decode_base64_image(req.image_base64)
+    return await scan_delivery_note_bytes(img_bytes, req)
+
+
+@app.post("/scan-bl/upload")
+async def scan_delivery_note_upload(request: Request):
+    """
+    Variante binaire de /scan-bl : image en multipart (`file`) ou en corps brut `image/jpeg`.
+    """
+    img_bytes, opts = await read_upload(request)
+    metrics.set_labels("mistral", "llm")
+    return await scan_delivery_note_bytes(img_bytes, opts)
 
 
 if __name__ == "__main__":
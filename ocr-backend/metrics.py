@@ -0,0 +1,198 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+try:
+    import prometheus_client
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram
+    PROMETHEUS_AVAILABLE = True
+except Exception:
+    prometheus_client = None
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    PROMETHEUS_AVAILABLE = False
+
+try:
+    from opentelemetry import trace
+    _tracer = trace.get_tracer("ocr-backend")
+except Exception:
+    _tracer = None
+
+
+logger = logging.getLogger("ocr-backend")
+
+# --- Configuration ---
+# Histogrammes Prometheus par étape (exposés sur /metrics) ; 0 = aucune mesure
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Sous gunicorn, dossier partagé par les workers (métriques agrégées sur /metrics, quel que
+# soit le worker qui répond) ; vidé au démarrage du master
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+
+# De 5 ms (décodage base64) à 1 min (OCR Mistral + contrôles LLM)
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 60.0)
+
+if PROMETHEUS_AVAILABLE and METRICS_ENABLED:
+    STAGE_SECONDS = Histogram(
+        "ocr_backend_stage_seconds", "Durée d'une étape du traitement d'un scan",
+        ["stage", "engine", "parser"], buckets=_BUCKETS,
+    )
+    LLM_CALL_SECONDS = Histogram(
+        "ocr_backend_llm_call_seconds", "Durée d'un appel LLM (retries du SDK inclus)",
+        ["operation", "model", "status"], buckets=_BUCKETS,
+    )
+    LLM_TOKENS = Counter(
+        "ocr_backend_llm_tokens", "Tokens consommés par les appels LLM", ["operation", "kind"],
+    )
+    REQUEST_SECONDS = Histogram(
+        "ocr_backend_request_seconds", "Durée totale d'une requête de scan",
+        ["route", "engine", "parser"], buckets=_BUCKETS,
+    )
+    IN_FLIGHT = Gauge(
+        "ocr_backend_requests_in_flight", "Requêtes de scan en cours", ["route"],
+        multiprocess_mode="livesum",
+    )
+    QUALITY_REJECTIONS = Counter(
+        "ocr_backend_quality_rejections", "Photos renvoyées à l'app avant l'OCR (contrôle qualité)", ["reason"],
+    )
+else:
+    STAGE_SECONDS = LLM_CALL_SECONDS = LLM_TOKENS = REQUEST_SECONDS = IN_FLIGHT = QUALITY_REJECTIONS = None
+
+
+class RequestTimings:
+    """Durées cumulées par étape pour une requête (bloc `timings` de la réponse).
+
+    Partagé entre la boucle asyncio et les threads des pools (contexte copié par
+    `executors`), d'où le verrou.
+    """
+
+    def __init__(self, route: str):
+        self.route = route
+        self.labels = {"engine": "tesseract", "parser": "regex"}
+        self.started = time.perf_counter()
+        self._stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {stage: round(seconds, 4) for stage, seconds in self._stages.items()}
+        return {"total": round(time.perf_counter() - self.started, 4), **self.labels, "stages": stages}
+
+
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def _span(name: str, **attributes):
+    if _tracer is None:
+        yield
+        return
+    with _tracer.start_as_current_span(name, attributes=attributes):
+        yield
+
+
+@contextmanager
+def request(route: str):
+    """Suivi d'une requête : gauge en cours, durée totale, span racine et collecteur d'étapes."""
+    timings = RequestTimings(route)
+    token = _current.set(timings)
+    if IN_FLIGHT is not None:
+        IN_FLIGHT.labels(route).inc()
+    try:
+        with _span(f"POST {route}", route=route):
+            yield timings
+    finally:
+        if IN_FLIGHT is not None:
+            IN_FLIGHT.labels(route).dec()
+        if REQUEST_SECONDS is not None:
+            REQUEST_SECONDS.labels(route=route, **timings.labels).observe(time.perf_counter() - timings.started)
+        _current.reset(token)
+
+
+def set_labels(engine: str, parser: str):
+    """Moteur OCR et parser de la requête en cours (labels des histogrammes d'étapes)."""
+    timings = _current.get()
+    if timings is not None:
+        timings.labels = {"engine": engine, "parser": parser}
+
+
+@contextmanager
+def stage(name: str):
+    """`with metrics.stage("preprocess"): ...` : histogramme + bloc `timings` + span."""
+    timings = _current.get()
+    labels = timings.labels if timings is not None else {"engine": "", "parser": ""}
+    start = time.perf_counter()
+    try:
+        with _span(name, **labels):
+            yield
+    finally:
+        seconds = time.perf_counter() - start
+        if STAGE_SECONDS is not None:
+            STAGE_SECONDS.labels(stage=name, **labels).observe(seconds)
+        if timings is not None:
+            timings.add(name, seconds)
+
+
+def timed(name: str, func):
+    """`func` exécutée dans `stage(name)` (contrôles soumis au pool de vérification)."""
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def stage_name(libelle: str) -> str:
+    """"Catégorie" -> "categorie" : libellé utilisable comme nom d'étape."""
+    texte = unicodedata.normalize("NFKD", libelle)
+    return "".join(c for c in texte if not unicodedata.combining(c)).lower().replace(" ", "_")
+
+
+def observe_llm(operation: str, model, seconds: float, prompt_tokens: int = 0, completion_tokens: int = 0, error: bool = False):
+    """Appelé par llm_client pour chaque appel (parsing, famille, contrôles)."""
+    if LLM_CALL_SECONDS is not None:
+        LLM_CALL_SECONDS.labels(operation, model or "", "error" if error else "ok").observe(seconds)
+        LLM_TOKENS.labels(operation, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(operation, "completion").inc(completion_tokens)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(f"llm_{operation}", seconds)
+
+
+def count_quality_rejection(reason: str):
+    if QUALITY_REJECTIONS is not None:
+        QUALITY_REJECTIONS.labels(reason=reason).inc()
+
+
+def current_timings() -> Optional[Dict[str, Any]]:
+    timings = _current.get()
+    return timings.as_dict() if timings is not None else None
+
+
+def render():
+    """(corps, content-type) de /metrics ; None si prometheus_client n'est pas installé."""
+    if STAGE_SECONDS is None:
+        return None
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Hook gunicorn `child_exit` : retire les gauges d'un worker terminé."""
+    if PROMETHEUS_AVAILABLE and PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
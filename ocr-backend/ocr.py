@@ -1,15 +1,21 @@
-from PIL import Image
-import PIL
-import pytesseract
 import cv2
 import json
 from parser import parse_ocr_text
-from typing import Optional
+from typing import Optional, Union
 import argparse
+import importlib.util
 import os
-from mistralai import Mistral
+import tempfile
 import base64
-
+import numpy as np
+
+import engines
+import llm_client
+import metrics
+import preprocess
+import quality
+import tesseract_pool
+import text_regions
 from verif import verif
 
 try:
@@ -22,160 +28,289 @@ try:
 except Exception:
     parse_with_ollama = None
 
-try:
-    from doctr_ocr import doctr_ocr, doctr_ocr_with_preprocessing
-except Exception:
-    doctr_ocr = None
-    doctr_ocr_with_preprocessing = None
-
-try:
-    from paddleocr import PaddleOCR
-    PADDLE_AVAILABLE = True
-    _paddle_ocr_client = None
-except Exception:
-    PaddleOCR = None
-    PADDLE_AVAILABLE = False
-    _paddle_ocr_client = None
+# Moteurs optionnels : on teste seulement leur présence ici (sans les importer) ;
+# les modèles sont chargés par engines.py (préchargement ou premier usage)
+DOCTR_AVAILABLE = importlib.util.find_spec("doctr_ocr") is not None
+PADDLE_AVAILABLE = importlib.util.find_spec("paddleocr") is not None
 
 
 # main function   
 def ocr_main(img):
     """Run Tesseract OCR with tuned config for French labels."""
+    import pytesseract
+
     config = "--oem 3 --psm 6"
     return pytesseract.image_to_string(img, lang="fra", config=config)
 
 
-def get_grayscale(image):
-    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+# Type MIME d'après les premiers octets (data URL envoyée à Mistral)
+_MIME_SIGNATURES = ((b"\xff\xd8\xff", "image/jpeg"), (b"\x89PNG", "image/png"), (b"GIF8", "image/gif"), (b"BM", "image/bmp"))
 
 
-def remove_noise(image):
-    return cv2.medianBlur(image, 3)
+def sniff_mime_type(data: bytes, default: str = "image/jpeg") -> str:
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image/tiff"
+    for signature, mime in _MIME_SIGNATURES:
+        if data.startswith(signature):
+            return mime
+    return default
 
 
-def thresholding(image):
-    return cv2.threshold(image, 100, 230, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+class ImageDecodeError(FileNotFoundError):
+    """Octets reçus non décodables en image (l'API répond 400, pas 500)."""
 
 
+class InputImage:
+    """Image d'entrée lue / décodée une seule fois, partagée par toutes les étapes.
 
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+    Source : un chemin (CLI), les octets encodés reçus par l'API (JPEG/PNG) ou un ndarray BGR
+    déjà décodé. `data()` rend les octets encodés (Mistral, docTR) et `array()` le ndarray
+    (Tesseract, Paddle), chacun calculé au premier appel puis gardé ; `mime_type()` le type
+    réel des octets de `data()` (PNG pour un ndarray ré-encodé).
+    """
 
+    def __init__(self, source, name: Optional[str] = None):
+        self.path = source if isinstance(source, str) else None
+        self._data = bytes(source) if isinstance(source, (bytes, bytearray, memoryview)) else None
+        self._array = source if isinstance(source, np.ndarray) else None
+        if self.path is None and self._data is None and self._array is None:
+            raise TypeError(f"Image non supportée : {type(source).__name__} (chemin, octets ou ndarray)")
+        self.name = os.path.basename(name) if name else os.path.basename(self.path) if self.path else "upload"
+
+    def data(self) -> bytes:
+        if self._data is None:
+            if self.path is not None:
+                with open(self.path, "rb") as f:
+                    self._data = f.read()
+            else:
+                ok, encoded = cv2.imencode(".png", self._array)
+                if not ok:
+                    raise ValueError(f"Image non encodable : {self.name}")
+                self._data = encoded.tobytes()
+        return self._data
 
-def process_single_image(img_path: str, use_mistral: bool = False, use_ollama: bool = False, use_llm: bool = False, use_doctr: bool = False, use_paddle: bool = False):
-    """Process a single image: OCR + parsing + checks.
+    def mime_type(self) -> str:
+        return sniff_mime_type(self.data())
 
-    Args:
-        img_path: path to the image file
-        use_ollama: use Ollama local LLM for parsing
-        use_llm: use OpenAI LLM for parsing
-        use_doctr: use docTR OCR instead of Tesseract
-        use_paddle: use PaddleOCR instead of Tesseract
+    def array(self) -> np.ndarray:
+        if self._array is None:
+            with metrics.stage("load_image"):
+                self._array = cv2.imdecode(np.frombuffer(self.data(), dtype=np.uint8), cv2.IMREAD_COLOR)
+            if self._array is None:
+                raise ImageDecodeError(f"Image not found or not decodable: {self.name}")
+        return self._array
+
+
+# Une image d'entrée : chemin (CLI), octets bruts reçus par l'API, ndarray BGR ou InputImage
+ImageSource = Union[str, bytes, np.ndarray, InputImage]
+
+
+def as_image(image: ImageSource, name: Optional[str] = None) -> InputImage:
+    if isinstance(image, InputImage):
+        return image
+    return InputImage(image, name)
+
+
+def load_image(image: ImageSource):
+    """Décode l'image en ndarray BGR (une seule fois par InputImage)."""
+    return as_image(image).array()
+
+
+def check_quality(image: ImageSource) -> Optional[dict]:
+    """Contrôle qualité de la photo avant l'OCR (None si QUALITY_GATE=0).
+
+    Décode l'image une fois : l'`InputImage` passée garde le ndarray pour l'étape OCR.
     """
-    # OCR Method selection
-    if use_mistral and use_mistral is not None:
-        print(f"\n{'='*70}")
-        print(f"Image: {os.path.basename(img_path)}")
-        print(f"OCR Engine: Mistral")
-        print(f"{'='*70}")
-        api_key = os.environ["MISTRAL_API_KEY"]
-
-        client = Mistral(api_key=api_key)
-
-        base64_image = encode_image(img_path)
-        ocr_response = client.ocr.process(
+    if not quality.QUALITY_GATE:
+        return None
+    img = as_image(image).array()
+    with metrics.stage("quality"):
+        return quality.check(img)
+
+
+def _print_header(img_path, engine):
+    print(f"\n{'='*70}")
+    print(f"Image: {os.path.basename(img_path)}")
+    print(f"OCR Engine: {engine}")
+    print(f"{'='*70}")
+
+
+def _mistral_document(image: InputImage):
+    base64_image = base64.b64encode(image.data()).decode('utf-8')
+    return {
+        "type": "image_url",
+        "image_url": f"data:{image.mime_type()};base64,{base64_image}"
+    }
+
+
+def mistral_ocr(image: ImageSource, name: Optional[str] = None) -> str:
+    """OCR via l'API Mistral (appel réseau bloquant)."""
+    image = as_image(image, name)
+    _print_header(image.name, "Mistral")
+    ocr_response = llm_client.mistral_ocr(
+        model="mistral-ocr-latest",
+        document=_mistral_document(image),
+        # table_format=None,
+        include_image_base64=True
+    )
+    return ocr_response.pages[0].markdown
+
+
+async def mistral_ocr_async(image: ImageSource, name: Optional[str] = None) -> str:
+    """Variante asynchrone de `mistral_ocr` : n'occupe aucun thread pendant l'appel réseau."""
+    image = as_image(image, name)
+    _print_header(image.name, "Mistral")
+    with metrics.stage("ocr"):
+        ocr_response = await llm_client.mistral_ocr_async(
             model="mistral-ocr-latest",
-            document={
-                "type": "image_url",
-                "image_url": f"data:image/jpeg;base64,{base64_image}" 
-            },
-            # table_format=None,
+            document=_mistral_document(image),
             include_image_base64=True
         )
-        txt = ocr_response.pages[0].markdown
-        
-    elif use_doctr and doctr_ocr is not None:
-        # Use docTR OCR with preprocessing
-        print(f"\n{'='*70}")
-        print(f"Image: {os.path.basename(img_path)}")
-        print(f"OCR Engine: docTR")
-        print(f"{'='*70}")
-        txt = doctr_ocr_with_preprocessing(img_path)
-    elif use_paddle and PADDLE_AVAILABLE:
-        # Use PaddleOCR
-        print(f"\n{'='*70}")
-        print(f"Image: {os.path.basename(img_path)}")
-        print(f"OCR Engine: PaddleOCR")
-        print(f"{'='*70}")
-        global _paddle_ocr_client
-        if _paddle_ocr_client is None:
-            # lang='fr' is preferable for French labels; fallback to default if not available
-            try:
-                _paddle_ocr_client = PaddleOCR(use_angle_cls=True, lang='fr')
-            except Exception:
-                _paddle_ocr_client = PaddleOCR(use_angle_cls=True)
-        # PaddleOCR expects a path or ndarray
-        try:
+    return ocr_response.pages[0].markdown
+
+
+def paddle_ocr(image: ImageSource, name: Optional[str] = None) -> str:
+    image = as_image(image, name)
+    _print_header(image.name, "PaddleOCR")
+    # PaddleOCR accepte un ndarray : pas de relecture du fichier
+    img = image.array()
+    if text_regions.enabled():
+        # Paddle a son propre détecteur : on lui passe seulement le cadre englobant les zones
+        with metrics.stage("regions"):
+            regions = text_regions.detect(img)
+        if regions:
+            x, y, w, h = text_regions.bounding_box(regions)
+            img = img[y:y + h, x:x + w]
+    try:
+        # Instance du pool (préchargée au démarrage), réservée à cette requête
+        with engines.checkout("paddle") as paddle_client:
             # Newer PaddleOCR uses `predict` (ocr is deprecated). Call predict first.
             try:
-                result = _paddle_ocr_client.predict(img_path)
+                result = paddle_client.predict(img)
             except TypeError:
                 # Older versions may still support ocr(); try that as fallback
-                result = _paddle_ocr_client.ocr(img_path)
-
-            # result can be nested lists like [[(box), (text, confidence)], ...]
-            # or other similar structures depending on version. Extract any string texts.
-            lines = []
-
-            def _collect_texts(obj):
-                if obj is None:
-                    return
-                if isinstance(obj, str):
-                    lines.append(obj)
-                elif isinstance(obj, (list, tuple)):
-                    for item in obj:
-                        _collect_texts(item)
-                elif isinstance(obj, dict):
-                    for v in obj.values():
-                        _collect_texts(v)
-
-            _collect_texts(result)
-            # remove duplicates and empty strings while preserving order
-            seen = set()
-            clean = []
-            for l in lines:
-                s = l.strip()
-                if not s:
-                    continue
-                if s in seen:
-                    continue
-                seen.add(s)
-                clean.append(s)
-
-            txt = '\n'.join(clean)
-        except Exception as e:
-            raise RuntimeError(f'PaddleOCR failed: {e}')
-    else:
-        # Use Tesseract OCR with preprocessing
-        img = cv2.imread(img_path)
-        if img is None:
-            raise FileNotFoundError(f"Image not found: {img_path}")
-
-        # Preprocessing
-        img = get_grayscale(img)
-        # upscale to help OCR on small text
-        img = cv2.resize(img, None, fx=2.0, fy=2.0, interpolation=cv2.INTER_CUBIC)
-        img = thresholding(img)
-        img = remove_noise(img)
-
-        # OCR
-        print(f"\n{'='*70}")
-        print(f"Image: {os.path.basename(img_path)}")
-        print(f"OCR Engine: Tesseract")
-        print(f"{'='*70}")
-        txt = ocr_main(img)
-    
+                result = paddle_client.ocr(img)
+
+        # result can be nested lists like [[(box), (text, confidence)], ...]
+        # or other similar structures depending on version. Extract any string texts.
+        lines = []
+
+        def _collect_texts(obj):
+            if obj is None:
+                return
+            if isinstance(obj, str):
+                lines.append(obj)
+            elif isinstance(obj, (list, tuple)):
+                for item in obj:
+                    _collect_texts(item)
+            elif isinstance(obj, dict):
+                for v in obj.values():
+                    _collect_texts(v)
+
+        _collect_texts(result)
+        # remove duplicates and empty strings while preserving order
+        seen = set()
+        clean = []
+        for l in lines:
+            s = l.strip()
+            if not s:
+                continue
+            if s in seen:
+                continue
+            seen.add(s)
+            clean.append(s)
+
+        return '\n'.join(clean)
+    except Exception as e:
+        raise RuntimeError(f'PaddleOCR failed: {e}')
+
+
+def _tesseract(img) -> str:
+    if tesseract_pool.enabled():
+        # Processus OCR persistants (un par cœur), image passée en mémoire partagée
+        return tesseract_pool.image_to_string(img)
+    return ocr_main(img)
+
+
+def _tesseract_region(crop, text_height: Optional[float] = None) -> str:
+    """Prétraitement + OCR d'une zone de texte (thread du pool des zones)."""
+    return _tesseract(preprocess.run(crop, text_height=text_height))
+
+
+def tesseract_ocr(image: ImageSource, name: Optional[str] = None) -> str:
+    # Use Tesseract OCR with preprocessing
+    image = as_image(image, name)
+    img = image.array()
+
+    if text_regions.enabled():
+        with metrics.stage("regions"):
+            regions = text_regions.detect(img)
+        if regions:
+            # Seules les zones de texte sont OCRisées, en parallèle, puis remises dans l'ordre de lecture
+            _print_header(image.name, f"Tesseract ({len(regions)} zones)")
+            with metrics.stage("ocr"):
+                return text_regions.ocr_regions(img, regions, _tesseract_region)
+
+    # Preprocessing : resized to a target text height instead of a blind 2x upscale
+    with metrics.stage("preprocess"):
+        img = preprocess.run(img)
+
+    # OCR
+    _print_header(image.name, "Tesseract")
+    with metrics.stage("ocr"):
+        return _tesseract(img)
+
+
+def doctr_ocr_from_source(image: ImageSource, name: Optional[str] = None) -> str:
+    image = as_image(image, name)
+    _print_header(image.name, "docTR")
+    with engines.checkout("doctr") as doctr_module:
+        if image.path is not None:
+            return doctr_module.doctr_ocr_with_preprocessing(image.path)
+        # docTR ne lit que des fichiers : seul moteur qui a encore besoin d'un fichier temporaire
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(image.name)[1] or ".jpg") as tmp:
+            tmp.write(image.data())
+            tmp.flush()
+            return doctr_module.doctr_ocr_with_preprocessing(tmp.name)
+
+
+def extract_text(image: ImageSource, use_mistral: bool = False, use_doctr: bool = False, use_paddle: bool = False, name: Optional[str] = None) -> str:
+    """OCR stage only: select the engine and return the raw text.
+
+    `image` is a file path, the raw encoded bytes (JPEG/PNG), a decoded BGR ndarray or an
+    `InputImage`. Tesseract times its own decode / preprocess / OCR stages; the other engines
+    are timed as a single "ocr" stage.
+    """
+    image = as_image(image, name)
+    if use_mistral:
+        with metrics.stage("ocr"):
+            return mistral_ocr(image, name)
+    elif use_doctr and DOCTR_AVAILABLE:
+        # Use docTR OCR with preprocessing
+        with metrics.stage("ocr"):
+            return doctr_ocr_from_source(image, name)
+    elif use_paddle and PADDLE_AVAILABLE:
+        with metrics.stage("ocr"):
+            return paddle_ocr(image, name)
+    return tesseract_ocr(image, name)
+
+
+def analyse_text(img_path: str, txt: str, use_ollama: bool = False, use_llm: bool = False, verif_memo=None):
+    """Parsing + checks stage on an already extracted OCR text.
+
+    `verif_memo` (a `verif.LookupMemo`) shares reference lookups between the images of a batch.
+    `degraded` is true when an LLM call failed and a fallback answer was used (regex parser,
+    default verdict): such a result must not be cached.
+    """
+    with llm_client.track_degradation() as failures:
+        result = _analyse_text(img_path, txt, use_ollama, use_llm, verif_memo)
+    result['degraded'] = bool(failures)
+    return result
+
+
+def _analyse_text(img_path: str, txt: str, use_ollama: bool, use_llm: bool, verif_memo):
     print("OCR Text:")
     print(txt)
     print(f"{'='*70}\n")
@@ -183,24 +318,27 @@ def process_single_image(img_path: str, use_mistral: bool = False, use_ollama: b
     # Parse with selected method
     parsed = None
     
-    # Priority: Ollama > OpenAI > regex
-    if use_ollama and parse_with_ollama is not None:
-        try:
-            parsed = parse_with_ollama(txt)
-            print(f'✓ Parsed with Ollama')
-        except Exception as e:
-            print(f'Ollama parse failed: {e} — trying other parsers')
-    
-    if parsed is None and use_llm and parse_with_llm is not None:
-        try:
-            parsed = parse_with_llm(txt)
-            print(f'✓ Parsed with OpenAI')
-        except Exception as e:
-            print(f'OpenAI parse failed: {e} — falling back to regex parser')
-    
-    if parsed is None:
-        parsed = parse_ocr_text(txt)
-        print(f'✓ Parsed with regex rules')
+    with metrics.stage("parse"):
+        # Priority: Ollama > OpenAI > regex
+        if use_ollama and parse_with_ollama is not None:
+            try:
+                parsed = parse_with_ollama(txt)
+                print(f'✓ Parsed with Ollama')
+            except Exception as e:
+                print(f'Ollama parse failed: {e} — trying other parsers')
+                llm_client.note_degraded("parse_ollama")
+        
+        if parsed is None and use_llm and parse_with_llm is not None:
+            try:
+                parsed = parse_with_llm(txt)
+                print(f'✓ Parsed with OpenAI')
+            except Exception as e:
+                print(f'OpenAI parse failed: {e} — falling back to regex parser')
+                llm_client.note_degraded("parse_label")
+        
+        if parsed is None:
+            parsed = parse_ocr_text(txt)
+            print(f'✓ Parsed with regex rules')
     
     # Display results
     print("\nParsed fields:")
@@ -209,7 +347,8 @@ def process_single_image(img_path: str, use_mistral: bool = False, use_ollama: b
     found = sum(1 for v in parsed.values() if v is not None)
     print(f"\n📊 Fields found: {found}/9")
 
-    v = verif(parsed)
+    with metrics.stage("verif"):
+        v = verif(parsed, memo=verif_memo)
     print(v)
     
     return {
@@ -220,6 +359,24 @@ def process_single_image(img_path: str, use_mistral: bool = False, use_ollama: b
     }
 
 
+def process_single_image(image: ImageSource, use_mistral: bool = False, use_ollama: bool = False, use_llm: bool = False, use_doctr: bool = False, use_paddle: bool = False, name: Optional[str] = None):
+    """Process a single image: OCR + parsing + checks.
+
+    Args:
+        image: path to the image file, encoded bytes (JPEG/PNG) or decoded BGR ndarray;
+            decoded once and shared by every stage
+        use_mistral: use Mistral OCR API instead of Tesseract
+        use_ollama: use Ollama local LLM for parsing
+        use_llm: use OpenAI LLM for parsing
+        use_doctr: use docTR OCR instead of Tesseract
+        use_paddle: use PaddleOCR instead of Tesseract
+        name: file name reported in the result (defaults to the path basename, or "upload")
+    """
+    image = as_image(image, name)
+    txt = extract_text(image, use_mistral=use_mistral, use_doctr=use_doctr, use_paddle=use_paddle)
+    return analyse_text(image.name, txt, use_ollama=use_ollama, use_llm=use_llm)
+
+
 if __name__ == '__main__':
     parser_arg = argparse.ArgumentParser(description='OCR + parsing for label images')
     parser_arg.add_argument('--llm', action='store_true', help='Use OpenAI LLM parsing (requires OPENAI_API_KEY and credits)')
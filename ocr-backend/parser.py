@@ -2,13 +2,22 @@ import re
 from typing import Dict, Optional
 
 
+_SPACES_RE = re.compile(r"\s+")
+_PUNCT_RE = re.compile(r"[\(\)\[\]{}\"'`´]")
+# enlever uniquement unités/mots techniques, laisser les noms de pays
+_UNITS_RE = re.compile(r"\b(mm|g|kg|pcs?|cat(egorie)?|cal(ibre)?|lot|emb|bio|net|poids|date|code|barcode|ean)\b", re.IGNORECASE)
+_SEPARATORS_RE = re.compile(r"[|\\/]+")
+
+
 def normalize_spaces(s: str) -> str:
-    return re.sub(r"\s+", " ", s).strip()
+    return _SPACES_RE.sub(" ", s).strip()
 
 
 def extract_field(patterns, text: str) -> Optional[str]:
     for pat in patterns:
-        m = re.search(pat, text, flags=re.IGNORECASE)
+        if isinstance(pat, str):
+            pat = re.compile(pat, re.IGNORECASE)
+        m = pat.search(text)
         if m:
             # return first non-empty group or whole match
             groups = [g for g in m.groups() if g]
@@ -17,14 +26,147 @@ def extract_field(patterns, text: str) -> Optional[str]:
             else:
                 val = normalize_spaces(m.group(0))
             # Nettoyage : retire unités, parenthèses, points, etc (NE PAS enlever les pays)
-            val = re.sub(r"[\(\)\[\]{}\"'`´]", '', val)
-            # enlever uniquement unités/mots techniques, laisser les noms de pays
-            val = re.sub(r"\b(mm|g|kg|pcs?|cat(egorie)?|cal(ibre)?|lot|emb|bio|net|poids|date|code|barcode|ean)\b", '', val, flags=re.IGNORECASE)
-            val = re.sub(r"\s+", ' ', val).strip(' ,:-')
+            val = _PUNCT_RE.sub('', val)
+            val = _UNITS_RE.sub('', val)
+            val = _SPACES_RE.sub(' ', val).strip(' ,:-')
             return val if val else None
     return None
 
 
+# patterns (ordered) - each is a list of regexes to try
+# Compilés une seule fois à l'import : le parser regex est le fallback quand le LLM est
+# indisponible, il doit rester très peu coûteux en rafale.
+FIELD_PATTERNS = {
+    'product': [
+        r"Produit\s*[:\-]?\s*([A-Za-z0-9\- ]{3,})",
+        r"([A-Z][A-Z0-9\- ]{3,})\s+\(?\bwww\b",
+        r"([A-Z][A-Z0-9\- ]{3,})",
+        r"([A-Z][a-zéèêàâîôûç\- ]{3,})"
+    ],
+    'variety': [
+        r"Vari[eé]t[eé]?\s*[:\-]?\s*([A-Za-z0-9\-()' ]+)",
+        r"Var\.?\s*[:\-]?\s*([A-Za-z0-9\-()' ]+)",
+        r"YARIETE\s*[:\-]?\s*([A-Za-z0-9\-()' ]+)"
+    ],
+    'calibre': [
+        r"Cal(?:ibre|\.)?\s*[:\-]?\s*([0-9]{1,3}(?:/[0-9]{1,3})?)",
+        r"Cal(?:ibre|\.)?\s*[:\-]?\s*([0-9]{1,3})",
+        r"([0-9]{1,3}/[0-9]{1,3})\s*mm",
+        r"([0-9]{1,3})\s*mm"
+    ],
+    'category': [
+        r"Cat(?:égorie|egorie|\.|:)?\s*[:\-]?\s*([A-Za-z0-9]+)",
+        r"CAT\s*[:\-]?\s*([A-Za-z0-9]+)"
+    ],
+    'count': [
+        r"Nombre\s*[:\-]?\s*([0-9]+)\s*Pcs?",
+        r"Nombre\s*[:\-]?\s*([0-9]+)",
+        r"([0-9]+)\s*Pcs"
+    ],
+    'origin': [
+        r"ORIGINE\s*[:\-]?\s*([A-ZÉÈA-ZéèçÉÈÇ ]+)",
+        r"Origine\s*[:\-]?\s*([A-Za-z\-éèçÉÈÇ ]+)",
+        r"Origine\s*([A-Za-z\-éèçÉÈÇ ]+)",  # sans deux-points ni tiret
+        r"Origin[eé]?\s*[:\-]?\s*([A-Za-z\- ]+)",
+        r"Agriculture\s*[:\-]?\s*([A-Za-z\- ]+)"
+    ],
+    'lot': [
+        r"Lot\s*[:\-]?\s*([A-Za-z0-9\-]+)",
+        r"N[°ºo]?\s*Lot\.?\s*[:\-]?\s*([A-Za-z0-9\-]+)",
+        r"Code Lot\s*[:\-]?\s*([A-Za-z0-9\-]+)",
+        r"Lot\.?\s*([0-9]{4,})"
+    ],
+    'emb': [
+        r"EMB\s*[:\-]?\s*([A-Za-z0-9\-]+)",
+        r"Emballe\s*[:\-]?\s*([A-Za-z0-9\-]+)",
+        r"Emb\.?\s*([A-Za-z0-9\-]+)"
+    ],
+    'ean': [
+        r"(\b\d{12,13}\b)",
+        r"EAN\s*[:\-]?\s*(\d{8,13})",
+        r"Code\s*[:\-]?\s*(\d{8,13})",
+        r"GGN\s*[:\-]?\s*(\d{8,13})"
+    ]
+}
+
+
+class _GuardedPattern:
+    """Regex précédée d'un test de sous-chaîne obligatoire (bien moins cher que la regex)."""
+
+    def __init__(self, pattern: str, required: str):
+        self.regex = re.compile(pattern, re.IGNORECASE)
+        self.required = required
+
+    def search(self, text: str):
+        if self.required not in text.lower():
+            return None
+        return self.regex.search(text)
+
+
+# Le motif 'www' backtracke sur tout le texte (coût quadratique) : inutile s'il n'y a pas de 'www'
+_GUARDS = {r"([A-Z][A-Z0-9\- ]{3,})\s+\(?\bwww\b": "www"}
+_FIELD_RES = {
+    key: [
+        _GuardedPattern(p, _GUARDS[p]) if p in _GUARDS else re.compile(p, re.IGNORECASE)
+        for p in pats
+    ]
+    for key, pats in FIELD_PATTERNS.items()
+}
+
+# supprime les mots parasites (sauf pays)
+_ORIGIN_NOISE_RE = re.compile(r"\b(Ne|LOT|LE|LA|DR|EMBALLE|EMBALLÉ|POUR|TRAITE|AVEC|ET|CIRE|E|NET|POIDS|TRAITEMENTS|POST|RÉCOLTE|RECOLTE|PAR|CONDITIONNÉ|CONDITIONNE|POUR|ST|CHARLES|INTERNATIONAL|BP|PERPIGNAN|IMAZALIL|CIRE|CIRE E|CIRE E-903|TRAITE AVEC|TRAITE AVEC IMAZALIL|TRAITE AVEC IMAZALIL ET CIRE E-903)\b", re.IGNORECASE)
+
+COUNTRIES = [
+    'FRANCE', 'ESPAGNE', 'ITALIE', 'MAROC', 'TUNISIE', 'ALLEMAGNE', 'BELGIQUE',
+    'PAYS-BAS', 'PORTUGAL', 'GRECE', 'TURQUIE', 'ISRAEL', 'PÉROU', 'PEROU', 'CHILI', 'AFRIQUE DU SUD'
+]
+
+
+def _trie_regex(words) -> str:
+    """Alternation factorisée en trie (préfixes communs partagés), façon Aho-Corasick."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node):
+        alts = [re.escape(ch) + build(sub) for ch, sub in sorted(node.items()) if ch]
+        if not alts:
+            return ''
+        body = alts[0] if len(alts) == 1 else '(?:' + '|'.join(alts) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+
+# Un seul automate pour tous les pays : la lookahead trouve chaque occurrence (même
+# chevauchante) en une seule passe sur le texte.
+_COUNTRIES_RE = re.compile(r"(?=\b(" + _trie_regex(COUNTRIES) + r")\b)", re.IGNORECASE)
+_COUNTRY_RANK = {c.upper(): i for i, c in enumerate(COUNTRIES)}
+
+_PRODUCT_FALLBACK_RE = re.compile(r"([A-Z][A-Z0-9 \-]{3,40})")
+_VARIETY_TRIM_RE = re.compile(r"^[\(\s]+|[\)\s]+$")
+_CALIBRE_RE = re.compile(r"(\d{1,3}(?:/\d{1,3})?)")
+# remove trailing joined field names (common when OCR misses line breaks)
+_STOPWORDS_RE = re.compile(r"\b(?:Calibre|CAT|Catégorie|Nombre|Lot|EMB|COC|Origin|Origine|EAN|Poids|Net|Date|Code)\b", re.IGNORECASE)
+
+
+def find_country(txt: str) -> Optional[str]:
+    """Premier pays de COUNTRIES (dans l'ordre de la liste) présent dans le texte."""
+    found = set()
+    for m in _COUNTRIES_RE.finditer(txt):
+        rank = _COUNTRY_RANK.get(m.group(1).upper())
+        if rank is None:
+            # casse Unicode exotique : on retrouve le pays par comparaison insensible à la casse
+            rank = next(i for i, c in enumerate(COUNTRIES) if re.fullmatch(c, m.group(1), re.IGNORECASE))
+        found.add(rank)
+    if not found:
+        return None
+    return COUNTRIES[min(found)].capitalize()
+
+
 def parse_ocr_text(text: str) -> Dict[str, Optional[str]]:
     """Parse OCR output from fruit/veg label and return a structured dict.
 
@@ -47,66 +189,11 @@ def parse_ocr_text(text: str) -> Dict[str, Optional[str]]:
     # collapse weird characters and normalize
     txt = text.replace('\u2014', '-')
     txt = txt.replace('\n', ' ')
-    txt = re.sub(r"[|\\/]+", ' ', txt)
-    txt = re.sub(r"\s+", ' ', txt)
-
-    # patterns (ordered) - each is a list of regexes to try
-    patterns = {
-        'product': [
-            r"Produit\s*[:\-]?\s*([A-Za-z0-9\- ]{3,})",
-            r"([A-Z][A-Z0-9\- ]{3,})\s+\(?\bwww\b",
-            r"([A-Z][A-Z0-9\- ]{3,})",
-            r"([A-Z][a-zéèêàâîôûç\- ]{3,})"
-        ],
-        'variety': [
-            r"Vari[eé]t[eé]?\s*[:\-]?\s*([A-Za-z0-9\-()' ]+)",
-            r"Var\.?\s*[:\-]?\s*([A-Za-z0-9\-()' ]+)",
-            r"YARIETE\s*[:\-]?\s*([A-Za-z0-9\-()' ]+)"
-        ],
-        'calibre': [
-            r"Cal(?:ibre|\.)?\s*[:\-]?\s*([0-9]{1,3}(?:/[0-9]{1,3})?)",
-            r"Cal(?:ibre|\.)?\s*[:\-]?\s*([0-9]{1,3})",
-            r"([0-9]{1,3}/[0-9]{1,3})\s*mm",
-            r"([0-9]{1,3})\s*mm"
-        ],
-        'category': [
-            r"Cat(?:égorie|egorie|\.|:)?\s*[:\-]?\s*([A-Za-z0-9]+)",
-            r"CAT\s*[:\-]?\s*([A-Za-z0-9]+)"
-        ],
-        'count': [
-            r"Nombre\s*[:\-]?\s*([0-9]+)\s*Pcs?",
-            r"Nombre\s*[:\-]?\s*([0-9]+)",
-            r"([0-9]+)\s*Pcs"
-        ],
-        'origin': [
-            r"ORIGINE\s*[:\-]?\s*([A-ZÉÈA-ZéèçÉÈÇ ]+)",
-            r"Origine\s*[:\-]?\s*([A-Za-z\-éèçÉÈÇ ]+)",
-            r"Origine\s*([A-Za-z\-éèçÉÈÇ ]+)",  # sans deux-points ni tiret
-            r"Origin[eé]?\s*[:\-]?\s*([A-Za-z\- ]+)",
-            r"Agriculture\s*[:\-]?\s*([A-Za-z\- ]+)"
-        ],
-        'lot': [
-            r"Lot\s*[:\-]?\s*([A-Za-z0-9\-]+)",
-            r"N[°ºo]?\s*Lot\.?\s*[:\-]?\s*([A-Za-z0-9\-]+)",
-            r"Code Lot\s*[:\-]?\s*([A-Za-z0-9\-]+)",
-            r"Lot\.?\s*([0-9]{4,})"
-        ],
-        'emb': [
-            r"EMB\s*[:\-]?\s*([A-Za-z0-9\-]+)",
-            r"Emballe\s*[:\-]?\s*([A-Za-z0-9\-]+)",
-            r"Emb\.?\s*([A-Za-z0-9\-]+)"
-        ],
-        'ean': [
-            r"(\b\d{12,13}\b)",
-            r"EAN\s*[:\-]?\s*(\d{8,13})",
-            r"Code\s*[:\-]?\s*(\d{8,13})",
-            r"GGN\s*[:\-]?\s*(\d{8,13})"
-        ]
-    }
-
+    txt = _SEPARATORS_RE.sub(' ', txt)
+    txt = _SPACES_RE.sub(' ', txt)
 
     result = {}
-    for key, pats in patterns.items():
+    for key, pats in _FIELD_RES.items():
         val = extract_field(pats, txt)
         if val:
             result[key] = val
@@ -116,49 +203,32 @@ def parse_ocr_text(text: str) -> Dict[str, Optional[str]]:
     # Nettoyage du champ origin pour éviter de capturer 'Ne', 'LOT', etc.
     if result.get('origin'):
         val = result['origin']
-        # supprime les mots parasites (sauf pays)
-        val = re.sub(r"\b(Ne|LOT|LE|LA|DR|EMBALLE|EMBALLÉ|POUR|TRAITE|AVEC|ET|CIRE|E|NET|POIDS|TRAITEMENTS|POST|RÉCOLTE|RECOLTE|PAR|CONDITIONNÉ|CONDITIONNE|POUR|ST|CHARLES|INTERNATIONAL|BP|PERPIGNAN|IMAZALIL|CIRE|CIRE E|CIRE E-903|TRAITE AVEC|TRAITE AVEC IMAZALIL|TRAITE AVEC IMAZALIL ET CIRE E-903)\b", '', val, flags=re.IGNORECASE)
+        val = _ORIGIN_NOISE_RE.sub('', val)
         val = val.strip(' ,:-')
         # Si vide, on laisse None
         result['origin'] = val if val else None
 
     # Fallback : si pas d'origine, cherche un pays connu seul dans le texte
+    # (précédé ou non de 'Origine' : même résultat, une seule recherche suffit)
     if not result.get('origin') or not result['origin']:
-        countries = [
-            'FRANCE', 'ESPAGNE', 'ITALIE', 'MAROC', 'TUNISIE', 'ALLEMAGNE', 'BELGIQUE',
-            'PAYS-BAS', 'PORTUGAL', 'GRECE', 'TURQUIE', 'ISRAEL', 'PÉROU', 'PEROU', 'CHILI', 'AFRIQUE DU SUD'
-        ]
-        for c in countries:
-            # cherche le pays seul ou précédé de 'Origine' sans deux-points
-            if re.search(rf"(?:Origine\s+)?\b{c}\b", txt, flags=re.IGNORECASE):
-                result['origin'] = c.capitalize()
-                break
-
-    # Fallback pour l'origine : détecte pays connus même sans label
-    if not result.get('origin') or not result['origin']:
-        countries = [
-            'FRANCE', 'ESPAGNE', 'ITALIE', 'MAROC', 'TUNISIE', 'ALLEMAGNE', 'BELGIQUE',
-            'PAYS-BAS', 'PORTUGAL', 'GRECE', 'TURQUIE', 'ISRAEL', 'PÉROU', 'PEROU', 'CHILI', 'AFRIQUE DU SUD'
-        ]
-        for c in countries:
-            if re.search(rf"\b{c}\b", txt, flags=re.IGNORECASE):
-                result['origin'] = c.capitalize()
-                break
+        country = find_country(txt)
+        if country:
+            result['origin'] = country
 
     # product: try to capture a leading uppercase phrase if not found
     if not result.get('product'):
-        m = re.search(r"([A-Z][A-Z0-9 \-]{3,40})", text)
+        m = _PRODUCT_FALLBACK_RE.search(text)
         if m:
             result['product'] = normalize_spaces(m.group(1))
 
     # lightweight normalization
     if result.get('variety'):
         # remove surrounding parentheses and stray commas
-        result['variety'] = re.sub(r"^[\(\s]+|[\)\s]+$", '', result['variety']).strip(', ')
+        result['variety'] = _VARIETY_TRIM_RE.sub('', result['variety']).strip(', ')
 
     if result.get('calibre'):
         # keep only numeric part or fraction
-        m = re.search(r"(\d{1,3}(?:/\d{1,3})?)", result['calibre'])
+        m = _CALIBRE_RE.search(result['calibre'])
         if m:
             result['calibre'] = m.group(1)
 
@@ -167,12 +237,10 @@ def parse_ocr_text(text: str) -> Dict[str, Optional[str]]:
         if isinstance(v, str):
             result[k] = v.strip()
 
-    # remove trailing joined field names (common when OCR misses line breaks)
-    stopwords = r"\b(?:Calibre|CAT|Catégorie|Nombre|Lot|EMB|COC|Origin|Origine|EAN|Poids|Net|Date|Code)\b"
     for key in ('variety', 'origin', 'product'):
         val = result.get(key)
         if val:
-            m = re.search(stopwords, val, flags=re.IGNORECASE)
+            m = _STOPWORDS_RE.search(val)
             if m:
                 # cut everything from the stopword onwards
                 result[key] = val[:m.start()].strip(' ,:-')
@@ -0,0 +1,181 @@
+import math
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+# --- Configuration ---
+# Mise à l'échelle avant Tesseract : "auto" (d'après la hauteur de texte estimée) ou un
+# facteur fixe ("2" = ancien comportement, agrandissement x2 systématique)
+OCR_SCALE = os.getenv("OCR_SCALE", "auto")
+# Hauteur de caractère visée en pixels (Tesseract lit le mieux autour de 30 px)
+OCR_TEXT_HEIGHT = float(os.getenv("OCR_TEXT_HEIGHT", "32"))
+# Bornes du facteur d'échelle automatique
+OCR_MIN_SCALE = float(os.getenv("OCR_MIN_SCALE", "0.25"))
+OCR_MAX_SCALE = float(os.getenv("OCR_MAX_SCALE", "2.0"))
+# Taille max de l'image passée à Tesseract (pixels, 0 = sans limite)
+OCR_MAX_PIXELS = int(float(os.getenv("OCR_MAX_PIXELS", "8e6")))
+# Texte non mesurable (trop peu de caractères détectés) : plus grand côté visé
+OCR_FALLBACK_SIDE = int(os.getenv("OCR_FALLBACK_SIDE", "2400"))
+# Étapes après le passage en niveaux de gris, dans cet ordre : resize, threshold, denoise
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "resize,threshold,denoise")
+
+STEPS = ("resize", "threshold", "denoise")
+# Estimation de la hauteur de texte sur une réduction de l'image (plus grand côté, px)
+_ESTIMATE_SIDE = 1600
+# Composantes retenues comme caractères : au moins ce nombre, sinon estimation abandonnée
+_MIN_CHARACTERS = 8
+
+
+def parse_steps(spec: str) -> Tuple[str, ...]:
+    steps = tuple(s.strip() for s in (spec or "").split(",") if s.strip())
+    inconnues = [s for s in steps if s not in STEPS]
+    if inconnues:
+        raise ValueError(f"OCR_PREPROCESS : étape(s) inconnue(s) {', '.join(inconnues)} (choix : {', '.join(STEPS)})")
+    return steps
+
+
+def _character_components(binary: np.ndarray) -> np.ndarray:
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    stats = stats[1:]
+    heights = stats[:, cv2.CC_STAT_HEIGHT]
+    widths = stats[:, cv2.CC_STAT_WIDTH]
+    areas = stats[:, cv2.CC_STAT_AREA]
+    characters = (
+        (heights >= 4)
+        & (heights <= binary.shape[0] * 0.2)
+        & (widths <= heights * 1.5)
+        & (widths * 8 >= heights)
+        & (areas >= 0.1 * heights * widths)
+        & (areas <= 0.95 * heights * widths)
+    )
+    return stats[characters]
+
+
+def find_characters(gray: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Composantes en forme de caractère : lignes (x, y, largeur, hauteur, aire) de
+    `connectedComponentsWithStats`, mesurées sur une réduction de facteur f (rendu aussi).
+
+    Seuillage adaptatif (encre plus sombre que son voisinage) : une étiquette claire sur un
+    fond de caisse ou de palette est traitée comme un fond uni. On garde les composantes aux
+    proportions, remplissage et taille plausibles pour un caractère.
+    """
+    h, w = gray.shape[:2]
+    f = min(1.0, _ESTIMATE_SIDE / max(h, w))
+    # INTER_LINEAR : plusieurs fois plus rapide que INTER_AREA, suffisant pour mesurer des hauteurs
+    small = cv2.resize(gray, None, fx=f, fy=f, interpolation=cv2.INTER_LINEAR) if f < 1.0 else gray
+    bloc = max(15, (min(small.shape[:2]) // 40) | 1)
+    binary = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, bloc, 15)
+    characters = _character_components(binary)
+    if len(characters) < _MIN_CHARACTERS:
+        # Texte clair sur fond sombre
+        binary = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, bloc, -15)
+        inverse = _character_components(binary)
+        if len(inverse) > len(characters):
+            characters = inverse
+    return characters, f
+
+
+def estimate_text_height(gray: np.ndarray) -> Optional[float]:
+    """Hauteur médiane des caractères en pixels (image d'origine), None si non mesurable."""
+    characters, f = find_characters(gray)
+    if len(characters) < _MIN_CHARACTERS:
+        return None
+    return float(np.median(characters[:, cv2.CC_STAT_HEIGHT])) / f
+
+
+class Preprocessor:
+    """Niveaux de gris, mise à l'échelle vers une hauteur de texte cible, seuillage, débruitage.
+
+    Les tampons de sortie sont réutilisés d'un appel à l'autre dans un même thread (les
+    captures d'un même téléphone ont toutes la même taille) : l'image rendue par `run` n'est
+    valable que jusqu'au prochain appel dans ce thread, le temps de l'OCR.
+    """
+
+    def __init__(self, scale: str = OCR_SCALE, text_height: float = OCR_TEXT_HEIGHT,
+                 min_scale: float = OCR_MIN_SCALE, max_scale: float = OCR_MAX_SCALE,
+                 max_pixels: int = OCR_MAX_PIXELS, fallback_side: int = OCR_FALLBACK_SIDE,
+                 steps: str = OCR_PREPROCESS):
+        self.scale = str(scale).strip().lower()
+        self.fixed_scale = None if self.scale == "auto" else float(self.scale)
+        self.text_height = text_height
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.max_pixels = max_pixels
+        self.fallback_side = fallback_side
+        self.steps = parse_steps(steps)
+        self._local = threading.local()
+
+    def _buffer(self, name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buf = buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = buffers[name] = np.empty(shape, dtype=dtype)
+        return buf
+
+    def choose_scale(self, gray: np.ndarray, text_height: Optional[float] = None) -> Tuple[float, Optional[float]]:
+        """(facteur d'échelle, hauteur de texte estimée ou None) ; `text_height` : déjà mesurée."""
+        h, w = gray.shape[:2]
+        if self.fixed_scale is not None:
+            return self.fixed_scale, None
+        text_height = text_height or estimate_text_height(gray)
+        if text_height:
+            scale = self.text_height / text_height
+        else:
+            scale = self.fallback_side / max(h, w)
+        scale = min(self.max_scale, max(self.min_scale, scale))
+        if self.max_pixels and h * w * scale * scale > self.max_pixels:
+            scale = math.sqrt(self.max_pixels / (h * w))
+        # Écart négligeable : pas de rééchantillonnage (il coûterait sans rien apporter)
+        if abs(scale - 1.0) < 0.1:
+            scale = 1.0
+        return scale, text_height
+
+    def run(self, img: np.ndarray, info: Optional[Dict[str, Any]] = None, text_height: Optional[float] = None) -> np.ndarray:
+        """Image prête pour Tesseract ; `info` reçoit l'échelle appliquée et la hauteur estimée.
+
+        `text_height` : hauteur de caractère déjà connue (zone de texte détectée), pas de nouvelle estimation.
+        """
+        if img.ndim == 3:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=self._buffer("gray", img.shape[:2]))
+        else:
+            gray = img
+        scale = 1.0
+        if "resize" in self.steps:
+            scale, text_height = self.choose_scale(gray, text_height)
+        out = gray
+        for step in self.steps:
+            if step == "resize" and scale != 1.0:
+                h, w = out.shape[:2]
+                size = (max(1, round(w * scale)), max(1, round(h * scale)))
+                # INTER_AREA seulement pour les fortes réductions (lent hors facteurs entiers)
+                interpolation = cv2.INTER_CUBIC if scale > 1.0 else cv2.INTER_LINEAR if scale >= 0.5 else cv2.INTER_AREA
+                out = cv2.resize(out, size, dst=self._buffer("resized", size[::-1]), interpolation=interpolation)
+            elif step == "threshold":
+                # Sur place, sauf si `out` est encore l'image de l'appelant
+                dst = out if out is not img else self._buffer("binary", out.shape)
+                out = cv2.threshold(out, 100, 230, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=dst)[1]
+            elif step == "denoise":
+                out = cv2.medianBlur(out, 3, dst=self._buffer("denoised", out.shape))
+        if info is not None:
+            info.update(scale=round(scale, 3), text_height=round(text_height, 1) if text_height else None, shape=out.shape[:2])
+        return out
+
+
+_preprocessor = Preprocessor()
+
+
+def run(img: np.ndarray, info: Optional[Dict[str, Any]] = None, text_height: Optional[float] = None) -> np.ndarray:
+    return _preprocessor.run(img, info, text_height)
+
+
+def configure(**options) -> Preprocessor:
+    """Remplace les réglages de prétraitement (benchmarks) ; mêmes paramètres que `Preprocessor`."""
+    global _preprocessor
+    _preprocessor = Preprocessor(**options)
+    return _preprocessor
@@ -0,0 +1,96 @@
+import os
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from preprocess import find_characters
+
+
+# --- Configuration ---
+# Contrôle qualité avant l'OCR : photo floue, mal exposée ou sans texte lisible = réponse
+# "retake" immédiate au lieu de l'OCR et des appels LLM (0 = désactivé)
+QUALITY_GATE = os.getenv("QUALITY_GATE", "1") == "1"
+# Netteté minimale : variance du laplacien sur l'image ramenée à 1600 px de côté, ramenée à un
+# contraste encre / fond de 100 (une photo sombre mais nette n'est pas prise pour une photo floue)
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "25"))
+# Luminosité moyenne acceptée (0-255) et part maximale de pixels saturés (blanc brûlé ou noir
+# bouché) : ne rejettent une photo que si aucun texte n'y est lisible (un fond blanc pur avec
+# du texte net passe)
+QUALITY_MIN_BRIGHTNESS = float(os.getenv("QUALITY_MIN_BRIGHTNESS", "35"))
+QUALITY_MAX_BRIGHTNESS = float(os.getenv("QUALITY_MAX_BRIGHTNESS", "245"))
+QUALITY_MAX_CLIPPED = float(os.getenv("QUALITY_MAX_CLIPPED", "0.6"))
+# Texte : nombre minimal de caractères détectés et hauteur minimale (px, image d'origine)
+QUALITY_MIN_CHARACTERS = int(os.getenv("QUALITY_MIN_CHARACTERS", "8"))
+QUALITY_MIN_TEXT_HEIGHT = float(os.getenv("QUALITY_MIN_TEXT_HEIGHT", "8"))
+# Écart minimal entre les niveaux de gris moyens de l'encre et du fond (seuil d'Otsu) : en
+# dessous, les "caractères" détectés sont du bruit (surface unie, grain du capteur)
+QUALITY_MIN_CONTRAST = float(os.getenv("QUALITY_MIN_CONTRAST", "30"))
+
+# Côté de l'image réduite sur laquelle tout est mesuré (même échelle que preprocess)
+_SIDE = 1600
+
+MESSAGES = {
+    "too_dark": "Photo trop sombre : éclairer l'étiquette et reprendre la photo.",
+    "overexposed": "Photo surexposée (reflet ou flash) : changer d'angle et reprendre la photo.",
+    "blurry": "Photo floue : stabiliser le téléphone, faire la mise au point et reprendre la photo.",
+    "no_text": "Aucun texte détecté : cadrer l'étiquette et reprendre la photo.",
+    "text_too_small": "Texte trop petit : se rapprocher de l'étiquette et reprendre la photo.",
+}
+
+
+def measure(img: np.ndarray) -> Dict[str, Any]:
+    """Netteté, exposition et texte détecté, sur une réduction en niveaux de gris (quelques ms)."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    h, w = gray.shape[:2]
+    f = min(1.0, _SIDE / max(h, w))
+    small = cv2.resize(gray, None, fx=f, fy=f, interpolation=cv2.INTER_LINEAR) if f < 1.0 else gray
+    histogram = cv2.calcHist([small], [0], None, [256], [0, 256]).ravel()
+    clipped = (histogram[:6].sum() + histogram[250:].sum()) / small.size
+    # Contraste encre / fond : moyennes des deux classes séparées par le seuil d'Otsu
+    seuil = int(cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[0])
+    niveaux = np.arange(256)
+    sombre, clair = histogram[:seuil + 1], histogram[seuil + 1:]
+    contrast = float(
+        (niveaux[seuil + 1:] @ clair) / clair.sum() - (niveaux[:seuil + 1] @ sombre) / sombre.sum()
+        if sombre.sum() and clair.sum() else 0.0
+    )
+    characters, _ = find_characters(small)
+    text_height = float(np.median(characters[:, cv2.CC_STAT_HEIGHT])) / f if len(characters) else None
+    sharpness = float(cv2.Laplacian(small, cv2.CV_64F).var())
+    if contrast >= 1:
+        sharpness *= (100 / contrast) ** 2
+    return {
+        "sharpness": round(sharpness, 1),
+        "brightness": round(float(small.mean()), 1),
+        "clipped": round(float(clipped), 3),
+        "contrast": round(contrast, 1),
+        "characters": int(len(characters)),
+        "text_height": round(text_height, 1) if text_height else None,
+    }
+
+
+def verdict(values: Dict[str, Any]) -> Optional[str]:
+    """Raison du rejet (clé de MESSAGES), None si la photo peut partir à l'OCR."""
+    texte = values["characters"] >= QUALITY_MIN_CHARACTERS and values["contrast"] >= QUALITY_MIN_CONTRAST
+    if not texte:
+        # Pas de texte lisible : on donne la cause la plus probable
+        if values["brightness"] < QUALITY_MIN_BRIGHTNESS:
+            return "too_dark"
+        if values["brightness"] > QUALITY_MAX_BRIGHTNESS or values["clipped"] > QUALITY_MAX_CLIPPED:
+            return "overexposed"
+        if values["sharpness"] < QUALITY_MIN_SHARPNESS:
+            return "blurry"
+        return "no_text"
+    if values["sharpness"] < QUALITY_MIN_SHARPNESS:
+        return "blurry"
+    if values["text_height"] is not None and values["text_height"] < QUALITY_MIN_TEXT_HEIGHT:
+        return "text_too_small"
+    return None
+
+
+def check(img: np.ndarray) -> Dict[str, Any]:
+    """`{"ok", "reason", "message", "metrics"}` pour une image décodée (BGR ou niveaux de gris)."""
+    values = measure(img)
+    reason = verdict(values)
+    return {"ok": reason is None, "reason": reason, "message": MESSAGES.get(reason), "metrics": values}
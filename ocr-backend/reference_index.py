@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import math
+import os
+import pickle
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Hashable, Optional, Tuple
+
+
+logger = logging.getLogger("ocr-backend")
+
+# --- Configuration ---
+EXCEL_FILE = 'Data/source_sans_doublons.xlsx'
+FILTRE_DEST = 'BASE LOGISTIQUE'
+# Snapshot binaire de l'index (reconstruit quand le hash du classeur change)
+REFERENCE_SNAPSHOT = os.getenv("REFERENCE_SNAPSHOT", "Data/reference_index.pickle")
+# À incrémenter à chaque changement de la structure de ReferenceIndex
+SNAPSHOT_VERSION = 1
+
+# Colonnes de Normalisation_occurrences qui rendent un contrôle réglementaire applicable
+COLONNES_REGLEMENTAIRES = (
+    "Couleur",
+    "CODE CALIBRE",
+    "CODE CATEGORIE",
+    "CODE TRAITEMENT CHIMIQUE",
+    "MENTIONS complementaires",
+)
+
+
+def renseigne(valeur) -> bool:
+    """Équivalent de `pd.notna(v) and str(v).strip() != ""`, sans pandas."""
+    if valeur is None:
+        return False
+    if isinstance(valeur, float) and math.isnan(valeur):
+        return False
+    return str(valeur).strip() != ""
+
+
+@dataclass(frozen=True, eq=False)
+class ReferenceIndex:
+    """Index immuable des règles du classeur de référence, construit une seule fois.
+
+    Toutes les recherches faites par `verif` sont des accès dict / set en O(1) :
+    plus aucun filtrage pandas dans le chemin d'une requête. Comparé par identité
+    (une version de la référence = une instance), ce qui permet de l'utiliser comme clé.
+    """
+
+    # ID : "FAMILLE | SOUS-FAMILLE" (liste proposée au LLM, dans l'ordre du classeur)
+    familles: Dict[int, str]
+    # (FAMILLE, SOUS-FAMILLE) strippées -> première ligne de Normalisation_occurrences
+    regles_famille: Dict[Tuple[str, str], Dict[str, Any]]
+    # ID -> lignes de règles (records tels que passés dans les prompts)
+    calibres: Dict[Hashable, Tuple[Dict[str, Any], ...]]
+    traitements: Dict[Hashable, Tuple[Dict[str, Any], ...]]
+    mentions: Dict[Hashable, Tuple[Dict[str, Any], ...]]
+    # ID catégorie -> codes catégorie autorisés (en minuscules)
+    categories: Dict[Hashable, FrozenSet[str]]
+    # Codes pays ISO numériques, ISO 2 et ISO 3
+    codes_iso: FrozenSet[Hashable]
+    # sha256 du classeur source (invalidation des caches dérivés)
+    source_hash: str = ""
+
+    def regle_famille(self, famille: Optional[str], sous_famille: Optional[str]) -> Optional[Dict[str, Any]]:
+        if famille is None or sous_famille is None:
+            return None
+        return self.regles_famille.get((famille.strip(), sous_famille.strip()))
+
+
+def _nettoyer(df):
+    """Retire les espaces de début / fin de toutes les cellules texte."""
+    from pandas.api.types import is_string_dtype
+
+    for colonne in df.columns:
+        if is_string_dtype(df[colonne].dtype):
+            df[colonne] = df[colonne].map(lambda v: v.strip() if isinstance(v, str) else v)
+    return df
+
+
+def _records_par_id(df, colonne_id) -> Dict[Hashable, Tuple[Dict[str, Any], ...]]:
+    groupes: Dict[Hashable, list] = {}
+    for record in df.to_dict(orient="records"):
+        cle = record[colonne_id]
+        if not renseigne(cle):
+            continue
+        groupes.setdefault(cle, []).append(record)
+    return {cle: tuple(records) for cle, records in groupes.items()}
+
+
+def hash_classeur(excel_file: str = EXCEL_FILE) -> str:
+    sha = hashlib.sha256()
+    with open(excel_file, "rb") as f:
+        for bloc in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloc)
+    return sha.hexdigest()
+
+
+def build_reference_index(excel_file: str = EXCEL_FILE) -> ReferenceIndex:
+    """Lit le classeur (pandas, une seule fois) et construit l'index."""
+    import pandas as pd
+
+    # --- Chargement des feuilles de référence ---
+    # (une seule lecture du fichier pour toutes les feuilles)
+    feuilles = pd.read_excel(
+        excel_file,
+        sheet_name=['Pays', 'Calibre', 'Catégorie', 'Traitement', 'Mentions', 'Normalisation_occurrences'],
+    )
+    df_pays = _nettoyer(feuilles['Pays'])
+    df_calibre = _nettoyer(feuilles['Calibre'])
+    df_categorie = _nettoyer(feuilles['Catégorie'])
+    df_traitement = _nettoyer(feuilles['Traitement'])
+    df_mentions = _nettoyer(feuilles['Mentions'])
+
+    # --- Chargement et Filtrage (Normalisation_occurrences) ---
+    df_norm_occ = _nettoyer(feuilles['Normalisation_occurrences'])
+    # Nettoyage des espaces et filtrage
+    df_norm_occ['DESTINATION'] = df_norm_occ['DESTINATION'].astype(str).str.strip()
+    df_norm_occ = df_norm_occ[df_norm_occ['DESTINATION'] == FILTRE_DEST].copy()
+    # Nettoyage de la colonne FAMILLE pour éviter les doublons d'espaces
+    df_norm_occ['FAMILLE'] = df_norm_occ['FAMILLE'].astype(str).str.strip()
+
+    # Dictionnaire ID : "FAMILLE | SOUS-FAMILLE" (combinaisons sans doublons)
+    combinaisons = (
+        df_norm_occ[["FAMILLE", "SOUS-FAMILLE"]]
+        .drop_duplicates()
+        .reset_index(drop=True)
+    )
+    familles = {
+        i + 1: f"{famille} | {sous_famille}"
+        for i, (famille, sous_famille) in enumerate(zip(combinaisons["FAMILLE"].tolist(), combinaisons["SOUS-FAMILLE"].tolist()))
+    }
+
+    # Première ligne de règles pour chaque couple FAMILLE / SOUS-FAMILLE
+    regles_famille: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for record in df_norm_occ.to_dict(orient="records"):
+        cle = (str(record["FAMILLE"]).strip(), str(record["SOUS-FAMILLE"]).strip())
+        regles_famille.setdefault(cle, record)
+
+    categories: Dict[Hashable, set] = {}
+    for id_categorie, code in zip(df_categorie['ID categorie'].tolist(), df_categorie['Code Categorie'].tolist()):
+        if not renseigne(id_categorie):
+            continue
+        codes = categories.setdefault(id_categorie, set())
+        if renseigne(code):
+            codes.add(str(code).lower())
+
+    codes_iso = set()
+    for colonne in ('Code ISO Numérique', 'Code ISO 2', 'Code ISO 3'):
+        codes_iso.update(df_pays[colonne].dropna().unique().tolist())
+
+    return ReferenceIndex(
+        familles=familles,
+        regles_famille=regles_famille,
+        calibres=_records_par_id(df_calibre, 'ID Calibre'),
+        traitements=_records_par_id(df_traitement, 'ID Traitement'),
+        mentions=_records_par_id(df_mentions, 'ID mentions'),
+        categories={cle: frozenset(codes) for cle, codes in categories.items()},
+        codes_iso=frozenset(codes_iso),
+        source_hash=hash_classeur(excel_file),
+    )
+
+
+def _ecrire_snapshot(index: ReferenceIndex, snapshot_path: str):
+    dossier = os.path.dirname(snapshot_path) or "."
+    os.makedirs(dossier, exist_ok=True)
+    # Écriture atomique : un autre worker ne lit jamais un fichier à moitié écrit
+    tmp = f"{snapshot_path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(
+            {"version": SNAPSHOT_VERSION, "source_hash": index.source_hash, "index": index},
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(tmp, snapshot_path)
+
+
+def _lire_snapshot(snapshot_path: str, source_hash: str) -> Optional[ReferenceIndex]:
+    try:
+        with open(snapshot_path, "rb") as f:
+            contenu = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Snapshot de référence illisible (%s), reconstruction", e)
+        return None
+    if contenu.get("version") != SNAPSHOT_VERSION or contenu.get("source_hash") != source_hash:
+        return None
+    return contenu["index"]
+
+
+def load_reference_index(excel_file: str = EXCEL_FILE, snapshot_path: str = REFERENCE_SNAPSHOT) -> ReferenceIndex:
+    """Charge l'index depuis le snapshot si le classeur n'a pas changé (quelques ms),
+    sinon le reconstruit depuis le classeur et réécrit le snapshot."""
+    start = time.perf_counter()
+    source_hash = hash_classeur(excel_file)
+    if snapshot_path:
+        index = _lire_snapshot(snapshot_path, source_hash)
+        if index is not None:
+            logger.info("Référence chargée depuis %s (%.3fs)", snapshot_path, time.perf_counter() - start)
+            return index
+
+    index = build_reference_index(excel_file)
+    if snapshot_path:
+        try:
+            _ecrire_snapshot(index, snapshot_path)
+        except OSError as e:
+            logger.warning("Écriture du snapshot %s impossible : %s", snapshot_path, e)
+    logger.info("Référence construite depuis %s (%.3fs)", excel_file, time.perf_counter() - start)
+    return index
+
+
+if __name__ == "__main__":
+    # Étape de build : python reference_index.py [classeur.xlsx] [snapshot.pickle]
+    import sys
+
+    # Import par nom de module : le pickle doit référencer reference_index.ReferenceIndex,
+    # pas __main__.ReferenceIndex
+    import reference_index
+
+    logging.basicConfig(level=logging.INFO)
+    excel = sys.argv[1] if len(sys.argv) > 1 else EXCEL_FILE
+    snapshot = sys.argv[2] if len(sys.argv) > 2 else REFERENCE_SNAPSHOT
+    index = reference_index.build_reference_index(excel)
+    reference_index._ecrire_snapshot(index, snapshot)
+    print(f"Snapshot écrit : {snapshot} ({len(index.familles)} familles, hash {index.source_hash[:12]})")
@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import verif
+from reference_index import EXCEL_FILE, load_reference_index
+from result_cache import scan_cache
+
+
+logger = logging.getLogger("ocr-backend")
+
+# --- Configuration ---
+# Intervalle de surveillance du classeur (secondes, 0 = pas de surveillance) : chaque worker
+# recharge de lui-même, ce qui propage une mise à jour à tous les workers gunicorn
+REFERENCE_WATCH_INTERVAL = float(os.getenv("REFERENCE_WATCH_INTERVAL", "30"))
+
+
+_reload_lock = threading.Lock()
+_last_reload: Dict[str, Any] = {}
+
+
+def reload(force: bool = False) -> Dict[str, Any]:
+    """Reconstruit l'index de référence puis le met en service d'un coup.
+
+    La construction (lecture du classeur, matcher famille) se fait avant le swap : les
+    requêtes continuent sur l'ancienne version pendant ce temps, et une vérification déjà
+    commencée la garde jusqu'au bout. Si le classeur a changé, les caches calculés avec
+    l'ancienne version (verdicts LLM, résultats de scan) sont vidés.
+    """
+    with _reload_lock:
+        start = time.perf_counter()
+        ancien = verif.get_reference()
+        nouveau = load_reference_index(EXCEL_FILE)
+        changed = nouveau.source_hash != ancien.source_hash
+        if changed or force:
+            verif.set_reference(verif.preparer_reference(nouveau))
+            if changed:
+                # Verdicts déjà vidés par preparer_reference (tier mémoire de ce processus + SQLite)
+                scan_cache.clear()
+        _last_reload.update(
+            at=time.time(),
+            seconds=round(time.perf_counter() - start, 3),
+            changed=changed,
+            source_hash=verif.get_reference().source_hash,
+        )
+        if changed:
+            logger.info(
+                "Référence rechargée (%s -> %s, %.2fs)",
+                ancien.source_hash[:12], nouveau.source_hash[:12], _last_reload["seconds"],
+            )
+        return dict(_last_reload)
+
+
+def status() -> Dict[str, Any]:
+    reference = verif.get_reference()
+    return {
+        "source_hash": reference.source_hash,
+        "familles": len(reference.familles),
+        "watch_interval": REFERENCE_WATCH_INTERVAL,
+        "last_reload": dict(_last_reload) or None,
+    }
+
+
+def _signature(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _watch(interval: float, signature: Optional[tuple]):
+    while True:
+        time.sleep(interval)
+        courante = _signature(EXCEL_FILE)
+        if courante is None or courante == signature:
+            continue
+        signature = courante
+        try:
+            reload()
+        except Exception:
+            # Classeur en cours d'écriture ou invalide : on garde la version en service
+            logger.exception("Rechargement de la référence impossible")
+            signature = None
+
+
+_watcher: Optional[threading.Thread] = None
+
+
+def start_watcher(interval: float = REFERENCE_WATCH_INTERVAL):
+    """Surveille le classeur (mtime / taille) et recharge quand il change."""
+    global _watcher
+    if interval <= 0 or _watcher is not None:
+        return
+    _watcher = threading.Thread(
+        target=_watch, args=(interval, _signature(EXCEL_FILE)), name="reference-watcher", daemon=True
+    )
+    _watcher.start()
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+# --- Configuration ---
+SCAN_CACHE_SIZE = int(os.getenv("SCAN_CACHE_SIZE", "256"))  # 0 = cache désactivé
+SCAN_CACHE_TTL = float(os.getenv("SCAN_CACHE_TTL", "3600"))  # secondes
+# Tier disque optionnel (partagé entre workers uvicorn, survit aux redémarrages)
+SCAN_CACHE_DB = os.getenv("SCAN_CACHE_DB", "")
+
+# Flags qui changent le résultat d'un scan : ils font partie de la clé
+CACHE_FLAGS = ("use_mistral", "use_paddle", "use_doctr", "use_llm", "use_ollama")
+
+
+def content_digest(img_bytes: bytes) -> str:
+    """sha256 du contenu : calculé une fois par requête (clé de cache et nom de la capture)."""
+    return hashlib.sha256(img_bytes).hexdigest()
+
+
+def cache_key(img_bytes: Optional[bytes], digest: Optional[str] = None, **flags) -> str:
+    """Clé = hash du contenu de l'image (`digest` s'il est déjà calculé) + flags moteur / parser."""
+    digest = digest or content_digest(img_bytes)
+    flags_part = ",".join(f"{k}={int(bool(flags.get(k)))}" for k in CACHE_FLAGS)
+    return f"{digest}:{flags_part}"
+
+
+class _SqliteTier:
+    def __init__(self, path: str, ttl: float, table: str = "scan_results"):
+        self.path = path
+        self.ttl = ttl
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connexion ouverte par processus : jamais partagée à travers le fork des workers
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                " key TEXT PRIMARY KEY, created REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT created, value FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        created, value = row
+        if time.time() - created > self.ttl:
+            return None
+        return json.loads(value)
+
+    def put(self, key: str, value: Any):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, created, value) VALUES (?, ?, ?)",
+                (key, now, json.dumps(value, ensure_ascii=False)),
+            )
+            conn.execute(f"DELETE FROM {self.table} WHERE created < ?", (now - self.ttl,))
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(f"DELETE FROM {self.table}")
+            conn.commit()
+
+
+class ResultCache:
+    """Cache LRU + TTL des résultats `{raw, parsed, errors}` de scan d'étiquette.
+
+    Les re-photos d'une même étiquette et les renvois en arrière-plan de l'app envoient
+    exactement les mêmes octets : on évite alors OCR + parsing LLM + vérifications.
+    """
+
+    def __init__(
+        self,
+        max_size: int = SCAN_CACHE_SIZE,
+        ttl: float = SCAN_CACHE_TTL,
+        db_path: str = SCAN_CACHE_DB,
+        table: str = "scan_results",
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._disk = _SqliteTier(db_path, ttl, table) if db_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+        value = self._disk.get(key) if self._disk else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, value, now)
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._store(key, value, time.monotonic())
+        if self._disk:
+            self._disk.put(key, value)
+
+    def _store(self, key, value, now):
+        self._entries[key] = (now, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self.clear_memory()
+        if self._disk:
+            self._disk.clear()
+
+    def clear_memory(self):
+        """Vide le tier mémoire de ce processus seulement (le tier SQLite est partagé)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "disk": bool(self._disk),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+scan_cache = ResultCache()
@@ -0,0 +1,124 @@
+import builtins
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+
+logger = logging.getLogger("ocr-backend")
+
+# --- Configuration ---
+# Mesure du coût d'import par module au démarrage (équivalent de `python -X importtime`)
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "1") == "1"
+# Nombre de modules listés dans le rapport (les plus coûteux en temps propre)
+STARTUP_PROFILE_TOP = int(os.getenv("STARTUP_PROFILE_TOP", "25"))
+
+
+_started_at = time.perf_counter()
+_lock = threading.Lock()
+_local = threading.local()
+# `__import__` d'origine : jamais remis à None (un import concurrent peut encore passer par
+# `_timed_import` juste après `finish`)
+_original_import = builtins.__import__
+_installed = False
+# module -> [temps propre, temps cumulé (imports imbriqués inclus)]
+_imports: Dict[str, List[float]] = {}
+# étape nommée (import de main, chargement de la référence, warm-up...) -> secondes
+_phases: Dict[str, float] = {}
+_finished_at = None
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level:
+        package = (globals or {}).get("__package__") or ""
+        try:
+            key = importlib.util.resolve_name("." * level + name, package)
+        except (ImportError, ValueError):
+            key = name
+    else:
+        key = name
+    if key in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        cumulative = time.perf_counter() - start
+        children = stack.pop()
+        if stack:
+            stack[-1] += cumulative
+        with _lock:
+            entry = _imports.setdefault(key, [0.0, 0.0])
+            entry[0] += cumulative - children
+            entry[1] += cumulative
+
+
+def install():
+    """Commence à chronométrer les imports (à appeler avant les autres imports de main)."""
+    global _installed
+    if not STARTUP_PROFILE or _installed:
+        return
+    _installed = True
+    builtins.__import__ = _timed_import
+
+
+def finish():
+    """Arrête la mesure (plus aucun surcoût sur les imports faits ensuite) et logue le rapport."""
+    global _installed, _finished_at
+    if _installed:
+        if builtins.__import__ is _timed_import:
+            builtins.__import__ = _original_import
+        _installed = False
+    if _finished_at is None:
+        _finished_at = time.perf_counter()
+        log_report()
+
+
+@contextmanager
+def phase(name: str):
+    """`with startup_profile.phase("reference"): ...` : durée d'une étape de démarrage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _phases[name] = _phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def report(top: int = STARTUP_PROFILE_TOP) -> Dict[str, Any]:
+    with _lock:
+        modules = sorted(_imports.items(), key=lambda kv: kv[1][0], reverse=True)
+        phases = dict(_phases)
+    end = _finished_at if _finished_at is not None else time.perf_counter()
+    return {
+        "finished": _finished_at is not None,
+        "elapsed_seconds": round(end - _started_at, 3),
+        "phases": {name: round(seconds, 3) for name, seconds in phases.items()},
+        "imports": [
+            {"module": module, "self_seconds": round(s, 4), "cumulative_seconds": round(c, 4)}
+            for module, (s, c) in modules[:top]
+        ],
+    }
+
+
+def log_report(top: int = 10):
+    r = report(top)
+    logger.info(
+        "Démarrage : %.2fs | étapes : %s",
+        r["elapsed_seconds"],
+        ", ".join(f"{name}={seconds:.2f}s" for name, seconds in r["phases"].items()) or "-",
+    )
+    for entry in r["imports"]:
+        logger.info(
+            "  import %-40s %.3fs (cumulé %.3fs)",
+            entry["module"], entry["self_seconds"], entry["cumulative_seconds"],
+        )
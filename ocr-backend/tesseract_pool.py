@@ -0,0 +1,171 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+logger = logging.getLogger("ocr-backend")
+
+# --- Configuration ---
+# Nombre de processus OCR Tesseract par worker gunicorn (0 = OCR dans le thread de la requête,
+# comme avant). Défaut : cœurs ÷ WEB_CONCURRENCY, pour ne pas surcharger la machine à plusieurs workers
+_WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "2")))
+TESSERACT_POOL_WORKERS = int(os.getenv("TESSERACT_POOL_WORKERS", str(max(1, (os.cpu_count() or 2) // _WEB_CONCURRENCY))))
+# forkserver : les workers ne héritent pas des threads / locks du serveur
+TESSERACT_POOL_START_METHOD = os.getenv("TESSERACT_POOL_START_METHOD", "forkserver")
+# Durée max d'un appel OCR (secondes, 0 = sans limite) : au-delà, les processus du pool sont
+# tués et recréés (un tesseract bloqué occuperait sinon un thread OCR pour toujours)
+TESSERACT_TIMEOUT_S = float(os.getenv("TESSERACT_TIMEOUT_S", "60"))
+TESSERACT_LANG = "fra"
+TESSERACT_CONFIG = "--oem 3 --psm 6"
+
+
+# --- Côté worker (processus OCR) ---
+_api = None
+# tesserocr qui n'accepte que des `bytes` (pas de buffer) : copie de l'image à chaque appel
+_api_needs_bytes = False
+
+
+def _init_worker():
+    """Charge Tesseract + traineddata une fois pour toute la vie du processus.
+
+    Avec `tesserocr` (binding de l'API C, dans requirements.txt), le modèle reste en mémoire
+    entre les appels. Sans lui (libtesseract-dev absent à l'installation), on retombe sur
+    pytesseract : un sous-processus `tesseract` par appel, rien n'est gardé chargé.
+    """
+    global _api
+    try:
+        import tesserocr
+
+        _api = tesserocr.PyTessBaseAPI(
+            lang=TESSERACT_LANG, psm=tesserocr.PSM.SINGLE_BLOCK, oem=tesserocr.OEM.DEFAULT
+        )
+    except ImportError:
+        _api = None
+
+
+def _set_image(view: memoryview, width: int, height: int, channels: int):
+    """Passe le buffer partagé tel quel (Tesseract copie l'image dans sa propre Pix)."""
+    global _api_needs_bytes
+    if not _api_needs_bytes:
+        try:
+            _api.SetImageBytes(view, width, height, channels, width * channels)
+            return
+        except TypeError:
+            _api_needs_bytes = True
+            logger.warning("tesserocr n'accepte pas de buffer : copie de l'image à chaque appel")
+    _api.SetImageBytes(view.tobytes(), width, height, channels, width * channels)
+
+
+def _ocr_shared(shm_name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        if _api is not None:
+            height, width = shape[:2]
+            channels = 1 if len(shape) == 2 else shape[2]
+            # Vue relâchée avant shm.close() (sinon BufferError : pointeurs exportés)
+            with shm.buf[:width * height * channels * np.dtype(dtype).itemsize] as view:
+                _set_image(view, width, height, channels)
+            return _api.GetUTF8Text()
+
+        import pytesseract
+
+        img = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        try:
+            return pytesseract.image_to_string(img, lang=TESSERACT_LANG, config=TESSERACT_CONFIG)
+        finally:
+            del img
+    finally:
+        shm.close()
+
+
+def _ping():
+    return os.getpid(), _api is not None
+
+
+# --- Côté serveur ---
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return TESSERACT_POOL_WORKERS > 0
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=TESSERACT_POOL_WORKERS,
+                mp_context=multiprocessing.get_context(TESSERACT_POOL_START_METHOD),
+                initializer=_init_worker,
+            )
+        return _executor
+
+
+def _reset_executor(kill: bool = False):
+    """Abandonne le pool courant ; `kill` : tue aussi ses processus (appel bloqué)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            processes = list((getattr(_executor, "_processes", None) or {}).values()) if kill else []
+            _executor.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.kill()
+        _executor = None
+
+
+def image_to_string(img: np.ndarray) -> str:
+    """OCR d'une image prétraitée dans le pool de processus.
+
+    Le buffer est passé par mémoire partagée (pas de pickling de l'image) ;
+    le bloc est libéré dès que le worker a rendu le texte. Au-delà de TESSERACT_TIMEOUT_S,
+    le pool est recréé et l'appel lève TimeoutError (les OCR en cours dans le même pool
+    échouent aussi, avec BrokenProcessPool).
+    """
+    img = np.ascontiguousarray(img)
+    shm = shared_memory.SharedMemory(create=True, size=max(img.nbytes, 1))
+    try:
+        np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[...] = img
+        future = _get_executor().submit(_ocr_shared, shm.name, img.shape, img.dtype.str)
+        try:
+            return future.result(timeout=TESSERACT_TIMEOUT_S or None)
+        except FutureTimeout:
+            future.cancel()
+            logger.error("OCR Tesseract bloqué depuis %ss : pool recréé", TESSERACT_TIMEOUT_S)
+            _reset_executor(kill=True)
+            raise TimeoutError(f"Tesseract : délai de {TESSERACT_TIMEOUT_S:g}s dépassé")
+        except BrokenProcessPool:
+            # Un worker est mort (OOM, crash Tesseract) : on repart sur un pool neuf
+            logger.error("Pool Tesseract cassé, recréation")
+            _reset_executor()
+            raise
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def warm_up():
+    """Démarre tous les processus (et charge le traineddata) avant la première requête."""
+    if not enabled():
+        return
+    executor = _get_executor()
+    workers = dict(f.result() for f in [executor.submit(_ping) for _ in range(TESSERACT_POOL_WORKERS)])
+    if all(workers.values()):
+        logger.info("Pool Tesseract prêt (%s processus, tesserocr)", len(workers))
+    else:
+        logger.warning(
+            "Pool Tesseract prêt (%s processus) sans tesserocr : un sous-processus tesseract par appel, "
+            "modèle non conservé entre les appels (installer libtesseract-dev puis tesserocr)", len(workers)
+        )
+
+
+def shutdown():
+    _reset_executor()
@@ -0,0 +1,123 @@
+import os
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import executors
+from preprocess import find_characters
+
+
+# --- Configuration ---
+# Détection des zones de texte avant l'OCR : seules ces zones sont OCRisées, en parallèle
+# (0 = image entière, comme avant)
+OCR_TEXT_REGIONS = os.getenv("OCR_TEXT_REGIONS", "0") == "1"
+# Zones couvrant plus que cette part de l'image : rien à gagner, OCR de l'image entière
+OCR_REGIONS_MAX_COVERAGE = float(os.getenv("OCR_REGIONS_MAX_COVERAGE", "0.6"))
+# Nombre max de zones ; au-delà (fond très chargé), OCR de l'image entière
+OCR_MAX_REGIONS = int(os.getenv("OCR_MAX_REGIONS", "24"))
+# Marge autour d'une zone, en hauteurs de caractère (Tesseract lit mal un texte collé au bord)
+OCR_REGION_MARGIN = float(os.getenv("OCR_REGION_MARGIN", "0.6"))
+
+# Un bloc isolé de moins de caractères est ignoré (poussière, logo, bord de caisse)
+_MIN_BLOCK_CHARACTERS = 2
+
+
+@dataclass(frozen=True)
+class Region:
+    """Zone de texte dans l'image d'origine (pixels) et hauteur médiane de ses caractères."""
+    x: int
+    y: int
+    w: int
+    h: int
+    text_height: float
+
+    def crop(self, img: np.ndarray) -> np.ndarray:
+        return img[self.y:self.y + self.h, self.x:self.x + self.w]
+
+
+_enabled = OCR_TEXT_REGIONS
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def configure(enabled: bool):
+    """Active / désactive la détection de zones (benchmarks)."""
+    global _enabled
+    _enabled = enabled
+
+
+def detect(img: np.ndarray) -> List[Region]:
+    """Blocs de texte de l'image, dans l'ordre de lecture ; [] si l'image entière est préférable.
+
+    Les caractères (composantes connexes, comme pour l'estimation de la hauteur de texte)
+    sont regroupés en blocs par une dilatation proportionnelle à leur hauteur : large en
+    horizontal (mots d'une ligne), faible en vertical (lignes d'un même bloc).
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    h, w = gray.shape[:2]
+    characters, f = find_characters(gray)
+    if len(characters) < _MIN_BLOCK_CHARACTERS:
+        return []
+    small = (max(1, round(h * f)), max(1, round(w * f)))
+    mask = np.zeros(small, dtype=np.uint8)
+    for x, y, cw, ch, _ in characters:
+        mask[y:y + ch, x:x + cw] = 255
+    hauteur = float(np.median(characters[:, cv2.CC_STAT_HEIGHT]))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(1, round(hauteur * 1.2)), max(1, round(hauteur * 0.5))))
+    _, labels, blocks, _ = cv2.connectedComponentsWithStats(cv2.dilate(mask, kernel), connectivity=8)
+
+    # Caractères de chaque bloc (par leur centre) : nombre et hauteur médiane
+    centres_x = characters[:, cv2.CC_STAT_LEFT] + characters[:, cv2.CC_STAT_WIDTH] // 2
+    centres_y = characters[:, cv2.CC_STAT_TOP] + characters[:, cv2.CC_STAT_HEIGHT] // 2
+    appartenance = labels[centres_y, centres_x]
+
+    regions = []
+    for label in range(1, len(blocks)):
+        membres = characters[appartenance == label]
+        if len(membres) < _MIN_BLOCK_CHARACTERS:
+            continue
+        text_height = float(np.median(membres[:, cv2.CC_STAT_HEIGHT])) / f
+        marge = OCR_REGION_MARGIN * text_height
+        bx, by, bw, bh = blocks[label, :4] / f
+        x0, y0 = max(0, int(bx - marge)), max(0, int(by - marge))
+        x1, y1 = min(w, int(np.ceil(bx + bw + marge))), min(h, int(np.ceil(by + bh + marge)))
+        regions.append(Region(x0, y0, x1 - x0, y1 - y0, text_height))
+
+    if not regions or len(regions) > OCR_MAX_REGIONS:
+        return []
+    if sum(r.w * r.h for r in regions) > OCR_REGIONS_MAX_COVERAGE * h * w:
+        return []
+    return reading_order(regions)
+
+
+def reading_order(regions: List[Region]) -> List[Region]:
+    """Haut en bas, puis gauche à droite pour les blocs d'une même bande horizontale."""
+    rangees: List[List[Region]] = []
+    for region in sorted(regions, key=lambda r: r.y):
+        centre = region.y + region.h / 2
+        rangee = rangees[-1] if rangees else None
+        if rangee is not None and min(r.y for r in rangee) <= centre <= max(r.y + r.h for r in rangee):
+            rangee.append(region)
+        else:
+            rangees.append([region])
+    return [region for rangee in rangees for region in sorted(rangee, key=lambda r: r.x)]
+
+
+def bounding_box(regions: List[Region]) -> Tuple[int, int, int, int]:
+    """(x, y, largeur, hauteur) englobant toutes les zones."""
+    x0 = min(r.x for r in regions)
+    y0 = min(r.y for r in regions)
+    x1 = max(r.x + r.w for r in regions)
+    y1 = max(r.y + r.h for r in regions)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def ocr_regions(img: np.ndarray, regions: List[Region], ocr: Callable[[np.ndarray, Optional[float]], str]) -> str:
+    """OCR de chaque zone en parallèle (`ocr(crop, text_height)`), textes joints dans l'ordre de lecture."""
+    futures = [executors.submit_region(ocr, region.crop(img), region.text_height) for region in regions]
+    texts = [future.result().strip() for future in futures]
+    return "\n".join(t for t in texts if t)
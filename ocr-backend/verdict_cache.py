@@ -0,0 +1,92 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import unicodedata
+from contextlib import closing
+from typing import Any, Dict, Optional
+
+from result_cache import ResultCache
+
+
+logger = logging.getLogger("ocr-backend")
+
+# --- Configuration ---
+# Verdicts REGLEMENTAIRE / NON REGLEMENTAIRE des contrôles LLM (vide = pas de tier disque)
+VERDICT_CACHE_DB = os.getenv("VERDICT_CACHE_DB", "Data/verdict_cache.db")
+VERDICT_CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", str(30 * 24 * 3600)))  # secondes
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "20000"))  # 0 = cache désactivé
+
+
+def normaliser_valeur(valeur) -> str:
+    """Casse, accents et espaces ignorés ; la ponctuation est gardée (calibres "70/80")."""
+    if valeur is None:
+        return ""
+    texte = unicodedata.normalize("NFKD", str(valeur))
+    texte = "".join(c for c in texte if not unicodedata.combining(c))
+    return " ".join(texte.casefold().split())
+
+
+def cle(check: str, regle_id, regles, valeur) -> str:
+    """Clé = contrôle + ID de règle + hash des lignes de règles + valeur produit normalisée.
+
+    Le hash porte sur la représentation envoyée dans le prompt : si les règles changent,
+    la clé change même sans invalidation explicite.
+    """
+    hash_regles = hashlib.sha256(repr(list(regles)).encode("utf-8")).hexdigest()[:16]
+    return f"{check}:{regle_id}:{hash_regles}:{normaliser_valeur(valeur)}"
+
+
+class VerdictCache:
+    def __init__(self, max_size: int = VERDICT_CACHE_SIZE, ttl: float = VERDICT_CACHE_TTL, db_path: str = VERDICT_CACHE_DB):
+        self.db_path = db_path
+        self._cache = ResultCache(max_size=max_size, ttl=ttl, db_path=db_path, table="verdicts")
+        self._lock = threading.Lock()
+        # Hash du classeur pour lequel le tier mémoire de CE processus est valide
+        self._applied_hash: Optional[str] = None
+
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    def put(self, key: str, verdict: str):
+        self._cache.put(key, verdict)
+
+    def invalidate(self):
+        """Oublie tous les verdicts (mémoire + disque)."""
+        self._cache.clear()
+        logger.info("Cache des verdicts vidé")
+
+    def sync_reference(self, source_hash: str):
+        """Vide les verdicts obtenus avec une autre version du classeur de référence.
+
+        Tier mémoire : chaque processus compare au dernier hash qu'il a lui-même appliqué
+        (le premier worker gunicorn qui voit le nouveau classeur met à jour le hash SQLite ;
+        les autres doivent quand même vider leur mémoire). Tier SQLite : comparé au hash stocké.
+        """
+        if not source_hash:
+            return
+        with self._lock:
+            precedent, self._applied_hash = self._applied_hash, source_hash
+        if precedent is not None and precedent != source_hash:
+            self._cache.clear_memory()
+            logger.info("Classeur de référence modifié : verdicts en mémoire vidés")
+        if not self.db_path:
+            return
+        with self._lock, closing(sqlite3.connect(self.db_path, timeout=5)) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS verdicts_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            row = conn.execute("SELECT value FROM verdicts_meta WHERE key = 'source_hash'").fetchone()
+            if row is not None and row[0] == source_hash:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO verdicts_meta (key, value) VALUES ('source_hash', ?)", (source_hash,)
+            )
+        if row is not None:
+            logger.info("Classeur de référence modifié : invalidation des verdicts")
+            self.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+verdict_cache = VerdictCache()
@@ -1,39 +1,106 @@
-import pandas as pd
-import openai
 import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
 from dotenv import load_dotenv
 
+import executors
+import famille_matcher
+import llm_client
+import metrics
+import verdict_cache
+from reference_index import COLONNES_REGLEMENTAIRES, EXCEL_FILE, load_reference_index, renseigne
+
 load_dotenv()
 
 
-# --- Configuration ---
-excel_file = 'Data/source_sans_doublons.xlsx'
-filtre_dest = 'BASE LOGISTIQUE'
+# Temps max d'un contrôle faisant un appel LLM (traitement), compté depuis son démarrage dans
+# le pool, avant d'être compté en erreur
+VERIF_CHECK_TIMEOUT = float(os.getenv("VERIF_CHECK_TIMEOUT", "60"))
+
+
+# --- Chargement du classeur de référence ---
+# Lu une seule fois et indexé : les vérifications ne font plus que des accès dict / set.
+# Chargé depuis le snapshot binaire tant que le classeur n'a pas changé, au premier appel
+# (ou par le warm-up au démarrage du serveur), pas à l'import du module.
+_reference = None
+_reference_lock = threading.Lock()
+
+
+def preparer_reference(reference):
+    """Prépare ce qui dépend d'une version de la référence (matcher, cache des verdicts)."""
+    famille_matcher.matcher_for(reference)
+    verdict_cache.verdict_cache.sync_reference(reference.source_hash)
+    return reference
 
-# --- Chargement des feuilles de référence ---
-df_pays = pd.read_excel(excel_file, sheet_name='Pays')
-df_calibre = pd.read_excel(excel_file, sheet_name='Calibre')
-df_categorie = pd.read_excel(excel_file, sheet_name='Catégorie')
-df_traitement = pd.read_excel(excel_file, sheet_name='Traitement')
-df_mentions = pd.read_excel(excel_file, sheet_name='Mentions')
 
-# --- Chargement et Filtrage (Normalisation_occurrences) ---
-df_norm_occ = pd.read_excel(excel_file, sheet_name='Normalisation_occurrences')
-# Nettoyage des espaces et filtrage
-df_norm_occ['DESTINATION'] = df_norm_occ['DESTINATION'].astype(str).str.strip()
-df_norm_occ = df_norm_occ[df_norm_occ['DESTINATION'] == filtre_dest].copy()
-# Nettoyage de la colonne FAMILLE pour éviter les doublons d'espaces
-df_norm_occ['FAMILLE'] = df_norm_occ['FAMILLE'].astype(str).str.strip()
+def get_reference():
+    global _reference
+    if _reference is None:
+        with _reference_lock:
+            if _reference is None:
+                _reference = preparer_reference(load_reference_index(EXCEL_FILE))
+    return _reference
 
 
-# Formatage du résultat pour utilisation directe dans votre code
+def set_reference(reference):
+    """Remplace l'index (swap atomique) : les vérifications en cours gardent le leur."""
+    global _reference
+    with _reference_lock:
+        _reference = reference
 
 
 
 # --- CONFIGURATION API ---
-api_key = os.getenv('OPENAI_API_KEY')
-client = openai.OpenAI(api_key=api_key)
+# Client OpenAI partagé (keep-alive, timeouts, retries) : voir llm_client.py
+
+
+
+class LookupMemo:
+    """Mémo des recherches de référence partagé entre les étiquettes d'un même lot.
+
+    Les étiquettes d'une palette résolvent en général vers la même famille / sous-famille :
+    la résolution (appel LLM) et le filtrage des règles ne sont faits qu'une fois par clé,
+    y compris quand plusieurs threads demandent la même clé en même temps.
+    """
 
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._key_locks = {}
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._values:
+                    return self._values[key]
+            value = compute()
+            with self._lock:
+                self._values[key] = value
+            return value
+
+
+def _memoized(memo, key, compute):
+    if memo is None:
+        return compute()
+    return memo.get_or_compute(key, compute)
+
+
+def _cle_produit(info):
+    return tuple(str(info.get(k) or "").strip().lower() for k in ("product_name", "variety"))
+
+
+def resoudre_famille_sous_famille(info, ref):
+    """Match local (exact / quasi exact) d'abord ; LLM seulement si le match n'est pas sûr,
+    avec la shortlist des combinaisons les plus proches au lieu de la liste complète."""
+    match = famille_matcher.matcher_for(ref).resoudre(info.get('product_name'), info.get('variety'))
+    if match.confiant:
+        return match.famille, match.sous_famille
+    return determiner_famille_sous_famille(info, match.shortlist or ref.familles)
 
 
 # --- Fonction principale ---
@@ -69,7 +136,8 @@ def determiner_famille_sous_famille(info, dictionnaire):
     """
     
     try:
-        response = client.chat.completions.create(
+        response = llm_client.chat_completion(
+            "verif_famille",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Tu es un assistant qui répond uniquement par des IDs numériques."},
@@ -91,6 +159,7 @@ def determiner_famille_sous_famille(info, dictionnaire):
         
     except Exception as e:
         print(f"Erreur lors de l'appel API : {e}")
+        llm_client.note_degraded("verif_famille")
         return None, None
 
 
@@ -102,31 +171,60 @@ def determiner_famille_sous_famille(info, dictionnaire):
 #     (df_norm_occ['SOUS-FAMILLE'] == resultat_sous_famille)
 # ]
 
-def champs_reglementaires_excel(df_norm_occ_filtree):
-    # Liste des colonnes à tester
-    colonnes_a_tester = [
-        "Couleur",
-        "CODE CALIBRE",
-        "CODE CATEGORIE",
-        "CODE TRAITEMENT CHIMIQUE",
-        "MENTIONS complementaires"
-    ]
-
+def champs_reglementaires_excel(regle):
+    # `regle` : première ligne de Normalisation_occurrences pour la famille / sous-famille
     colonnes_reglementaires = []
 
-    if not df_norm_occ_filtree.empty:
-        # On prend la première ligne correspondante
-        ligne = df_norm_occ_filtree.iloc[0]
-        for col in colonnes_a_tester:
-            if col in df_norm_occ_filtree.columns:
-                valeur = ligne[col]
-                if pd.notna(valeur) and str(valeur).strip() != "":
-        
-                    colonnes_reglementaires.append(col)
+    if regle:
+        for col in COLONNES_REGLEMENTAIRES:
+            if col in regle and renseigne(regle[col]):
+                colonnes_reglementaires.append(col)
     return colonnes_reglementaires
 
 
-def calibre_reglemntaire(product_info,df_calibre,df_norm_occ_filtree):
+def _verdict_llm(operation, prompt, cle, sujet):
+    """Question REGLEMENTAIRE / NON REGLEMENTAIRE au LLM, avec cache persistant des verdicts.
+
+    Seules les réponses valides sont mises en cache (pas les erreurs API ni les réponses inattendues).
+    """
+    verdict = verdict_cache.verdict_cache.get(cle)
+    if verdict is not None:
+        return verdict
+
+    try:
+        response = llm_client.chat_completion(
+            operation,
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Tu es un assistant qui répond uniquement par REGLEMENTAIRE ou NON REGLEMENTAIRE."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0
+        )
+
+        resultat = response.choices[0].message.content.strip().upper()
+
+        if resultat in ["REGLEMENTAIRE", "NON REGLEMENTAIRE"]:
+            verdict_cache.verdict_cache.put(cle, resultat)
+            return resultat
+        else:
+            print("Réponse inattendue :", resultat)
+            llm_client.note_degraded(operation)
+            return "NON REGLEMENTAIRE"
+
+    except Exception as e:
+        print(f"Erreur lors de l'appel API {sujet} : {e}")
+        llm_client.note_degraded(operation)
+        return "NON REGLEMENTAIRE"
+
+
+def calibre_reglemntaire(product_info, ref, regle):
     Erreur = []
     
     calibre = product_info.get("calibre")
@@ -140,14 +238,14 @@ def calibre_reglemntaire(product_info,df_calibre,df_norm_occ_filtree):
         return Erreur.append("Calibre manquant")
     
 
-def verif_calibre(product_info, df_calibre_filtre):
+def verif_calibre(product_info, regles_calibre):
 
     # Sécurité : si pas de règles calibre
-    if df_calibre_filtre is None or df_calibre_filtre.empty:
+    if not regles_calibre:
         return "NON REGLEMENTAIRE"
 
-    # Transformation du dataframe en texte lisible pour le prompt
-    regles_calibre = df_calibre_filtre.to_dict(orient="records")
+    # Lignes de règles (records) en texte lisible pour le prompt
+    regles_calibre = list(regles_calibre)
 
     prompt = f"""
 Tu es un expert en réglementation des fruits et légumes.
@@ -167,54 +265,26 @@ ou
 NON REGLEMENTAIRE
 """
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Tu es un assistant qui répond uniquement par REGLEMENTAIRE ou NON REGLEMENTAIRE."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0
-        )
-
-        resultat = response.choices[0].message.content.strip().upper()
-
-        if resultat in ["REGLEMENTAIRE", "NON REGLEMENTAIRE"]:
-            return resultat
-        else:
-            print("Réponse inattendue :", resultat)
-            return "NON REGLEMENTAIRE"
-
-    except Exception as e:
-        print(f"Erreur lors de l'appel API calibre : {e}")
-        return "NON REGLEMENTAIRE"
+    cle = verdict_cache.cle("verif_calibre", regles_calibre[0].get('ID Calibre'), regles_calibre, product_info.get('calibre'))
+    return _verdict_llm("verif_calibre", prompt, cle, "calibre")
 
 
 
 # i = calibre_reglemntaire(product_info,colonnes_reglementaires,df_calibre,df_norm_occ_filtree)
 # print("Résultat final de la vérification du calibre :", i)
 
-def traitement_reglemntaire(product_info,df_traitement,df_norm_occ_filtree):
+def traitement_reglemntaire(product_info, ref, regle):
     Erreur = []
 
-    # Récupérer la valeur de la colonne "CODE CALIBRE"
-    if not df_norm_occ_filtree.empty:
-        code_traitement = df_norm_occ_filtree['CODE TRAITEMENT CHIMIQUE'].iloc[0]
+    # Récupérer la valeur de la colonne "CODE TRAITEMENT CHIMIQUE"
+    if regle:
+        code_traitement = regle.get('CODE TRAITEMENT CHIMIQUE')
         
         # Vérifier que code_traitement n'est pas vide
-        if pd.notna(code_traitement) and str(code_traitement).strip() != "":
-            # Filtrer df_traitement
-            df_traitement_filtre = df_traitement[
-                df_traitement['ID Traitement'] == code_traitement
-            ]
-            if not df_traitement_filtre.empty:
-                resultat_traitement = verif_traitement(product_info, df_traitement_filtre)
+        if renseigne(code_traitement):
+            regles_traitement = ref.traitements.get(code_traitement)
+            if regles_traitement:
+                resultat_traitement = verif_traitement(product_info, regles_traitement)
                 #print("Résultat vérification traitement :", resultat_traitement)
                 if resultat_traitement == "REGLEMENTAIRE":
                     return []
@@ -238,14 +308,14 @@ def traitement_reglemntaire(product_info,df_traitement,df_norm_occ_filtree):
         return Erreur
     
 
-def verif_traitement(product_info, df_traitement_filtre):
+def verif_traitement(product_info, regles_traitement):
 
     # Sécurité : si pas de règles de traitement
-    if df_traitement_filtre is None or df_traitement_filtre.empty:
+    if not regles_traitement:
         return "NON REGLEMENTAIRE"
 
-    # Transformation du dataframe en texte lisible pour le prompt
-    regles_traitement = df_traitement_filtre.to_dict(orient="records")
+    # Lignes de règles (records) en texte lisible pour le prompt
+    regles_traitement = list(regles_traitement)
 
     prompt = f"""
 Tu es un moteur de validation STRICT.
@@ -271,51 +341,23 @@ NON REGLEMENTAIRE
 """
 
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Tu es un assistant qui répond uniquement par REGLEMENTAIRE ou NON REGLEMENTAIRE."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0
-        )
+    cle = verdict_cache.cle("verif_traitement", regles_traitement[0].get('ID Traitement'), regles_traitement, product_info.get('post_product_treatement'))
+    return _verdict_llm("verif_traitement", prompt, cle, "traitement chimique")
 
-        resultat = response.choices[0].message.content.strip().upper()
 
-        if resultat in ["REGLEMENTAIRE", "NON REGLEMENTAIRE"]:
-            return resultat
-        else:
-            print("Réponse inattendue :", resultat)
-            return "NON REGLEMENTAIRE"
-
-    except Exception as e:
-        print(f"Erreur lors de l'appel API traitement chimique : {e}")
-        return "NON REGLEMENTAIRE"
 
-
-
-def mentions_reglementaire(product_info,df_mentions,df_norm_occ_filtree):
+def mentions_reglementaire(product_info, ref, regle):
     Erreur = []
 
-    # Récupérer la valeur de la colonne "CODE CALIBRE"
-    if not df_norm_occ_filtree.empty:
-        code_mention = df_norm_occ_filtree['MENTIONS complementaires'].iloc[0]
+    # Récupérer la valeur de la colonne "MENTIONS complementaires"
+    if regle:
+        code_mention = regle.get('MENTIONS complementaires')
         
         # Vérifier que code_mention n'est pas vide
-        if pd.notna(code_mention) and str(code_mention).strip() != "":
-            # Filtrer df_mentions
-            df_mentions_filtre = df_mentions[
-                df_mentions['ID mentions'] == code_mention
-            ]
-            if not df_mentions_filtre.empty:
-                resultat_mentions = verif_mentions(product_info, df_mentions_filtre)
+        if renseigne(code_mention):
+            regles_mentions = ref.mentions.get(code_mention)
+            if regles_mentions:
+                resultat_mentions = verif_mentions(product_info, regles_mentions)
                 if resultat_mentions == "REGLEMENTAIRE":
                     return []
                 else :
@@ -335,14 +377,14 @@ def mentions_reglementaire(product_info,df_mentions,df_norm_occ_filtree):
         return Erreur
     
 
-def verif_mentions(product_info, df_mentions_filtre):
+def verif_mentions(product_info, regles_mentions):
 
     # Sécurité : si pas de règles de mentions
-    if df_mentions_filtre is None or df_mentions_filtre.empty:
+    if not regles_mentions:
         return "NON REGLEMENTAIRE"
 
-    # Transformation du dataframe en texte lisible pour le prompt
-    regles_mentions = df_mentions_filtre.to_dict(orient="records")
+    # Lignes de règles (records) en texte lisible pour le prompt
+    regles_mentions = list(regles_mentions)
 
     prompt = f"""
 Tu es un expert en réglementation des fruits et légumes.
@@ -363,52 +405,24 @@ ou
 NON REGLEMENTAIRE
 """
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Tu es un assistant qui répond uniquement par REGLEMENTAIRE ou NON REGLEMENTAIRE."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0
-        )
-
-        resultat = response.choices[0].message.content.strip().upper()
+    cle = verdict_cache.cle("verif_mentions", regles_mentions[0].get('ID mentions'), regles_mentions, product_info.get('additionals_informations'))
+    return _verdict_llm("verif_mentions", prompt, cle, "mentions")
 
-        if resultat in ["REGLEMENTAIRE", "NON REGLEMENTAIRE"]:
-            return resultat
-        else:
-            print("Réponse inattendue :", resultat)
-            return "NON REGLEMENTAIRE"
 
-    except Exception as e:
-        print(f"Erreur lors de l'appel API mentions : {e}")
-        return "NON REGLEMENTAIRE"
-
-
-def categorie_reglementaire(product_info, df_categorie, df_norm_occ_filtree):
+def categorie_reglementaire(product_info, ref, regle):
     Erreur = []
 
     # Récupérer la valeur de la colonne "CODE CATEGORIE"
-    if not df_norm_occ_filtree.empty:
-        code_categorie = df_norm_occ_filtree['CODE CATEGORIE'].iloc[0]
+    if regle:
+        code_categorie = regle.get('CODE CATEGORIE')
         #print("Code catégorie :", code_categorie)
 
         # Vérifier que code_categorie n'est pas vide
-        if pd.notna(code_categorie) and str(code_categorie).strip() != "":
-            # Filtrer df_categorie
-            df_categorie_filtre = df_categorie[
-                df_categorie['ID categorie'] == code_categorie
-            ]
-
-            if not df_categorie_filtre.empty:
-                resultat_categorie = verif_categorie(product_info, df_categorie_filtre)
+        if renseigne(code_categorie):
+            codes_categorie = ref.categories.get(code_categorie)
+
+            if codes_categorie is not None:
+                resultat_categorie = verif_categorie(product_info, codes_categorie)
                 #print("Résultat vérification catégorie :", resultat_categorie)
 
                 if resultat_categorie == "REGLEMENTAIRE":
@@ -432,13 +446,11 @@ def categorie_reglementaire(product_info, df_categorie, df_norm_occ_filtree):
         return Erreur
 
 
-def verif_categorie(product_info, df_categorie_filtre):
-    # Création du dictionnaire pour Catégorie
-    categorie_unique = df_categorie_filtre['Code Categorie'].dropna().unique()
-    dict_categorie = {i: valeur for i, valeur in enumerate(categorie_unique)}
+def verif_categorie(product_info, codes_categorie):
+    # `codes_categorie` : codes autorisés, déjà en minuscules dans l'index
     categorie = product_info["category"]
 
-    if categorie.lower() in [valeur.lower() for valeur in dict_categorie.values()]:
+    if categorie.lower() in codes_categorie:
         return "REGLEMENTAIRE"
     else:
         return "NON REGLEMENTAIRE"
@@ -448,7 +460,7 @@ def verif_categorie(product_info, df_categorie_filtre):
 # Identité de l’emballeur/expéditeur 
 
 
-def identite_emballeur_reglementaire(product_info,df_pays):
+def identite_emballeur_reglementaire(product_info, ref):
     Erreur = []
     # Récupération des informations nécessaires
     nom_adresse = product_info.get("packer_name_address")
@@ -464,7 +476,7 @@ def identite_emballeur_reglementaire(product_info,df_pays):
 
         # Vérification du code ISO
         if iso_code :
-            statut_iso = verif_code_iso(iso_code, df_pays)
+            statut_iso = verif_code_iso(iso_code, ref)
             #print(f"Statut du code ISO ({iso_code}) : {statut_iso}")
             if statut_iso == "NON REGLEMENTAIRE":
                 Erreur.append("Code ISO emballeur non réglementaire")
@@ -478,19 +490,16 @@ def identite_emballeur_reglementaire(product_info,df_pays):
 
     
 
-def verif_code_iso(code_iso,df_pays):
+def verif_code_iso(code_iso, ref):
 
-    # Extraction des valeurs uniques et suppression des doublons/NaN pour chaque colonne
-    iso_num_unique = df_pays['Code ISO Numérique'].dropna().unique()
-    iso_2_unique = df_pays['Code ISO 2'].dropna().unique()
-    iso_3_unique = df_pays['Code ISO 3'].dropna().unique()
-
-    # Création des 3 dictionnaires (Index : Valeur)
-    dict_iso_num = {i: valeur for i, valeur in enumerate(iso_num_unique)}
-    dict_iso_2 = {i: valeur for i, valeur in enumerate(iso_2_unique)}
-    dict_iso_3 = {i: valeur for i, valeur in enumerate(iso_3_unique)}
+    # Codes ISO numériques, ISO 2 et ISO 3 réunis dans un seul ensemble
+    try:
+        connu = code_iso in ref.codes_iso
+    except TypeError:
+        # Valeur non hashable renvoyée par le parser (liste, dict...)
+        connu = False
 
-    if code_iso in dict_iso_num.values() or code_iso in dict_iso_2.values() or code_iso in dict_iso_3.values():
+    if connu:
         return "REGLEMENTAIRE"
     else:
         return "NON REGLEMENTAIRE"
@@ -540,14 +549,74 @@ def origine_reglementaire(product_info):
         return Erreur
 
 
-def verif(product_info):  #df_norm_occ,df_calibre,df_categorie,df_pays
+class _ControleLLM:
+    """Contrôle soumis au pool : son délai part du démarrage effectif dans un thread du pool,
+    pas de la soumission (l'attente en file sous charge ne compte pas comme un dépassement)."""
+
+    def __init__(self, libelle, fonction):
+        self.fonction = metrics.timed(f"verif_{metrics.stage_name(libelle)}", fonction)
+        self.demarre = threading.Event()
+        self.debut = None
+        self.future = executors.submit_check(self)
+        # Réveille aussi l'attente si le contrôle est annulé avant d'avoir démarré (arrêt du serveur)
+        self.future.add_done_callback(lambda _: self.demarre.set())
+
+    def __call__(self):
+        self.debut = time.monotonic()
+        self.demarre.set()
+        return self.fonction()
 
-    global df_norm_occ
-    global df_calibre
-    global df_categorie
-    global df_pays
+    def result(self, timeout):
+        self.demarre.wait()
+        if self.debut is None:
+            # Annulé avant d'avoir démarré
+            return self.future.result()
+        return self.future.result(timeout=max(0.0, self.debut + timeout - time.monotonic()))
 
 
+def executer_controles(controles, timeout=VERIF_CHECK_TIMEOUT):
+    """Exécute les contrôles `(libellé, fonction | erreurs[, appel_llm])`.
+
+    Seuls les contrôles marqués `appel_llm` (attente réseau) partent dans le pool dédié, en
+    parallèle ; les contrôles locaux (accès à l'index) s'exécutent dans le thread appelant
+    pendant ce temps, sans saut de thread. Les erreurs sont concaténées dans l'ordre de la
+    liste, quel que soit l'ordre de fin. Un contrôle LLM qui dépasse `timeout` (compté depuis
+    son démarrage) est compté en erreur (le thread, lui, finit son appel, borné par OPENAI_TIMEOUT).
+    """
+    # Contrôles LLM soumis d'abord, puis contrôles locaux exécutés ici pendant leur attente
+    en_cours = []
+    for libelle, controle, *options in controles:
+        appel_llm = bool(options and options[0])
+        en_cours.append((libelle, _ControleLLM(libelle, controle) if callable(controle) and appel_llm else controle))
+    en_cours = [
+        (libelle, metrics.timed(f"verif_{metrics.stage_name(libelle)}", resultat)() or [])
+        if callable(resultat) and not isinstance(resultat, _ControleLLM) else (libelle, resultat)
+        for libelle, resultat in en_cours
+    ]
+
+    Erreur = []
+    for libelle, resultat in en_cours:
+        if isinstance(resultat, _ControleLLM):
+            try:
+                Erreur.extend(resultat.result(timeout) or [])
+            except FutureTimeout:
+                print(f"Contrôle {libelle} : délai de {timeout}s dépassé")
+                Erreur.append(f"{libelle} : délai de vérification dépassé")
+        else:
+            Erreur.extend(resultat)
+    return Erreur
+
+
+def verif(product_info, memo=None):
+    """Vérifie la conformité d'une étiquette et retourne la liste des erreurs.
+
+    `memo` (LookupMemo, optionnel) partage la résolution famille / sous-famille
+    entre plusieurs appels (scan par lot).
+    """
+
+    # Index de référence lu une fois pour toute la vérification
+    ref = get_reference()
+
     Erreur = []
 
     # Mention « destiné à la transformation » ou « au don »
@@ -564,27 +633,18 @@ def verif(product_info):  #df_norm_occ,df_calibre,df_categorie,df_pays
     # Vérification de l'origine
     Erreur.extend(origine_reglementaire(product_info) or [])
 
-    # Matching Famille et Sous-Famille avec le Excel
-    # Création du dataframe filtré sans doublons pour FAMILLE et SOUS-FAMILLE
-    df_norm_occ_filtree_1 = (
-        df_norm_occ[["FAMILLE", "SOUS-FAMILLE"]]
-        .drop_duplicates()
-        .reset_index(drop=True)
+    # Matching Famille et Sous-Famille avec le Excel (dictionnaire ID : "FAMILLE | SOUS-FAMILLE")
+    resultat_famille, resultat_sous_famille = _memoized(
+        memo,
+        ("famille",) + _cle_produit(product_info),
+        metrics.timed("verif_famille", lambda: resoudre_famille_sous_famille(product_info, ref)),
     )
 
-    # Création du dictionnaire ID : "FAMILLE | SOUS-FAMILLE"
-    dict_famille = {i+1: f"{row.FAMILLE} | {row['SOUS-FAMILLE']}" for i, row in df_norm_occ_filtree_1.iterrows()}
-
-    resultat_famille, resultat_sous_famille = determiner_famille_sous_famille(product_info, dict_famille)
-
-    # Filtrer df_norm_occ pour la famille et sous-famille identifiées
-    df_norm_occ_filtree = df_norm_occ[
-    (df_norm_occ["FAMILLE"].astype(str).str.strip() == resultat_famille.strip()) &
-    (df_norm_occ["SOUS-FAMILLE"].astype(str).str.strip() == resultat_sous_famille.strip())
-    ]
+    # Règles de la famille et sous-famille identifiées (None si non trouvée)
+    regle = ref.regle_famille(resultat_famille, resultat_sous_famille)
 
     # Trouver champs réglementaires dans le excel
-    colonnes_reglementaires = champs_reglementaires_excel(df_norm_occ_filtree)
+    colonnes_reglementaires = champs_reglementaires_excel(regle)
     
     
 
@@ -596,35 +656,41 @@ def verif(product_info):  #df_norm_occ,df_calibre,df_categorie,df_pays
     Mentions = product_info.get("additionals_informations")
 
 
+    # Contrôles indépendants une fois la famille connue, erreurs rendues dans cet ordre.
+    # Seul le traitement attend un appel LLM (pool dédié) ; les autres sont des accès à l'index
+    controles = []
+
     if colonnes_reglementaires:
         # Vérification calibre
         if Calibre is not None and Calibre != "":
             if "CODE CALIBRE" in colonnes_reglementaires:
-                Erreur.extend(calibre_reglemntaire(product_info,df_calibre,df_norm_occ_filtree) or [])
+                controles.append(("Calibre", lambda: calibre_reglemntaire(product_info, ref, regle)))
         else:
-            Erreur.append("Calibre manquant ou vide")
+            controles.append(("Calibre", ["Calibre manquant ou vide"]))
 
         # Vérification traitement chimique
         if Traitement is not None and Traitement != "":
             if "CODE TRAITEMENT CHIMIQUE" in colonnes_reglementaires:
-                Erreur.extend(traitement_reglemntaire(product_info,df_traitement,df_norm_occ_filtree) or [])
+                controles.append(("Traitement", lambda: traitement_reglemntaire(product_info, ref, regle), True))
         
         # Vérification mentions
         # if Mentions is not None and Mentions != "":
         #     if "MENTIONS complementaires" in colonnes_reglementaires:
-        #         Erreur.extend(mentions_reglementaire(product_info,df_mentions,df_norm_occ_filtree) or [])
+        #         controles.append(("Mentions", lambda: mentions_reglementaire(product_info, ref, regle), True))
 
 
         # Vérification catégorie
         if Categorie is not None and Categorie != "":
             if "CODE CATEGORIE" in colonnes_reglementaires:
-                Erreur.extend(categorie_reglementaire(product_info,df_categorie,df_norm_occ_filtree) or [])
+                controles.append(("Catégorie", lambda: categorie_reglementaire(product_info, ref, regle)))
         else:
-            Erreur.append("Catégorie manquante ou vide")
+            controles.append(("Catégorie", ["Catégorie manquante ou vide"]))
 
 
     # Vérification identité emballeur/expéditeur
-    Erreur.extend(identite_emballeur_reglementaire(product_info,df_pays) or [])
+    controles.append(("Emballeur", lambda: identite_emballeur_reglementaire(product_info, ref)))
+
+    Erreur.extend(executer_controles(controles))
 
 
     # Vérification traçabilité